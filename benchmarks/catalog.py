@@ -0,0 +1,68 @@
+"""
+Memory and build time of a `CoinCatalog` against the list of `CoinMarket` dicts it replaces.
+
+Run from the repository root:
+
+    $ python -m benchmarks.catalog --coins 13000
+"""
+import argparse
+import gc
+import pickle
+import random
+import time
+import tracemalloc
+from typing import Dict, List
+
+from lib.catalog import CoinCatalog
+
+from .tokenizer import make_coins
+
+
+def make_markets(count: int) -> List[Dict]:
+    """
+    Synthetic coins with every field of a `coins/markets` response.
+    """
+    random.seed(0)
+    coins = make_coins(count)
+    for rank, coin in enumerate(coins, 1):
+        coin.update({
+            "image": f"https://assets.coingecko.com/coins/images/{rank}/large/{coin['symbol']}.png",
+            "current_price": random.random() * 100, "market_cap_rank": rank,
+            "fully_diluted_valuation": random.randint(0, 10 ** 10), "total_volume": random.random() * 10 ** 8,
+            "high_24h": random.random(), "low_24h": random.random(), "price_change_24h": random.random(),
+            "price_change_percentage_24h": random.random(), "market_cap_change_24h": random.random(),
+            "market_cap_change_percentage_24h": random.random(), "circulating_supply": random.random() * 10 ** 9,
+            "total_supply": random.random() * 10 ** 9, "max_supply": None, "ath": random.random(),
+            "ath_change_percentage": random.random(), "ath_date": "2021-11-10T14:24:11.849Z",
+            "atl": random.random(), "atl_change_percentage": random.random(), "atl_date": "2013-07-06T00:00:00.000Z",
+            "roi": None, "last_updated": "2024-01-01T00:00:00.000Z",
+        })
+    return coins
+
+
+def measure(name: str, raw: bytes, build):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    coins = build(pickle.loads(raw))
+    elapsed = time.perf_counter() - start
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f"{name:<28} {size / 2 ** 20:7.1f} MiB {elapsed:7.3f}s")
+    return coins
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the memory footprint of CoinCatalog.")
+    parser.add_argument("--coins", type=int, default=13000, help="Number of synthetic coins.")
+    args = parser.parse_args()
+
+    raw = pickle.dumps(make_markets(args.coins))
+    coins = measure("list of dicts", raw, lambda coins: coins)
+    measure("CoinCatalog keep_full=False", raw, lambda coins: CoinCatalog(coins, keep_full=False))
+    catalog = measure("CoinCatalog", raw, CoinCatalog)
+    assert catalog == coins, "CoinCatalog records differ"
+
+
+if __name__ == "__main__":
+    main()
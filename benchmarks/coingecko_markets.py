@@ -0,0 +1,92 @@
+"""
+Wall-clock benchmark of `get_cg_coins_markets` against a local CoinGecko stub server.
+
+Run from the repository root:
+
+    $ python -m benchmarks.coingecko_markets --latency 0.2 --coins 13000
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from pycoingecko import CoinGeckoAPI
+
+from lib.coingecko import configure_session, get_cg_coins_markets
+
+
+def make_handler(total_coins: int, latency: float, rate_limit_every: int):
+    requests_served = [0]
+    counter_lock = threading.Lock()
+
+    class CoinGeckoStubHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if not url.path.endswith("/coins/markets"):
+                self.send_error(404)
+                return
+            with counter_lock:
+                requests_served[0] += 1
+                rate_limited = rate_limit_every and requests_served[0] % rate_limit_every == 0
+            time.sleep(latency)
+            if rate_limited:
+                self.send_response(429)
+                self.send_header("Retry-After", "0")
+                self.end_headers()
+                return
+            query = parse_qs(url.query)
+            per_page = int(query.get("per_page", ["100"])[0])
+            page = int(query.get("page", ["1"])[0])
+            first = (page - 1) * per_page
+            coins = [{
+                "id": f"coin-{i}",
+                "symbol": f"c{i}",
+                "name": f"Coin {i}",
+                "market_cap": total_coins - i,
+            } for i in range(first, min(first + per_page, total_coins))]
+            body = json.dumps(coins).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return CoinGeckoStubHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark get_cg_coins_markets against a local stub server.")
+    parser.add_argument("--coins", type=int, default=13000, help="Number of coins the stub server knows.")
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds the stub server waits per request.")
+    parser.add_argument("--rate-limit-every", type=int, default=0,
+                        help="Answer every Nth request with HTTP 429 (0 disables).")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--limits", type=int, nargs="+", default=[1000, 5000])
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0),
+                                 make_handler(args.coins, args.latency, args.rate_limit_every))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    api = CoinGeckoAPI()
+    api.api_base_url = f"http://127.0.0.1:{server.server_address[1]}/api/v3/"
+    configure_session(api, pool_size=max(args.workers))
+
+    try:
+        for limit in args.limits:
+            for workers in args.workers:
+                start = time.perf_counter()
+                coins = get_cg_coins_markets(limit=limit, api=api, workers=workers)
+                elapsed = time.perf_counter() - start
+                print(f"limit={limit:<6} workers={workers:<3} coins={len(coins):<6} {elapsed:.3f}s")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
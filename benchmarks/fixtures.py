@@ -0,0 +1,170 @@
+"""
+Recorded Reddit comment trees and CoinGecko responses for the benchmark suite, and their replay.
+
+A comment fixture is a gzipped JSON object:
+
+    {
+        "submission": {"id": "abc123", "comment_sort": "confidence"},
+        "top_level": ["c1", "m1", ...],
+        "records": {
+            "c1": {"kind": "t1", "id": "c1", "body": "...", "author": "...", "edited": false},
+            "m1": {"kind": "more", "id": "m1", "parent_id": "t3_abc123", "count": 2, "children": ["c2", "m2"]}
+        }
+    }
+
+`top_level` is what `submission.comments.list()` returns. Expanding a `more` record returns its children,
+which may contain further `more` records. A CoinGecko fixture holds the pages of `/coins/markets`.
+"""
+import gzip
+import json
+import os
+import random
+from typing import Any, Dict, Iterator, List, Optional
+
+from praw import Reddit
+from praw.models import Submission
+from praw.models.comment_forest import CommentForest
+
+from .tokenizer import make_coins
+
+fixtures_dir = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def fixture_path(name: str) -> str:
+    return os.path.join(fixtures_dir, f"{name}.json.gz")
+
+
+def save_fixture(name: str, data: Any):
+    os.makedirs(fixtures_dir, exist_ok=True)
+    with gzip.open(fixture_path(name), "wt", encoding="utf-8") as f:
+        json.dump(data, f)
+
+
+def load_fixture(name: str) -> Any:
+    with gzip.open(fixture_path(name), "rt", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def generate_comment_tree(comments: int, coins: List[Dict], seed: int = 0,
+                          top_level: int = 200, more_size: int = 100) -> Dict:
+    """
+    Generate a comment tree with `comments` comments. The first `top_level` comments are loaded directly,
+    the rest hide behind nested `MoreComments` stubs of up to `more_size` children.
+    """
+    rng = random.Random(seed)
+    words = ["the", "moon", "hodl", "buy", "sell", "dip", "I", "think", "is", "going", "to", "and", "lol"]
+    mentions = [coin["symbol"] for coin in coins[:200]] + [coin["name"] for coin in coins[:50]]
+    records: Dict[str, Dict] = {}
+    comment_ids = []
+    for i in range(comments):
+        tokens = rng.choices(words, k=rng.randint(5, 60))
+        for _ in range(rng.randint(0, 3)):
+            mention = rng.choice(mentions)
+            tokens.insert(rng.randrange(len(tokens)), rng.choice([mention, mention.upper(), "$" + mention]))
+        comment_id = f"c{i:x}"
+        records[comment_id] = {"kind": "t1", "id": comment_id, "body": " ".join(tokens),
+                               "author": f"user{rng.randrange(comments // 4 + 1)}", "edited": False}
+        comment_ids.append(comment_id)
+
+    hidden = comment_ids[top_level:]
+    stubs: List[str] = []
+    for i in range(0, len(hidden), more_size):
+        stub_id = f"m{i // more_size:x}"
+        children = hidden[i:i + more_size]
+        records[stub_id] = {"kind": "more", "id": stub_id, "parent_id": "t3_bench", "count": len(children),
+                            "children": children}
+        stubs.append(stub_id)
+    # Nest every other stub inside the previous one, like Reddit does for long threads.
+    for parent, child in zip(stubs[::2], stubs[1::2]):
+        records[parent]["children"].append(child)
+        records[parent]["count"] += 1
+    return {
+        "submission": {"id": "bench", "comment_sort": "confidence"},
+        "top_level": comment_ids[:top_level] + stubs[::2],
+        "records": records,
+    }
+
+
+def generate_coingecko_pages(coins: int, per_page: int = 250) -> List[List[Dict]]:
+    markets = make_coins(coins)
+    return [markets[i:i + per_page] for i in range(0, len(markets), per_page)]
+
+
+def generate(comment_sizes: List[int], coin_sizes: List[int]):
+    for coins in coin_sizes:
+        save_fixture(f"coingecko_{coins}", generate_coingecko_pages(coins))
+    coin_list = make_coins(max(coin_sizes))
+    for comments in comment_sizes:
+        save_fixture(f"comments_{comments}", generate_comment_tree(comments, coin_list))
+
+
+class ReplayCoinGeckoAPI:
+    """
+    Stand-in for `CoinGeckoAPI` that answers `get_coins_markets` from recorded pages.
+    """
+
+    def __init__(self, pages: List[List[Dict]]):
+        self.pages = pages
+
+    def get_coins_markets(self, vs_currency: str, per_page: int = 100, page: int = 1, **kwargs):
+        return self.pages[page - 1] if 0 < page <= len(self.pages) else []
+
+
+class ReplayReddit(Reddit):
+    """
+    Offline `praw.Reddit` that answers `/api/morechildren` requests from a comment fixture. The records are
+    turned into comments by praw's own objector, like the responses of a live request.
+    """
+
+    def __init__(self, fixture: Dict):
+        super().__init__(client_id="benchmarks", client_secret=None, user_agent="benchmarks replay",
+                         check_for_updates=False, check_for_async=False)
+        self.records = fixture["records"]
+        self.requests = 0
+
+    def objectify(self, ids: List[str]) -> List:
+        things = [{"kind": self.records[item_id]["kind"],
+                   "data": {key: value for key, value in self.records[item_id].items() if key != "kind"}}
+                  for item_id in ids if item_id in self.records]
+        return self._objector.objectify({"json": {"errors": [], "data": {"things": things}}})
+
+    def post(self, path: str, *, data: Optional[Dict[str, str]] = None, **kwargs):
+        self.requests += 1
+        return self.objectify(data["children"].split(","))
+
+
+def replay_submission(fixture: Dict) -> Submission:
+    """
+    Return a submission whose top-level comments are loaded from the fixture, like after praw fetched it.
+    """
+    reddit = ReplayReddit(fixture)
+    submission = Submission(reddit, _data={"id": fixture["submission"]["id"]})
+    submission.comment_sort = fixture["submission"]["comment_sort"]
+    submission._comments = CommentForest(submission)
+    submission.comments._update(reddit.objectify(fixture["top_level"]))
+    submission._fetched = True
+    return submission
+
+
+def record_submission(submission, workers: int = 4) -> Dict:
+    """
+    Record the comments of a live praw submission as a flat fixture without `MoreComments` stubs.
+    """
+    from lib.reddit_comments_crypto_counter import iter_comments
+
+    records = {}
+    for comment in iter_comments(submission, workers):
+        records[comment.id] = {"kind": "t1", "id": comment.id, "body": comment.body,
+                               "author": str(comment.author) if comment.author else None,
+                               "edited": comment.edited}
+    return {
+        "submission": {"id": submission.id, "comment_sort": submission.comment_sort},
+        "top_level": list(records),
+        "records": records,
+    }
+
+
+def iter_fixture_bodies(fixture: Dict) -> Iterator[str]:
+    for record in fixture["records"].values():
+        if record["kind"] == "t1":
+            yield record["body"]
@@ -0,0 +1,43 @@
+"""
+Scaling of the multi-process `count_tickers` path at 1, 2, 4 and 8 worker processes.
+
+Run from the repository root:
+
+    $ python -m benchmarks.parallel --comments 200000
+"""
+import argparse
+import time
+
+from lib.coingecko import CoinIndex
+from lib.reddit_comments_crypto_counter import count_tickers
+
+from .tokenizer import make_coins, make_corpus
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark count_tickers with several worker processes.")
+    parser.add_argument("--comments", type=int, default=200000, help="Number of synthetic comments.")
+    parser.add_argument("--coins", type=int, default=13000, help="Number of synthetic coins.")
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    coin_index = CoinIndex(make_coins(args.coins))
+    corpus = make_corpus(args.comments, coin_index.coins)
+
+    baseline = None
+    expected = None
+    for processes in args.processes:
+        start = time.perf_counter()
+        cryptos, comments_analyzed = count_tickers(corpus, coin_index, batch_size=args.batch_size,
+                                                   processes=processes)
+        elapsed = time.perf_counter() - start
+        baseline = baseline or elapsed
+        expected = expected or cryptos
+        assert cryptos == expected, f"Counts with {processes} processes differ"
+        print(f"processes={processes:<3} {elapsed:7.3f}s {comments_analyzed / elapsed:12,.0f} comments/s "
+              f"speedup={baseline / elapsed:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
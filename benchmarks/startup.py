@@ -0,0 +1,79 @@
+"""
+Startup check of the CLI and the bot with `python -X importtime`.
+
+Run from the repository root:
+
+    $ python -m benchmarks.startup
+    $ python -m benchmarks.startup --budget 100
+
+Each command is started `--runs` times and the median time spent importing modules that a bare interpreter
+doesn't import is reported, with the slowest of them. Exits with status 1 if a command takes longer than
+`--budget` milliseconds or imports one of the heavy dependencies that should only load when they're used.
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Set, Tuple
+
+commands = {
+    "main.py --help": ["main.py", "--help"],
+    "bot --help": ["-m", "bot.crypto_counter", "--help"],
+    "import lib": ["-c", "import lib"],
+}
+
+# Modules that must not be imported to show the help or to count a dump.
+heavy_modules = ("praw", "prawcore", "asyncpraw", "pycoingecko", "requests", "urllib3", "english_words", "tinydb",
+                 "aiohttp", "asyncio", "http.server")
+
+
+def import_times(args: List[str]) -> List[Tuple[int, int, str]]:
+    """
+    Run Python with `-X importtime` and return the self and cumulative microseconds and the indented name of
+    each import.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", *args], capture_output=True, text=True)
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        times.append((int(self_us), int(cumulative_us), name.rstrip()))
+    return times
+
+
+def top_level(times: List[Tuple[int, int, str]], baseline: Set[str]) -> Dict[str, int]:
+    """
+    Return the cumulative microseconds of the top-level imports that aren't part of the interpreter's startup.
+    """
+    return {name.strip(): cumulative for _, cumulative, name in times
+            if not name.startswith("  ") and name.strip() not in baseline}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the import time of the CLI and the bot.")
+    parser.add_argument("--budget", type=float, default=100, help="Maximum import time per command in ms.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=5, help="Number of slowest imports to show per command.")
+    args = parser.parse_args()
+
+    baseline = {name.strip() for _, _, name in import_times(["-c", "pass"])}
+    failed = False
+    for label, command in commands.items():
+        times = [import_times(command) for _ in range(args.runs)]
+        runs = [top_level(run, baseline) for run in times]
+        elapsed = statistics.median(sum(run.values()) for run in runs) / 1000
+        imported = {name.strip() for _, _, name in times[-1]}
+        heavy = [module for module in heavy_modules if module in imported]
+        over_budget = elapsed > args.budget
+        failed = failed or over_budget or bool(heavy)
+        print(f"{label:<16} {elapsed:7.1f} ms {'OVER BUDGET' if over_budget else 'ok'}")
+        for name, cumulative in sorted(runs[-1].items(), key=lambda x: x[1], reverse=True)[:args.top]:
+            print(f"    {cumulative / 1000:7.1f} ms  {name}")
+        if heavy:
+            print(f"    imports {', '.join(heavy)}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Lookup and update latency of the bot's submission stores at a given number of tracked submissions.
+
+Run from the repository root:
+
+    $ python -m benchmarks.storage --submissions 10000
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from typing import Callable, List
+
+from lib.storage import SQLiteStore, SubmissionStore, TinyDBStore
+
+
+def measure(operation: Callable[[str], None], submission_ids: List[str]) -> List[float]:
+    timings = []
+    for submission_id in submission_ids:
+        start = time.perf_counter()
+        operation(submission_id)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def report(name: str, operation: str, timings: List[float]):
+    timings = sorted(timings)
+    print(f"{name:<8} {operation:<7} "
+          f"mean={statistics.mean(timings) * 1000:8.3f}ms "
+          f"p50={timings[len(timings) // 2] * 1000:8.3f}ms "
+          f"p99={timings[int(len(timings) * 0.99)] * 1000:8.3f}ms")
+
+
+def populate_tinydb(path: str, submission_ids: List[str]):
+    # Written directly, inserting 10k documents through TinyDB one at a time takes minutes.
+    documents = {str(i + 1): {"id": submission_id, "type": "submission"}
+                 for i, submission_id in enumerate(submission_ids)}
+    with open(path, "w") as f:
+        json.dump({"_default": documents}, f)
+
+
+def run(name: str, store: SubmissionStore, submission_ids: List[str], samples: int):
+    sample = random.sample(submission_ids, samples)
+    report(name, "lookup", measure(store.get_submission, sample))
+    report(name, "update", measure(lambda submission_id: store.update_submission(
+        submission_id, {"crypto_comments_id": "abc123"}), sample))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the bot's submission stores.")
+    parser.add_argument("--submissions", type=int, default=10000, help="Number of tracked submissions.")
+    parser.add_argument("--samples", type=int, default=200, help="Number of lookups and updates to time.")
+    args = parser.parse_args()
+
+    random.seed(0)
+    submission_ids = [f"s{i:06x}" for i in range(args.submissions)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        sqlite_store = SQLiteStore(os.path.join(tmp, "bench.sqlite3"))
+        for submission_id in submission_ids:
+            sqlite_store.create_submission(submission_id)
+        run("sqlite", sqlite_store, submission_ids, args.samples)
+
+        tinydb_path = os.path.join(tmp, "bench.json")
+        populate_tinydb(tinydb_path, submission_ids)
+        run("tinydb", TinyDBStore(tinydb_path), submission_ids, args.samples)
+
+
+if __name__ == "__main__":
+    main()
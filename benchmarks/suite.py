@@ -0,0 +1,191 @@
+"""
+Offline benchmark suite replaying recorded Reddit comment trees and CoinGecko responses.
+
+Run from the repository root:
+
+    $ python -m benchmarks.suite generate
+    $ python -m benchmarks.suite run --output results.json
+    $ python -m benchmarks.suite run --baseline results.json --max-regression 0.2
+
+`run` reports the time of each stage (fetch, tokenize, name-match, rank and render), the throughput in
+comments per second and the peak memory per case as JSON. With `--baseline` it exits with status 1 if a
+stage got slower than the baseline by more than `--max-regression`.
+"""
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from lib.coingecko import CoinIndex, get_cg_coins_markets
+from lib.formatting import get_markdown_table
+from lib.matcher import NameMatcher
+from lib.reddit_comments_crypto_counter import (iter_comments, rank_cryptos,
+                                                tokenize_comments)
+
+from .fixtures import (ReplayCoinGeckoAPI, generate, load_fixture,
+                       record_submission, replay_submission, save_fixture)
+
+comment_sizes = [1000, 20000, 200000]
+coin_sizes = [1000, 13000]
+
+
+def measure(func: Callable[[], Any], trace_memory: bool = True) -> Tuple[Any, float, Optional[int]]:
+    """
+    Run `func` and return its result, the elapsed seconds and the peak memory allocated in bytes.
+    Tracing allocations slows the function down, so memory is measured in a second run.
+    """
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    if not trace_memory:
+        return result, elapsed, None
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def tokenize_tickers(bodies: List[str], coin_index: CoinIndex) -> int:
+    return sum(len(tickers) for tickers in tokenize_comments(bodies, coin_index, match_names=False))
+
+
+def match_names(bodies: List[str], coin_index: CoinIndex) -> int:
+    find = coin_index.name_matcher.find
+    return sum(len(find(body.lower())) for body in bodies)
+
+
+def count(bodies: List[str], coin_index: CoinIndex) -> Dict[str, int]:
+    cryptos: Dict[str, int] = {}
+    for tickers in tokenize_comments(bodies, coin_index):
+        for ticker in tickers:
+            cryptos[ticker] = cryptos.get(ticker, 0) + 1
+    return cryptos
+
+
+def run_case(comments: str, coins: str, trace_memory: bool = True) -> Dict[str, Any]:
+    comment_fixture = load_fixture(f"comments_{comments}")
+    coingecko_fixture = load_fixture(f"coingecko_{coins}")
+    stages: Dict[str, Dict[str, Optional[float]]] = {}
+
+    def stage(name: str, func: Callable[[], Any]) -> Any:
+        result, elapsed, peak = measure(func, trace_memory)
+        stages[name] = {"seconds": elapsed, "peak_memory_bytes": peak}
+        return result
+
+    api = ReplayCoinGeckoAPI(coingecko_fixture)
+    limit = sum(len(page) for page in coingecko_fixture)
+    markets = stage("coingecko", lambda: get_cg_coins_markets(limit=limit, api=api, workers=1))
+    coin_index = stage("index", lambda: CoinIndex(markets))
+    stage("compile", lambda: NameMatcher(coin_index.names))
+    coin_index.name_matcher
+    submissions = []
+
+    def fetch() -> List[str]:
+        submissions.append(replay_submission(comment_fixture))
+        return [comment.body for comment in iter_comments(submissions[-1])]
+
+    bodies = stage("fetch", fetch)
+    stage("tokenize", lambda: tokenize_tickers(bodies, coin_index))
+    stage("name_match", lambda: match_names(bodies, coin_index))
+    cryptos = stage("count", lambda: count(bodies, coin_index))
+    ranked = stage("rank", lambda: rank_cryptos(cryptos))
+    stage("render", lambda: get_markdown_table(ranked, coin_index, 75))
+
+    analysis_seconds = sum(stages[name]["seconds"] for name in ("fetch", "count"))
+    return {
+        "comments": len(bodies),
+        "coins": len(markets),
+        "morechildren_requests": submissions[0]._reddit.requests,
+        "comments_per_second": len(bodies) / analysis_seconds if analysis_seconds else None,
+        "peak_memory_bytes": max(stage["peak_memory_bytes"] or 0 for stage in stages.values()) if trace_memory else None,
+        "stages": stages,
+    }
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], max_regression: float) -> List[str]:
+    regressions = []
+    for case, result in results["cases"].items():
+        if case not in baseline["cases"]:
+            continue
+        for stage, timing in result["stages"].items():
+            baseline_timing = baseline["cases"][case]["stages"].get(stage)
+            # Ignore stages too short to time reliably.
+            if not baseline_timing or baseline_timing["seconds"] < 0.001:
+                continue
+            ratio = timing["seconds"] / baseline_timing["seconds"]
+            if ratio > 1 + max_regression:
+                regressions.append(f"{case} {stage}: {baseline_timing['seconds']:.4f}s -> "
+                                   f"{timing['seconds']:.4f}s ({ratio - 1:+.0%})")
+    return regressions
+
+
+def run(args: argparse.Namespace) -> int:
+    results = {"cases": {}}
+    for comments in args.comments:
+        for coins in args.coins:
+            case = f"comments={comments},coins={coins}"
+            print(f"Running {case}...", file=sys.stderr)
+            results["cases"][case] = run_case(comments, coins, not args.no_memory)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.max_regression)
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+def record(args: argparse.Namespace) -> int:
+    import praw
+
+    reddit = praw.Reddit("CCC", user_agent="Reddit crypto comments ticker counter by Dan6erbond.")
+    save_fixture(f"comments_{args.name}", record_submission(reddit.submission(url=args.url)))
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark suite.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    generate_parser = subparsers.add_parser("generate", help="Generate the synthetic fixtures.")
+    generate_parser.add_argument("--comments", type=int, nargs="+", default=comment_sizes)
+    generate_parser.add_argument("--coins", type=int, nargs="+", default=coin_sizes)
+
+    record_parser = subparsers.add_parser("record", help="Record the comments of a live submission as a fixture.")
+    record_parser.add_argument("--url", required=True)
+    record_parser.add_argument("--name", required=True,
+                               help="Fixture name, e.g. megathread to run it with --comments megathread.")
+
+    run_parser = subparsers.add_parser("run", help="Run the benchmarks against the fixtures.")
+    run_parser.add_argument("--comments", nargs="+", default=[str(size) for size in comment_sizes],
+                            help="Comment fixtures to run, e.g. 20000 for comments_20000 or a recorded fixture.")
+    run_parser.add_argument("--coins", nargs="+", default=[str(size) for size in coin_sizes],
+                            help="CoinGecko fixtures to run, e.g. 13000 for coingecko_13000.")
+    run_parser.add_argument("--no-memory", action="store_true", help="Don't measure the peak memory of each stage.")
+    run_parser.add_argument("--output", help="Write the JSON results to this file instead of stdout.")
+    run_parser.add_argument("--baseline", help="JSON results of a previous run to compare against.")
+    run_parser.add_argument("--max-regression", type=float, default=0.2,
+                            help="Allowed slowdown per stage relative to the baseline.")
+
+    args = parser.parse_args()
+    if args.command == "generate":
+        generate(args.comments, args.coins)
+        sys.exit(0)
+    sys.exit(record(args) if args.command == "record" else run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Micro-benchmark of the batch tokenizer against the previous per-comment loop on a synthetic corpus.
+
+Run from the repository root:
+
+    $ python -m benchmarks.tokenizer --comments 100000
+"""
+import argparse
+import random
+import string
+import time
+from typing import Dict, List, Set
+
+from lib.coingecko import CoinIndex
+from lib.reddit_comments_crypto_counter import ticker_re, tokenize_comments
+from lib.words import get_english_words
+
+
+def make_coins(count: int) -> List[Dict]:
+    random.seed(0)
+    coins = [
+        {"id": "bitcoin", "symbol": "btc", "name": "Bitcoin", "market_cap": 10 ** 12},
+        {"id": "ethereum", "symbol": "eth", "name": "Ethereum", "market_cap": 10 ** 11},
+        {"id": "solana", "symbol": "sol", "name": "Solana", "market_cap": 10 ** 10},
+        {"id": "sun-token", "symbol": "sun", "name": "Sun Token", "market_cap": 10 ** 8},
+    ]
+    while len(coins) < count:
+        symbol = "".join(random.choices(string.ascii_lowercase, k=random.randint(3, 5)))
+        name = symbol.capitalize() + random.choice(["coin", " Token", " Protocol", " Finance"])
+        coins.append({"id": f"{symbol}-{len(coins)}", "symbol": symbol, "name": name, "market_cap": len(coins)})
+    return coins
+
+
+def make_corpus(comments: int, coins: List[Dict]) -> List[str]:
+    random.seed(1)
+    words = ["the", "moon", "hodl", "buy", "sell", "dip", "I", "think", "is", "going", "to", "and", "sun", "lol"]
+    mentions = [coin["symbol"] for coin in coins[:200]] + [coin["name"] for coin in coins[:50]]
+    corpus = []
+    for _ in range(comments):
+        tokens = random.choices(words, k=random.randint(5, 40))
+        for _ in range(random.randint(0, 3)):
+            mention = random.choice(mentions)
+            tokens.insert(random.randrange(len(tokens)),
+                          random.choice([mention, mention.upper(), "$" + mention]))
+        corpus.append(" ".join(tokens))
+    return corpus
+
+
+def legacy_tokenize(bodies: List[str], coin_index: CoinIndex) -> List[Set[str]]:
+    cg_dict = coin_index.names
+    name_matcher = coin_index.name_matcher
+    english_words_lower_set = get_english_words()
+    tickers_per_comment = []
+    for body in bodies:
+        tickers = set()
+        for match in ticker_re.finditer(body):
+            ticker = match.group(1)
+            ticker_lower = ticker.lower()
+            starts_with_dollar_symbol = match.start() > 0 and body[match.start() - 1] == "$"
+            if not starts_with_dollar_symbol and ticker in english_words_lower_set and ticker.upper() != ticker:
+                continue
+            if ticker_lower in cg_dict:
+                tickers.add(ticker_lower)
+        tickers.update(name_matcher.find(body.lower()))
+        tickers_per_comment.append(tickers)
+    return tickers_per_comment
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark tokenize_comments against the per-comment loop.")
+    parser.add_argument("--comments", type=int, default=100000, help="Number of synthetic comments.")
+    parser.add_argument("--coins", type=int, default=13000, help="Number of synthetic coins.")
+    args = parser.parse_args()
+
+    coin_index = CoinIndex(make_coins(args.coins))
+    coin_index.name_matcher
+    corpus = make_corpus(args.comments, coin_index.coins)
+
+    start = time.perf_counter()
+    legacy = legacy_tokenize(corpus, coin_index)
+    legacy_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch = tokenize_comments(corpus, coin_index)
+    batch_elapsed = time.perf_counter() - start
+
+    assert legacy == batch, "tokenize_comments doesn't match the per-comment loop"
+    print(f"per-comment loop: {legacy_elapsed:.3f}s ({args.comments / legacy_elapsed:,.0f} comments/s)")
+    print(f"batch tokenizer:  {batch_elapsed:.3f}s ({args.comments / batch_elapsed:,.0f} comments/s)")
+    print(f"speedup:          {legacy_elapsed / batch_elapsed:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
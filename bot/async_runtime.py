@@ -0,0 +1,369 @@
+"""
+Runtime that runs the bot as asyncio tasks on a single event loop with asyncpraw, instead of one thread per stream
+and a pool of submission workers. Reddit and CoinGecko requests share one aiohttp connection pool.
+
+Started from the bot's entry point with `python -m bot.crypto_counter --async`.
+"""
+import asyncio
+import logging
+import signal
+from datetime import datetime
+from typing import (Any, Awaitable, Callable, Dict, List, Optional, Set,
+                    Tuple, TypedDict)
+
+from bot.instrumentation import *
+from lib.coingecko import CoinGeckoCache, CoinIndex, get_cg_coins_markets_async
+from lib.formatting import get_content_hash
+from lib.ratelimit import Priority, RateGovernor, parse_ratelimit_delay
+from lib.reddit_comments_crypto_counter import morechildren_limit, update_analysis
+from lib.scheduler import get_time_interval
+from lib.storage import SubmissionStore
+from lib.supervisor import Supervisor
+from lib.work_queue import AsyncCoalescingQueue
+
+logger = logging.getLogger("CryptoCounter")
+
+summon_commands = ["!CryptoMentions", "!CryptoCounter"]
+
+
+class AsyncCommentTask(TypedDict):
+    # Replied to if the submission doesn't have a results comment yet when the task is written.
+    reply_to: Any
+    text: str
+    content_hash: str
+
+
+def get_requestor_class(governor: RateGovernor) -> type:
+    """
+    Return an asyncprawcore `Requestor` that waits for `governor` before each request and feeds it the rate limit
+    headers of the responses.
+    """
+    from contextlib import asynccontextmanager
+
+    from asyncprawcore import Requestor
+
+    async def acquire():
+        reddit_ratelimit_wait_seconds.observe(await governor.acquire_async())
+        reddit_requests.inc()
+
+    def update(response: Any):
+        governor.update_from_headers(response.headers)
+        if governor.remaining is not None:
+            reddit_ratelimit_remaining.set(governor.remaining)
+
+    if hasattr(Requestor.request, "__wrapped__"):
+        # asyncprawcore 3 and later make requests with `async with requestor.request(...)`.
+        class AsyncGovernedRequestor(Requestor):
+            @asynccontextmanager
+            async def request(self, *args, **kwargs):
+                await acquire()
+                # Includes reading the response, which happens inside the `async with` block.
+                with reddit_request_seconds.time():
+                    async with super().request(*args, **kwargs) as response:
+                        update(response)
+                        yield response
+    else:
+        class AsyncGovernedRequestor(Requestor):
+            async def request(self, *args, **kwargs):
+                await acquire()
+                with reddit_request_seconds.time():
+                    response = await super().request(*args, **kwargs)
+                update(response)
+                return response
+
+    return AsyncGovernedRequestor
+
+
+class AsyncCryptoCounter:
+    """
+    The Crypto Counter bot on asyncio. Each tracked submission is a task that sleeps between passes, so thousands
+    of submissions only cost their coroutine frames. At most `concurrency` passes run at once, and CPU-bound
+    counting reuses `update_analysis` from `lib`.
+    """
+
+    def __init__(self,
+                 db: SubmissionStore,
+                 cg_cache: CoinGeckoCache,
+                 governor: RateGovernor,
+                 subreddits: str,
+                 get_comment_text: Callable[[List[Tuple[str, int]], CoinIndex], str],
+                 site: str = "CCC",
+                 user_agent: str = "Reddit crypto comments ticker counter by /u/Dan6erbond.",
+                 concurrency: int = 8,
+                 connections: int = 16):
+        self.db = db
+        self.cg_cache = cg_cache
+        self.governor = governor
+        self.subreddits = subreddits
+        self.get_comment_text = get_comment_text
+        self.site = site
+        self.user_agent = user_agent
+        self.concurrency = concurrency
+        self.connections = connections
+        self.supervisor = Supervisor(on_restart=record_restart, logger=logger)
+        self.comments_queue: AsyncCoalescingQueue[str, AsyncCommentTask] = AsyncCoalescingQueue()
+        self.tracked: Dict[str, asyncio.Task] = {}
+        self.reddit: Any = None
+        self.session: Any = None
+        self.me: Any = None
+        self._passes: Optional[asyncio.Semaphore] = None
+
+    async def run(self):
+        try:
+            import aiohttp
+            import asyncpraw
+        except ImportError:
+            raise ImportError("The async runtime requires asyncpraw and aiohttp: pip install asyncpraw aiohttp")
+
+        self._passes = asyncio.Semaphore(self.concurrency)
+        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.connections)) as session:
+            self.session = session
+            self.reddit = asyncpraw.Reddit(self.site, user_agent=self.user_agent,
+                                           requestor_class=get_requestor_class(self.governor),
+                                           requestor_kwargs={"session": session})
+            self.reddit.validate_on_submit = True
+            try:
+                self.me = await self.reddit.user.me()
+                if self.cg_cache.is_stale():
+                    await self.refresh_coingecko()
+                for doc in self.db.get_active_submissions():
+                    self.track(doc["id"])
+                asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+                await asyncio.gather(
+                    self.supervisor.supervise_async("coingecko", self.refresh_coingecko_forever),
+                    self.supervisor.supervise_async("comments", self.stream_comments),
+                    self.supervisor.supervise_async("inbox", self.stream_mentions),
+                    self.supervisor.supervise_async("comment_worker", self.comment_worker),
+                )
+            except asyncio.CancelledError:
+                logger.info("Stopping workers.")
+            finally:
+                self.supervisor.stopping.set()
+                for task in list(self.tracked.values()):
+                    task.cancel()
+                await self.reddit.close()
+
+    async def refresh_coingecko(self):
+        coins = await get_cg_coins_markets_async(self.session, self.cg_cache.vs_currency, self.cg_cache.limit)
+        # Pickling the cache to disk would block the loop.
+        await asyncio.to_thread(self.cg_cache.store, "markets", coins)
+
+    async def refresh_coingecko_forever(self):
+        while True:
+            # Refresh a little before the entry goes stale, so passes never start the cache's refresh thread.
+            await asyncio.sleep(self.cg_cache.ttl * 0.9)
+            try:
+                await self.refresh_coingecko()
+            except Exception as e:
+                logger.error(f"Failed to refresh CoinGecko data: {e}")
+
+    async def stream_comments(self):
+        subreddit = await self.reddit.subreddit(self.subreddits)
+        async for comment in subreddit.stream.comments(skip_existing=True):
+            stream_items["comments"].inc()
+            if any(mention.lower() in comment.body.lower() for mention in summon_commands):
+                stream_summons["comments"].inc()
+                await self.summon(comment)
+
+    async def stream_mentions(self):
+        from asyncpraw.models import Comment
+
+        async for mention in self.reddit.inbox.stream(skip_existing=True):
+            stream_items["inbox"].inc()
+            if isinstance(mention, Comment) and f"u/{self.me.name.lower()}" in mention.body.lower():
+                stream_summons["inbox"].inc()
+                await mention.mark_read()
+                await self.summon(mention)
+
+    async def summon(self, comment: Any):
+        submission_id = comment.submission.id
+        if db_submission := self.db.get_submission(submission_id):
+            if crypto_comments_id := db_submission.get("crypto_comments_id"):
+                crypto_comment = await self.reddit.comment(crypto_comments_id)
+                await self.write(comment.reply,
+                                 "I've already analyzed this submission! " +
+                                 f"You can see the most updated results [here](https://reddit.com{crypto_comment.permalink}).")
+                logger.warning(f"Submission {submission_id} has already been analyzed, skipping.")
+                return
+        else:
+            self.db.create_submission(submission_id)
+        self.track(submission_id, comment)
+
+    def track(self, submission_id: str, parent_comment: Any = None):
+        if submission_id in self.tracked:
+            return
+        self.tracked[submission_id] = asyncio.create_task(self.track_submission(submission_id, parent_comment))
+        tracked_submissions_gauge.set(len(self.tracked))
+
+    async def track_submission(self, submission_id: str, parent_comment: Any = None):
+        try:
+            while True:
+                async with self._passes:
+                    submission_passes.inc()
+                    with submission_pass_seconds.time():
+                        time_interval = await self.analyze_submission(submission_id, parent_comment)
+                if time_interval is None:
+                    return
+                await asyncio.sleep(time_interval)
+        finally:
+            self.tracked.pop(submission_id, None)
+            tracked_submissions_gauge.set(len(self.tracked))
+
+    async def analyze_submission(self, submission_id: str, parent_comment: Any = None) -> Optional[int]:
+        """
+        Analyze the submission once and queue the comment with the results, like the threaded bot's
+        `analyze_submission`. Returns the number of seconds until the next pass, or `None` to stop tracking it.
+        """
+        time_interval = 5 * 60
+        try:
+            db_submission = self.db.get_submission(submission_id)
+            if not db_submission:
+                logger.error(f"Submission {submission_id} not found in database.")
+                return None
+            submission = await self.reddit.submission(submission_id)
+            if submission.locked:
+                logger.warning(f"Submission {submission_id} is locked, skipping.")
+                self.db.update_submission(submission_id, {"ignore": True})
+                return None
+            subreddit = submission.subreddit
+            await subreddit.load()
+            if subreddit.user_is_banned:
+                logger.warning(f"Subreddit {subreddit.display_name} is banned, skipping submission {submission_id}.")
+                self.db.update_submission(submission_id, {"ignore": True})
+                return None
+            if submission.num_comments < 1:
+                logger.warning(f"Submission {submission_id} has no comments, skipping.")
+                return None
+
+            age = datetime.utcnow() - datetime.utcfromtimestamp(submission.created_utc)
+            time_interval = get_time_interval(age)
+            if time_interval is None:
+                logger.warning(f"Submission {submission_id} is too old to handle, skipping.")
+                self.db.update_submission(submission_id, {"ignore": True})
+                return None
+
+            # Building the coin index and tokenizing a large submission take a while, they run in a thread so the
+            # other tasks keep going.
+            loop = asyncio.get_running_loop()
+            cg_coin_index = await loop.run_in_executor(None, self.cg_cache.get_coin_index)
+            logger.info("Analyzing submission: " + submission_id)
+            comments = await self.fetch_comments(submission)
+            ranked, changed = await loop.run_in_executor(
+                None, self.update_analysis, submission_id, comments, cg_coin_index)
+            if changed:
+                logger.info(f"{changed} comments changed in submission {submission_id}.")
+            comment_text = self.get_comment_text(ranked, cg_coin_index)
+            task = AsyncCommentTask(reply_to=parent_comment or submission, text=comment_text,
+                                    content_hash=get_content_hash(comment_text))
+            if self.comments_queue.put(submission_id, task):
+                logger.info(f"Replaced pending comment task for submission {submission_id}.")
+                comments_coalesced.inc()
+            comments_queue_depth.set(self.comments_queue.qsize())
+        except Exception as e:
+            submission_errors.inc()
+            logger.error(str(e))
+        return time_interval
+
+    def update_analysis(self, submission_id: str, comments: List[Any], cg_coin_index: CoinIndex):
+        """
+        Load, update and store the submission's analysis. Decoding and encoding the analysis of a large submission
+        takes a while too, so this runs in a thread with the tokenizing.
+        """
+        ranked, _, analysis, changed = update_analysis(comments, cg_coin_index, [self.me],
+                                                       self.db.get_analysis(submission_id))
+        if changed:
+            self.db.set_analysis(submission_id, analysis)
+        return ranked, changed
+
+    async def fetch_comments(self, submission: Any) -> List[Any]:
+        """
+        Return every comment of a fetched submission, expanding `MoreComments` level by level with the
+        requests of each level made concurrently, like `iter_comments` with several workers.
+        """
+        from asyncpraw.const import API_PATH
+        from asyncpraw.models import Comment
+        from asyncpraw.models.comment_forest import CommentForest
+
+        async def load_more_children(children: List[str]) -> List[Any]:
+            loaded = await self.reddit.post(API_PATH["morechildren"], data={
+                "children": ",".join(children),
+                "link_id": submission.fullname,
+                "sort": submission.comment_sort,
+            })
+            for comment in loaded:
+                comment.submission = submission
+            return loaded
+
+        async def load_continuation(more: Any) -> List[Any]:
+            forest = await more.comments()
+            return forest.list() if isinstance(forest, CommentForest) else forest
+
+        comments: List[Any] = []
+        seen: Set[str] = set()
+        level: List[Any] = submission.comments.list()
+        while level:
+            children: List[str] = []
+            continuations = []
+            for comment in level:
+                if isinstance(comment, Comment):
+                    if comment.id not in seen:
+                        seen.add(comment.id)
+                        comments.append(comment)
+                elif comment.children:
+                    children.extend(comment.children)
+                else:
+                    continuations.append(comment)
+
+            children = [*dict.fromkeys(child for child in children if child not in seen)]
+            results = await asyncio.gather(
+                *(load_more_children(children[i:i + morechildren_limit])
+                  for i in range(0, len(children), morechildren_limit)),
+                *(load_continuation(more) for more in continuations))
+            level = [comment for result in results for comment in result]
+        return comments
+
+    async def write(self, func: Callable[[str], Awaitable[Any]], text: str) -> Any:
+        """
+        Write a comment with `func` once the governor allows it, as a prioritized request.
+        """
+        comment_throttle_seconds.observe(await self.governor.acquire_write_async())
+        with self.governor.priority(Priority.write):
+            return await func(text)
+
+    async def comment_worker(self):
+        from asyncpraw.exceptions import RedditAPIException
+
+        while True:
+            submission_id, task = await self.comments_queue.get()
+            comments_queue_depth.set(self.comments_queue.qsize())
+            db_submission = self.db.get_submission(submission_id) or {}
+            crypto_comments_id = db_submission.get("crypto_comments_id")
+            if crypto_comments_id and db_submission.get("comment_hash") == task["content_hash"]:
+                logger.info(f"Results of submission {submission_id} are unchanged, skipping edit.")
+                comment_edits_skipped.inc()
+                continue
+
+            try:
+                if crypto_comments_id:
+                    logger.info(f"Editing comment {crypto_comments_id}.")
+                    comment = await self.reddit.comment(crypto_comments_id, fetch=False)
+                    await self.write(comment.edit, task["text"])
+                    self.db.update_submission(submission_id, {"comment_hash": task["content_hash"]})
+                    comment_tasks["edit"].inc()
+                else:
+                    logger.info(f"Replying to {task['reply_to'].fullname}.")
+                    comment = await self.write(task["reply_to"].reply, task["text"])
+                    self.db.update_submission(submission_id, {"crypto_comments_id": comment.id,
+                                                              "comment_hash": task["content_hash"]})
+                    comment_tasks["reply"].inc()
+            except RedditAPIException as e:
+                ratelimit = next((item for item in e.items if item.error_type == "RATELIMIT"), None)
+                if not ratelimit:
+                    logger.exception(e)
+                    continue
+                delay = parse_ratelimit_delay(ratelimit.message) or 60
+                logger.warning(f"Rate limited by Reddit, pausing comments for {delay} seconds.")
+                self.governor.pause_writes(delay)
+                self.comments_queue.put(submission_id, task, replace=False)
+            except Exception as e:
+                logger.exception(e)
@@ -1,40 +1,66 @@
 import argparse
 import logging
+import signal
 import sys
 import threading
-import time
-from datetime import datetime, timedelta
+from datetime import datetime
 from enum import Enum
-from functools import wraps
-from queue import Queue
-from typing import Callable, List, Literal, TypeVar, Union, cast, overload
+from typing import TYPE_CHECKING, Dict, List, Literal, Tuple, Union, overload
 
-import praw
+from bot.instrumentation import *
 from lib import *
-from lib import analyze_comments as analyze_submission_comments
 from lib.coingecko import *
-from lib.formatting import get_markdown_table
-from praw.reddit import Comment, Submission
-from tinydb import Query, TinyDB
-from tinydb.table import Document
-from tinyrecord import transaction
-
-reddit = praw.Reddit("CCC", user_agent="Reddit crypto comments ticker counter by /u/Dan6erbond.")
-reddit.validate_on_submit = True
-# subreddits = reddit.multireddit("Dan6erbond", "crypto")
-subreddits = reddit.subreddit("+".join(["u_CryptoCounterBot", "Solana", "Algorand"]))
-
-db = TinyDB("crypto_counter_bot.json")
+from lib.formatting import get_content_hash, get_markdown_table
+from lib.ratelimit import Priority, RateGovernor, parse_ratelimit_delay
+from lib.refresher import SubmissionRefresher
+from lib.scheduler import SubmissionScheduler, get_time_interval
+from lib.storage import (SQLiteStore, SubmissionDocument, SubmissionStore,
+                         migrate_tinydb)
+from lib.supervisor import Supervisor
+from lib.work_queue import CoalescingQueue
+
+if TYPE_CHECKING:
+    import praw
+    from praw.reddit import Comment, Submission
+
+# Shared by all threads, so reads and the bot's own comments draw from the same Reddit quota.
+governor = RateGovernor()
+
+
+def get_requestor_class() -> type:
+    """
+    Return a prawcore `Requestor` that waits for the rate governor before each request, feeds it the rate limit
+    headers of the response and records the number and duration of requests made to Reddit.
+    """
+    from prawcore import Requestor
+
+    class GovernedRequestor(Requestor):
+        def request(self, *args, **kwargs):
+            reddit_ratelimit_wait_seconds.observe(governor.acquire())
+            reddit_requests.inc()
+            with reddit_request_seconds.time():
+                response = super().request(*args, **kwargs)
+            governor.update_from_headers(response.headers)
+            if governor.remaining is not None:
+                reddit_ratelimit_remaining.set(governor.remaining)
+            return response
+
+    return GovernedRequestor
+
+
+# Set by `initialize`, so importing the module doesn't load PRAW, connect to Reddit or open the database and log files.
+reddit: "praw.Reddit" = None
+subreddits = None
+db: SubmissionStore = None
+# Fetches the tracked submissions that are due, 100 per request.
+refresher: SubmissionRefresher = None
+cg_cache: CoinGeckoCache = None
 
 logger = logging.getLogger("CryptoCounter")
 formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
 logger.setLevel(logging.DEBUG)
 logger.propagate = False
 
-stream_handler = logging.StreamHandler(sys.stdout)
-stream_handler.setLevel(logging.WARN)
-stream_handler.setFormatter(formatter)
-
 
 class LevelFilter(logging.Filter):
     def __init__(self, level):
@@ -44,30 +70,52 @@ class LevelFilter(logging.Filter):
         return log_record.levelno <= self.__level
 
 
-logger.addHandler(stream_handler)
-
-log_file_handler = logging.FileHandler("bot.log", "a+", "utf-8")
-log_file_handler.setLevel(logging.INFO)
-log_file_handler.setFormatter(formatter)
-logger.addHandler(log_file_handler)
-log_file_handler.addFilter(LevelFilter(logging.INFO))
-
-error_file_handler = logging.FileHandler("bot.error", "a+", "utf-8")
-error_file_handler.setLevel(logging.INFO)
-error_file_handler.setFormatter(formatter)
-logger.addHandler(error_file_handler)
+def configure_logging():
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setLevel(logging.WARN)
+    stream_handler.setFormatter(formatter)
+    logger.addHandler(stream_handler)
+
+    log_file_handler = logging.FileHandler("bot.log", "a+", "utf-8")
+    log_file_handler.setLevel(logging.INFO)
+    log_file_handler.setFormatter(formatter)
+    logger.addHandler(log_file_handler)
+    log_file_handler.addFilter(LevelFilter(logging.INFO))
+
+    error_file_handler = logging.FileHandler("bot.error", "a+", "utf-8")
+    error_file_handler.setLevel(logging.INFO)
+    error_file_handler.setFormatter(formatter)
+    logger.addHandler(error_file_handler)
+
+
+def initialize(test: bool = False):
+    """
+    Set up the log files, connect to Reddit and open the database and CoinGecko cache, or the test subreddit and
+    database in test mode.
+    """
+    global reddit, subreddits, db, refresher, cg_cache
+    import praw
+
+    configure_logging()
+    reddit = praw.Reddit("CCC", user_agent="Reddit crypto comments ticker counter by /u/Dan6erbond.",
+                         requestor_class=get_requestor_class())
+    reddit.validate_on_submit = True
+    refresher = SubmissionRefresher(reddit.info)
+    if test:
+        subreddits = reddit.subreddit("test")
+        db = SQLiteStore("crypto_counter_bot_test.sqlite3")
+    else:
+        # subreddits = reddit.multireddit("Dan6erbond", "crypto")
+        subreddits = reddit.subreddit("+".join(["u_CryptoCounterBot", "Solana", "Algorand"]))
+        db = SQLiteStore("crypto_counter_bot.sqlite3")
+    cg_cache = CoinGeckoCache("crypto_counter_coingecko.pickle", ttl=60 * 60)
 
-cg_coins_market: List[CoinMarket] = None
-cg_coins_market_last_updated: datetime = None
 
 bot_disclaimer = """\n\n
  I am a bot built by /u/Dan6erbond.
  Results may not be accurate.
  Please report any issues on my [GitHub](https://github.com/Dan6erbond/reddit-comments-crypto-counter)."""
 
-lock = threading.Lock()
-
-
 class CommentTaskAction(str, Enum):
     edit = "edit"
     reply = "reply"
@@ -75,171 +123,152 @@ class CommentTaskAction(str, Enum):
 
 class CommentTask(TypedDict):
     action: CommentTaskAction
-    edit_comment: Optional[Comment]
-    reply_to: Optional[Union[Comment, Submission]]
-    db_submission: Document
+    edit_comment: Optional["Comment"]
+    reply_to: Optional[Union["Comment", "Submission"]]
+    db_submission: SubmissionDocument
     text: str
+    content_hash: str
 
 
-class DocumentType(str, Enum):
-    submission = "submission"
-    comment = "comment"
-
-
-FuncT = TypeVar("FuncT", bound=Callable[..., Any])
-
-
-# Decorator that logs exceptions and restarts the function
-def error_handler(retry: bool = True, timeout: int = 0):
-    def inner(f: FuncT) -> FuncT:
-        @wraps(f)
-        def wrapper(*args: Any, **kwargs: Any) -> Any:
-            def start(*args: Any, **kwargs: Any) -> Any:
-                try:
-                    f(*args, **kwargs)
-                except Exception as e:
-                    logger.exception(e)
-                finally:
-                    time.sleep(timeout)
-                    if retry:
-                        start(*args, **kwargs)
-            start(*args, **kwargs)
-        return cast(FuncT, wrapper)
-    return inner
+# Pending comment tasks keyed by submission ID, only the newest task per submission is written.
+CommentQueue = CoalescingQueue[str, CommentTask]
 
+# Submissions analyzed by the scheduler, with the queue and comment to reply to.
+tracked_lock = threading.Lock()
+tracked_submissions: Dict[str, Tuple["Submission", CommentQueue, Optional["Comment"]]] = {}
+# Time intervals of the submissions refreshed in a batch, whose analysis pass can skip the checks.
+refreshed_intervals: Dict[str, int] = {}
+scheduler = SubmissionScheduler(lambda submission_id: run_tracked_submission(submission_id), workers=8,
+                                batch_job=lambda submission_ids: refresh_tracked_submissions(submission_ids))
 
-def initialize_test():
-    global db, subreddits
-    db = TinyDB("crypto_counter_bot_test.json")
-    subreddits = reddit.subreddit("test")
 
-
-def get_submission(submission_id: str) -> Document:
-    with lock:
-        Submission = Query()
-        res: List[Document] = db.search(
-            (Submission.type == DocumentType.submission) & (
-                Submission.id == submission_id))
-        return res[0] if res else None
+def get_submission(submission_id: str) -> Optional[SubmissionDocument]:
+    return db.get_submission(submission_id)
 
 
 @overload
 def create_submission(submission_id: str, return_submission: Literal[False]) -> None: ...
 @overload
-def create_submission(submission_id: str, return_submission: Literal[True]) -> Document: ...
+def create_submission(submission_id: str, return_submission: Literal[True]) -> SubmissionDocument: ...
 
 
-def create_submission(submission_id: str, return_submission: bool = False) -> Union[None, Document]:
-    with transaction(db) as tr:
-        tr.insert({
-            "id": submission_id,
-            "type": DocumentType.submission,
-        })
-    return get_submission(submission_id) if return_submission else None
+def create_submission(submission_id: str, return_submission: bool = False) -> Union[None, SubmissionDocument]:
+    submission = db.create_submission(submission_id)
+    return submission if return_submission else None
 
 
-def analyze_submissions(comments_queue: Queue[CommentTask]):
+def analyze_submissions(comments_queue: CommentQueue):
     for submission in subreddits.stream.submissions(skip_existing=True):
-        submission: Submission
+        submission: "Submission"
         # TODO: Check if submission is applicable for analysis
-        start_submission_thread(submission, comments_queue)
-
-
-def analyze_submission(submission: Submission,
-                       comments_queue: Queue[CommentTask],
-                       parent_comment: Comment = None):
-    global cg_coins_market_last_updated, cg_coins_market
-
-    while True:
-        try:
-            db_submission = get_submission(submission.id)
-            if not db_submission:
-                logger.error(f"Submission {submission.id} not found in database.")
-                return
-            if submission.locked:
-                logger.warning(f"Submission {submission.id} is locked, skipping.")
-                with transaction(db) as tr:
-                    tr.update({"ignore": True}, doc_ids=[db_submission.doc_id])
-                return
-            if submission.subreddit.user_is_banned:
-                logger.warning(
-                    f"Subreddit {submission.subreddit.display_name} is banned, skipping submission {submission.id}.")
-                with transaction(db) as tr:
-                    tr.update({"ignore": True}, doc_ids=[db_submission.doc_id])
-                return
-            if submission.num_comments < 1:
-                logger.warning(f"Submission {submission.id} has no comments, skipping.")
-                return
-
-            created = datetime.utcfromtimestamp(submission.created_utc)
-            age = datetime.utcnow() - created
-
-            if age > timedelta(weeks=2):
-                logger.warning(
-                    f"Submission {submission.id} is too old to handle, skipping.")
-                with transaction(db) as tr:
-                    tr.update({"ignore": True}, doc_ids=[db_submission.doc_id])
-                return
-
-            if age > timedelta(days=1):
-                time_interval = 1 * 60 * 60
-            elif age > timedelta(hours=4):
-                time_interval = 30 * 60
-            elif age > timedelta(hours=2):
-                time_interval = 20 * 60
-            elif age > timedelta(hours=1):
-                time_interval = 10 * 60
-            else:
-                time_interval = 5 * 60
-            logger.info(f"Set time interval at {time_interval}.")
-
-            if not cg_coins_market_last_updated or datetime.now() - cg_coins_market_last_updated > timedelta(hours=1):
-                cg_coins_market = get_cg_coins_markets()
-                cg_coins_market_last_updated = datetime.now()
-
-            logger.info("Analyzing submission: " + submission.id)
-            ranked, _ = analyze_submission_comments(submission, cg_coins_market, [reddit.user.me()])
-            coin_mentions = sum(count for _, count in ranked)
-
-            top = 75 if coin_mentions > 75 else 50 if coin_mentions > 50 else 25 if coin_mentions > 25 else 10 if coin_mentions > 10 else min(
-                coin_mentions, 10)
-            comment_text: str
-            if ranked:
-                comment_text = f"I've analyzed the submission! These were the top {top} crypto mentions:\n\n" + \
-                    get_markdown_table(ranked, cg_coins_market, top) + \
-                    f"\n\nLast updated: {datetime.now().strftime('%m/%d/%Y, %H:%M:%S')}" + bot_disclaimer
-            else:
-                comment_text = "I've analyzed the submission! Unfortunately, at the current time, no results were found." + \
-                    f"\n\nLast updated: {datetime.now().strftime('%m/%d/%Y, %H:%M:%S')}" + bot_disclaimer
-            if crypto_comments_id := db_submission.get("crypto_comments_id"):
-                comment = reddit.comment(crypto_comments_id)
-                comments_queue.put(
-                    CommentTask(
-                        action=CommentTaskAction.edit,
-                        edit_comment=comment,
-                        db_submission=db_submission,
-                        text=comment_text
-                    )
-                )
-            else:
-                comments_queue.put(
-                    CommentTask(
-                        action=CommentTaskAction.reply,
-                        reply_to=parent_comment or submission,
-                        db_submission=db_submission,
-                        text=comment_text
-                    )
-                )
-        except Exception as e:
-            logger.error(str(e))
-        finally:
-            time.sleep(time_interval)
-
-
-def start_submission_thread(submission: Submission,
-                            comments_queue: Queue[CommentTask],
-                            db_submission: Document = None,
-                            parent_comment: Comment = None):
+        track_submission(submission, comments_queue)
+
+
+def get_comment_text(ranked: List[Tuple[str, int]], cg_coin_index: CoinIndex) -> str:
+    coin_mentions = sum(count for _, count in ranked)
+
+    top = 75 if coin_mentions > 75 else 50 if coin_mentions > 50 else 25 if coin_mentions > 25 else 10 if coin_mentions > 10 else min(
+        coin_mentions, 10)
+    if ranked:
+        return f"I've analyzed the submission! These were the top {top} crypto mentions:\n\n" + \
+            get_markdown_table(ranked, cg_coin_index, top) + \
+            f"\n\nLast updated: {datetime.now().strftime('%m/%d/%Y, %H:%M:%S')}" + bot_disclaimer
+    return "I've analyzed the submission! Unfortunately, at the current time, no results were found." + \
+        f"\n\nLast updated: {datetime.now().strftime('%m/%d/%Y, %H:%M:%S')}" + bot_disclaimer
+
+
+def check_submission(submission: "Submission") -> Optional[int]:
+    """
+    Return the time interval of the submission, or `None` if it shouldn't be analyzed.
+    """
+    if submission.locked:
+        logger.warning(f"Submission {submission.id} is locked, skipping.")
+        db.update_submission(submission.id, {"ignore": True})
+        return None
+    if submission.subreddit.user_is_banned:
+        logger.warning(
+            f"Subreddit {submission.subreddit.display_name} is banned, skipping submission {submission.id}.")
+        db.update_submission(submission.id, {"ignore": True})
+        return None
+    if submission.num_comments < 1:
+        logger.warning(f"Submission {submission.id} has no comments, skipping.")
+        return None
+
+    created = datetime.utcfromtimestamp(submission.created_utc)
+    age = datetime.utcnow() - created
+
+    time_interval = get_time_interval(age)
+    if time_interval is None:
+        logger.warning(
+            f"Submission {submission.id} is too old to handle, skipping.")
+        db.update_submission(submission.id, {"ignore": True})
+    return time_interval
+
+
+def analyze_submission(submission: "Submission",
+                       comments_queue: CommentQueue,
+                       parent_comment: "Comment" = None,
+                       time_interval: Optional[int] = None) -> Optional[int]:
+    """
+    Analyze the submission once and queue the comment with the results. The checks are skipped if the
+    `time_interval` is given, because `refresh_tracked_submissions` already made them.
+    Returns the number of seconds until the submission should be analyzed again, or `None` to stop tracking it.
+    """
+    checked = time_interval is not None
+    time_interval = time_interval or 5 * 60
+    try:
+        db_submission = get_submission(submission.id)
+        if not db_submission:
+            logger.error(f"Submission {submission.id} not found in database.")
+            return None
+        if not checked:
+            time_interval = check_submission(submission)
+            if time_interval is None:
+                return None
+        logger.info(f"Set time interval at {time_interval}.")
+
+        cg_coin_index = cg_cache.get_coin_index()
+        logger.info("Analyzing submission: " + submission.id)
+        ranked, _, analysis, changed = analyze_comments_incremental(
+            submission, cg_coin_index, [reddit.user.me()], db.get_analysis(submission.id))
+        if changed:
+            logger.info(f"{changed} comments changed in submission {submission.id}.")
+            db.set_analysis(submission.id, analysis, {"num_comments": submission.num_comments})
+        elif db_submission.get("num_comments") != submission.num_comments:
+            db.update_submission(submission.id, {"num_comments": submission.num_comments})
+        comment_text = get_comment_text(ranked, cg_coin_index)
+        content_hash = get_content_hash(comment_text)
+        if crypto_comments_id := db_submission.get("crypto_comments_id"):
+            comment = reddit.comment(crypto_comments_id)
+            task = CommentTask(
+                action=CommentTaskAction.edit,
+                edit_comment=comment,
+                db_submission=db_submission,
+                text=comment_text,
+                content_hash=content_hash
+            )
+        else:
+            task = CommentTask(
+                action=CommentTaskAction.reply,
+                reply_to=parent_comment or submission,
+                db_submission=db_submission,
+                text=comment_text,
+                content_hash=content_hash
+            )
+        if comments_queue.put(submission.id, task):
+            logger.info(f"Replaced pending comment task for submission {submission.id}.")
+            comments_coalesced.inc()
+        comments_queue_depth.set(comments_queue.qsize())
+    except Exception as e:
+        submission_errors.inc()
+        logger.error(str(e))
+    return time_interval
+
+
+def track_submission(submission: "Submission",
+                     comments_queue: CommentQueue,
+                     db_submission: SubmissionDocument = None,
+                     parent_comment: "Comment" = None):
     if db_submission or (db_submission := get_submission(submission.id)):
         if crypto_comments_id := db_submission.get("crypto_comments_id"):
             if parent_comment:
@@ -252,73 +281,192 @@ def start_submission_thread(submission: Submission,
     else:
         db_submission = create_submission(submission.id, True)
 
-    threading.Thread(
-        target=analyze_submission,
-        args=(
-            submission,
-            comments_queue,
-            parent_comment)).start()
-
-
-@error_handler(5 * 60)
-def analyze_comments(comments_queue: Queue[CommentTask]):
+    with tracked_lock:
+        tracked_submissions[submission.id] = (submission, comments_queue, parent_comment)
+        tracked_submissions_gauge.set(len(tracked_submissions))
+    scheduler.schedule(submission.id)
+
+
+def untrack_submission(submission_id: str):
+    with tracked_lock:
+        tracked_submissions.pop(submission_id, None)
+        refreshed_intervals.pop(submission_id, None)
+        tracked_submissions_gauge.set(len(tracked_submissions))
+
+
+def run_tracked_submission(submission_id: str) -> Optional[int]:
+    with tracked_lock:
+        submission, comments_queue, parent_comment = tracked_submissions[submission_id]
+        time_interval = refreshed_intervals.pop(submission_id, None)
+    submission_passes.inc()
+    with submission_pass_seconds.time():
+        time_interval = analyze_submission(submission, comments_queue, parent_comment, time_interval)
+    if time_interval is None:
+        untrack_submission(submission_id)
+    return time_interval
+
+
+def refresh_tracked_submissions(submission_ids: List[str]) -> Dict[str, Optional[int]]:
+    """
+    Refresh the due submissions with /api/info before their analysis passes run. Locked, banned and too old
+    submissions are ignored in bulk, and submissions whose number of comments didn't change since their last
+    pass are only rescheduled. Returns the time intervals of the submissions handled here.
+    """
+    num_comments: Dict[str, Optional[int]] = {}
+    analysis_etag = get_analysis_etag(cg_cache.get_coin_index())
+    for submission_id in submission_ids:
+        db_submission = get_submission(submission_id)
+        # Submissions without a comment by the bot yet, or whose analysis was made with other coins, are always
+        # analyzed.
+        if db_submission and db_submission.get("crypto_comments_id") \
+                and db_submission.get("analysis_etag") == analysis_etag:
+            num_comments[submission_id] = db_submission.get("num_comments")
+    try:
+        plan = refresher.refresh(submission_ids, num_comments)
+    except Exception as e:
+        logger.error(f"Failed to refresh {len(submission_ids)} submissions: {e}")
+        raise
+    submissions_refreshed.inc(len(submission_ids))
+
+    if plan.ignore:
+        logger.warning(f"Submissions {', '.join(plan.ignore)} are locked, banned or too old, skipping.")
+        db.ignore_submissions(plan.ignore)
+    for submission_id in plan.empty:
+        logger.warning(f"Submission {submission_id} has no comments, skipping.")
+    if plan.unchanged:
+        logger.info(f"Comments of submissions {', '.join(plan.unchanged)} didn't change, skipping analysis.")
+        submission_passes_skipped.inc(len(plan.unchanged))
+
+    with tracked_lock:
+        for submission_id, (submission, time_interval) in plan.analyze.items():
+            if submission_id in tracked_submissions:
+                _, comments_queue, parent_comment = tracked_submissions[submission_id]
+                tracked_submissions[submission_id] = (submission, comments_queue, parent_comment)
+                refreshed_intervals[submission_id] = time_interval
+    handled = plan.handled
+    for submission_id, time_interval in handled.items():
+        if time_interval is None:
+            untrack_submission(submission_id)
+    return handled
+
+
+def analyze_comments(comments_queue: CommentQueue):
     for comment in subreddits.stream.comments(skip_existing=True):
+        stream_items["comments"].inc()
         if any(mention.lower() in comment.body.lower()
                for mention in ["!CryptoMentions", "!CryptoCounter"]):
-            start_submission_thread(comment.submission, comments_queue, parent_comment=comment)
+            stream_summons["comments"].inc()
+            track_submission(comment.submission, comments_queue, parent_comment=comment)
+
 
+def analyze_mentions(comments_queue: CommentQueue):
+    from praw.reddit import Comment
 
-@error_handler(5 * 60)
-def analyze_mentions(comments_queue: Queue[CommentTask]):
     for mention in reddit.inbox.stream(skip_existing=True):
+        stream_items["inbox"].inc()
         if isinstance(mention, Comment):
             mention: Comment
             if f"u/{reddit.user.me().name.lower()}" in mention.body.lower():
+                stream_summons["inbox"].inc()
                 mention.mark_read()
-                start_submission_thread(mention.submission, comments_queue, parent_comment=mention)
+                track_submission(mention.submission, comments_queue, parent_comment=mention)
 
 
-def analyze_database(comments_queue: Queue[CommentTask]):
-    Submission = Query()
-    for doc in db.search((Submission.type == DocumentType.submission) & (
-            (Submission.ignore == False) | ~(Submission.ignore.exists()))):
-        start_submission_thread(reddit.submission(doc["id"]), comments_queue, db_submission=doc)
+def analyze_database(comments_queue: CommentQueue):
+    for doc in db.get_active_submissions():
+        track_submission(reddit.submission(doc["id"]), comments_queue, db_submission=doc)
 
 
-def comment_worker(comment_queue: Queue[CommentTask]):
-    last_task_done: Optional[datetime] = None
-    while True:
-        comment_task = comment_queue.get()
-
-        if last_task_done:
-            time.sleep(max(0, 5 - (datetime.now() - last_task_done).total_seconds()))
+def comment_worker(comment_queue: CommentQueue):
+    from praw.exceptions import RedditAPIException
+    from praw.reddit import Comment
 
-        if comment_task["action"] == CommentTaskAction.edit:
-            logger.info(f"Editing comment {comment_task['edit_comment'].id}.")
-            comment_task["edit_comment"].edit(comment_task["text"])
-        elif comment_task["action"] == CommentTaskAction.reply:
-            logger.info(
-                f"Replying to {'comment' if isinstance(comment_task['reply_to'], Comment) else 'submission'} {comment_task['reply_to'].id}.")
-            comment: Comment = comment_task["reply_to"].reply(comment_task["text"])
-            with transaction(db) as tr:
-                tr.update({"crypto_comments_id": comment.id}, doc_ids=[comment_task["db_submission"].doc_id])
-        comment_queue.task_done()
-        last_task_done = datetime.now()
+    while True:
+        submission_id, comment_task = comment_queue.get()
+        comments_queue_depth.set(comment_queue.qsize())
+        try:
+            db_submission = get_submission(submission_id) or comment_task["db_submission"]
+            if comment_task["action"] == CommentTaskAction.reply and (crypto_comments_id := db_submission.get("crypto_comments_id")):
+                # The reply of an earlier task was written after this task was queued.
+                comment_task = CommentTask(**{**comment_task, "action": CommentTaskAction.edit,
+                                              "edit_comment": reddit.comment(crypto_comments_id)})
+            if comment_task["action"] == CommentTaskAction.edit:
+                if db_submission.get("comment_hash") == comment_task["content_hash"]:
+                    logger.info(f"Results of submission {submission_id} are unchanged, skipping edit.")
+                    comment_edits_skipped.inc()
+                    continue
+
+            comment_throttle_seconds.observe(governor.acquire_write())
+
+            try:
+                with governor.priority(Priority.write):
+                    if comment_task["action"] == CommentTaskAction.edit:
+                        logger.info(f"Editing comment {comment_task['edit_comment'].id}.")
+                        comment_task["edit_comment"].edit(comment_task["text"])
+                        db.update_submission(submission_id, {"comment_hash": comment_task["content_hash"]})
+                    elif comment_task["action"] == CommentTaskAction.reply:
+                        logger.info(
+                            f"Replying to {'comment' if isinstance(comment_task['reply_to'], Comment) else 'submission'} {comment_task['reply_to'].id}.")
+                        comment: Comment = comment_task["reply_to"].reply(comment_task["text"])
+                        db.update_submission(submission_id, {"crypto_comments_id": comment.id,
+                                                             "comment_hash": comment_task["content_hash"]})
+            except RedditAPIException as e:
+                ratelimit = next((item for item in e.items if item.error_type == "RATELIMIT"), None)
+                if not ratelimit:
+                    raise
+                delay = parse_ratelimit_delay(ratelimit.message) or 60
+                logger.warning(f"Rate limited by Reddit, pausing comments for {delay} seconds.")
+                governor.pause_writes(delay)
+                # A newer task for the submission queued in the meantime supersedes this one.
+                comment_queue.put(submission_id, comment_task, replace=False)
+            else:
+                comment_tasks[comment_task["action"].value].inc()
+        finally:
+            # Also when the task failed, so that `join` doesn't wait for it forever.
+            comment_queue.task_done()
 
 
 def main():
     print("Starting Crypto Counter Bot.")
+    supervisor = Supervisor(on_restart=record_restart, logger=logger)
+    signal.signal(signal.SIGTERM, lambda *_: supervisor.stopping.set())
     logger.info("Creating comments task queue.")
-    comments_queue: Queue[CommentTask][CommentTask] = Queue()
+    comments_queue: CommentQueue = CoalescingQueue()
     logger.info("Starting database thread.")
-    threading.Thread(target=analyze_database, args=(comments_queue, )).start()
+    threading.Thread(target=analyze_database, args=(comments_queue, ), daemon=True).start()
     logger.info("Starting comments thread.")
-    threading.Thread(target=analyze_comments, args=(comments_queue, )).start()
+    supervisor.supervise("comments", analyze_comments, comments_queue)
     logger.info("Starting inbox thread.")
-    threading.Thread(target=analyze_mentions, args=(comments_queue, )).start()
-    # threading.Thread(target=analyze_submissions).start()
+    supervisor.supervise("inbox", analyze_mentions, comments_queue)
+    # supervisor.supervise("submissions", analyze_submissions, comments_queue)
+    logger.info("Starting submission scheduler.")
+    supervisor.supervise("scheduler", scheduler.run_forever)
     logger.info("Starting comment worker.")
-    threading.Thread(target=comment_worker, args=(comments_queue, ), daemon=True).start()
+    supervisor.supervise("comment_worker", comment_worker, comments_queue)
+
+    try:
+        supervisor.wait()
+    except KeyboardInterrupt:
+        pass
+    print("Stopping Crypto Counter Bot.")
+    logger.info("Stopping workers.")
+    supervisor.stopping.set()
+    scheduler.stop(wait=True)
+    supervisor.stop()
+
+
+def main_async():
+    import asyncio
+
+    from bot.async_runtime import AsyncCryptoCounter
+
+    print("Starting Crypto Counter Bot on asyncio.")
+    bot = AsyncCryptoCounter(db, cg_cache, governor, subreddits.display_name, get_comment_text)
+    try:
+        asyncio.run(bot.run())
+    except KeyboardInterrupt:
+        pass
+    print("Stopping Crypto Counter Bot.")
 
 
 parser = argparse.ArgumentParser(description="Scan Reddit comment trees for crypto coin tickers and names.")
@@ -329,14 +477,33 @@ parser.add_argument(
     dest="clear_db",
     action="store_true",
     help="Clear the database.")
-parser.set_defaults(test=False, clear_db=False)
+parser.add_argument("--migrate-tinydb", dest="migrate_tinydb", type=str,
+                    help="Copy the submissions from a TinyDB file (e.g. crypto_counter_bot.json) into the database.")
+parser.add_argument("--metrics-port", dest="metrics_port", type=int,
+                    help="Serve Prometheus metrics on http://127.0.0.1:<port>/metrics.")
+parser.add_argument("--metrics-json", dest="metrics_json", type=str,
+                    help="Write a JSON snapshot of the metrics to this file every minute.")
+parser.add_argument("--async", dest="use_async", action="store_true",
+                    help="Run the bot on a single asyncio event loop with asyncpraw instead of threads.")
+parser.set_defaults(test=False, clear_db=False, use_async=False)
 
 if __name__ == "__main__":
     args = parser.parse_args()
     if args.test:
         print("Running in test mode.")
-        initialize_test()
+    initialize(args.test)
     if args.clear_db:
         print("Clearing DB.")
-        db.truncate()
-    main()
+        db.clear()
+    if args.migrate_tinydb:
+        print(f"Migrated {migrate_tinydb(args.migrate_tinydb, db)} submissions from {args.migrate_tinydb}.")
+    if args.metrics_port or args.metrics_json:
+        metrics.enabled = True
+    if args.metrics_port:
+        metrics.start_http_server(args.metrics_port)
+    if args.metrics_json:
+        metrics.start_json_snapshots(args.metrics_json)
+    if args.use_async:
+        main_async()
+    else:
+        main()
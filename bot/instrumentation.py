@@ -0,0 +1,35 @@
+"""
+Metrics recorded by both bot runtimes.
+"""
+from lib.metrics import registry as metrics
+
+reddit_requests = metrics.counter("reddit_requests_total", "Requests made to the Reddit API.")
+reddit_request_seconds = metrics.histogram("reddit_request_seconds", "Duration of Reddit API requests.")
+reddit_ratelimit_wait_seconds = metrics.histogram("reddit_ratelimit_wait_seconds",
+                                                  "Time requests waited for the rate governor.")
+reddit_ratelimit_remaining = metrics.gauge("reddit_ratelimit_remaining",
+                                           "Requests left in the current Reddit rate limit window.")
+submission_passes = metrics.counter("submission_passes_total", "Submission analysis passes.")
+submission_errors = metrics.counter("submission_errors_total", "Submission analysis passes that failed.")
+submission_pass_seconds = metrics.histogram("submission_pass_seconds", "Duration of a submission analysis pass.")
+submission_passes_skipped = metrics.counter(
+    "submission_passes_skipped_total", "Submission analysis passes skipped because the number of comments didn't change.")
+submissions_refreshed = metrics.counter("submissions_refreshed_total", "Submissions refreshed in batches with /api/info.")
+tracked_submissions_gauge = metrics.gauge("tracked_submissions", "Submissions tracked by the scheduler.")
+comments_queue_depth = metrics.gauge("comments_queue_depth", "Comment tasks waiting to be written.")
+comments_coalesced = metrics.counter("comment_tasks_coalesced_total",
+                                     "Comment tasks replaced by a newer task for the same submission.")
+comment_edits_skipped = metrics.counter("comment_edits_skipped_total",
+                                        "Comment edits skipped because the results didn't change.")
+comment_throttle_seconds = metrics.histogram("comment_throttle_seconds",
+                                             "Time the comment worker waited before writing a comment.")
+comment_tasks = {action: metrics.counter("comment_tasks_total", "Comments written by the bot.", {"action": action})
+                 for action in ("edit", "reply")}
+stream_items = {stream: metrics.counter("stream_items_total", "Items read from the streams.", {"stream": stream})
+                for stream in ("comments", "inbox")}
+stream_summons = {stream: metrics.counter("stream_summons_total", "Summons found in the streams.", {"stream": stream})
+                  for stream in ("comments", "inbox")}
+
+
+def record_restart(worker: str, delay: float):
+    metrics.counter("worker_restarts_total", "Restarts of crashed bot workers.", {"worker": worker}).inc()
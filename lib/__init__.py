@@ -1,4 +1,16 @@
-from .coingecko import (CoinMarket, get_cg_coins_list, get_cg_coins_markets,
-                       get_most_popular_coin_with_ticker,
-                       get_symbols_names_dict)
-from .reddit_comments_crypto_counter import analyze_comments
+from .catalog import CoinCatalog, CoinRecord
+from .coingecko import (CoinGeckoCache, CoinIndex, CoinMarket,
+                        get_cg_coins_list,
+                        get_cg_coins_markets, get_coin_index,
+                        get_most_popular_coin_with_ticker,
+                        get_symbols_names_dict)
+from .matcher import NameMatcher
+from .reddit_comments_crypto_counter import (SubmissionAnalysis,
+                                             analyze_comments,
+                                             analyze_comments_incremental,
+                                             count_tickers,
+                                             get_analysis_etag,
+                                             get_comment_tickers,
+                                             is_analysis_current,
+                                             iter_comments, tokenize_comments,
+                                             update_analysis)
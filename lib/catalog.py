@@ -0,0 +1,171 @@
+import pickle
+import sys
+import zlib
+from collections.abc import Mapping
+from functools import lru_cache
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Union, overload
+
+
+class _Missing:
+    def __reduce__(self) -> str:
+        # Unpickle as the module's singleton, records compare against it by identity.
+        return "_missing"
+
+
+_missing: Any = _Missing()
+
+
+class _ExtraChunk:
+    """
+    The fields of a run of records that aren't slots, as one compressed pickle.
+    """
+
+    __slots__ = ("data", "__weakref__")
+
+    def __init__(self, extras: List[Dict[str, Any]]):
+        self.data = zlib.compress(pickle.dumps(extras, protocol=pickle.HIGHEST_PROTOCOL), 1)
+
+    def __reduce__(self):
+        return _restore_chunk, (self.data, )
+
+
+def _restore_chunk(data: bytes) -> _ExtraChunk:
+    chunk = _ExtraChunk.__new__(_ExtraChunk)
+    chunk.data = data
+    return chunk
+
+
+@lru_cache(maxsize=4)
+def _load_chunk(chunk: _ExtraChunk) -> List[Dict[str, Any]]:
+    return pickle.loads(zlib.decompress(chunk.data))
+
+
+class CoinRecord(Mapping):
+    """
+    Compact CoinGecko coin with only the fields used for counting and rendering as slots.
+
+    The other fields of the CoinGecko record are kept compressed with those of neighbouring records and only
+    decoded when accessed, so a record can still be read like the `CoinMarket` dict it was built from.
+    """
+
+    __slots__ = ("id", "symbol", "name", "market_cap", "_chunk", "_offset")
+
+    fields = ("id", "symbol", "name", "market_cap")
+
+    def __init__(self, id: str, symbol: str, name: str, market_cap: Optional[int] = _missing,
+                 chunk: Optional[_ExtraChunk] = None, offset: int = 0):
+        self.id = id
+        self.symbol = symbol
+        self.name = name
+        self.market_cap = market_cap
+        self._chunk = chunk
+        self._offset = offset
+
+    def _extra(self) -> Dict[str, Any]:
+        return _load_chunk(self._chunk)[self._offset] if self._chunk else {}
+
+    def full(self) -> Dict[str, Any]:
+        """
+        Return the complete CoinGecko record as a dict.
+        """
+        coin = {"id": self.id, "symbol": self.symbol, "name": self.name}
+        if self.market_cap is not _missing:
+            coin["market_cap"] = self.market_cap
+        coin.update(self._extra())
+        return coin
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self.fields:
+            value = getattr(self, key)
+            if value is not _missing:
+                return value
+            raise KeyError(key)
+        return self._extra()[key]
+
+    def __contains__(self, key: object) -> bool:
+        if key in self.fields:
+            return getattr(self, key) is not _missing
+        return key in self._extra()
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.full())
+
+    def __len__(self) -> int:
+        return len(self.full())
+
+    def __bool__(self) -> bool:
+        # A record always has its slots, don't let truthiness checks decode the chunk through `__len__`.
+        return True
+
+    def __repr__(self) -> str:
+        return f"CoinRecord(id={self.id!r}, symbol={self.symbol!r}, name={self.name!r}, market_cap={self.get('market_cap')!r})"
+
+    def __reduce__(self):
+        return CoinRecord, (self.id, self.symbol, self.name, self.market_cap, self._chunk, self._offset)
+
+
+class CoinCatalog(Sequence):
+    """
+    Read-only list of `CoinRecord`s that replaces lists of `CoinMarket` dicts.
+
+    With `keep_full=False` the remaining CoinGecko fields are dropped instead of kept compressed in chunks of
+    `chunk_size` records.
+    """
+
+    def __init__(self, coins: Iterable[Mapping] = (), keep_full: bool = True, chunk_size: int = 256):
+        self.records: List[CoinRecord] = []
+        chunk: List[Mapping] = []
+        for coin in coins:
+            if isinstance(coin, CoinRecord):
+                self._add_chunk(chunk, keep_full)
+                chunk = []
+                self.records.append(coin)
+                continue
+            chunk.append(coin)
+            if len(chunk) == chunk_size:
+                self._add_chunk(chunk, keep_full)
+                chunk = []
+        self._add_chunk(chunk, keep_full)
+
+    def _add_chunk(self, coins: List[Mapping], keep_full: bool):
+        if not coins:
+            return
+        fields = CoinRecord.fields
+        extras = [{key: value for key, value in coin.items() if key not in fields} for coin in coins]
+        chunk = _ExtraChunk(extras) if keep_full and any(extras) else None
+        intern = sys.intern
+        self.records.extend(
+            CoinRecord(intern(coin["id"]), intern(coin["symbol"]), intern(coin["name"]),
+                       coin.get("market_cap", _missing), chunk, offset)
+            for offset, coin in enumerate(coins))
+
+    @overload
+    def __getitem__(self, index: int) -> CoinRecord: ...
+    @overload
+    def __getitem__(self, index: slice) -> "CoinCatalog": ...
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[CoinRecord, "CoinCatalog"]:
+        if isinstance(index, slice):
+            return CoinCatalog(self.records[index])
+        return self.records[index]
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __iter__(self) -> Iterator[CoinRecord]:
+        return iter(self.records)
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, (CoinCatalog, list)):
+            return self.records == list(other)
+        return NotImplemented
+
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        """
+        Return the complete CoinGecko records as a list of dicts, for callers that need to modify them.
+        """
+        return [record.full() for record in self.records]
+
+
+def get_coin_catalog(coins: Union[CoinCatalog, Iterable[Mapping]]) -> CoinCatalog:
+    return coins if isinstance(coins, CoinCatalog) else CoinCatalog(coins)
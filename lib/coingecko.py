@@ -1,8 +1,23 @@
-from typing import Any, Dict, List, Optional, TypedDict, Union
+import itertools
+import os
+import pickle
+import threading
+import time
+from typing import (TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple,
+                    TypedDict, Union)
 
-from pycoingecko import CoinGeckoAPI
+from .catalog import CoinCatalog, CoinRecord, get_coin_catalog
+from .matcher import NameMatcher
+from .metrics import registry
 
-cg = CoinGeckoAPI()
+if TYPE_CHECKING:
+    from pycoingecko import CoinGeckoAPI
+
+# Same as `CoinGeckoAPI().api_base_url` without an API key.
+coingecko_api_url = "https://api.coingecko.com/api/v3/"
+
+_cg: Optional["CoinGeckoAPI"] = None
+_cg_lock = threading.Lock()
 
 
 class CoinMarket(TypedDict):
@@ -33,25 +48,140 @@ class CoinMarket(TypedDict):
     last_updated: str
 
 
-def get_cg_coins_markets(vs_currency: str = "usd", limit: int = 1000) -> List[CoinMarket]:
-    coins = []
-    page = 1
-    while len(coins) < limit:
-        res = cg.get_coins_markets(vs_currency, per_page=250)
-        if len(res) == 0:
+def configure_session(api: "CoinGeckoAPI", pool_size: int = 8, retries: int = 5):
+    """
+    Mount a pooled HTTP adapter on the API's session that backs off on HTTP 429 and 5xx responses.
+    """
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    retry = Retry(total=retries, backoff_factor=1, status_forcelist=[429, 502, 503, 504],
+                  respect_retry_after_header=True)
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=pool_size, pool_maxsize=pool_size)
+    api.session.mount("http://", adapter)
+    api.session.mount("https://", adapter)
+
+
+def get_cg() -> "CoinGeckoAPI":
+    """
+    Return the shared CoinGecko client, which is created on first use so that importing `lib` doesn't load
+    pycoingecko and requests.
+    """
+    global _cg
+    with _cg_lock:
+        if _cg is None:
+            from pycoingecko import CoinGeckoAPI
+
+            _cg = CoinGeckoAPI()
+            configure_session(_cg)
+    return _cg
+
+
+def __getattr__(name: str) -> Any:
+    # `cg` used to be created on import.
+    if name == "cg":
+        return get_cg()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+coingecko_markets_requests = registry.counter(
+    "coingecko_requests_total", "Requests made to the CoinGecko API.", {"endpoint": "coins/markets"})
+coingecko_list_requests = registry.counter(
+    "coingecko_requests_total", "Requests made to the CoinGecko API.", {"endpoint": "coins/list"})
+
+
+def _get_coins_markets_page(api: "CoinGeckoAPI", vs_currency: str, page: int, per_page: int) -> List[Dict]:
+    # HTTP 429 and 5xx responses are retried by the adapter mounted in `configure_session`.
+    coingecko_markets_requests.inc()
+    return api.get_coins_markets(vs_currency, per_page=per_page, page=page)
+
+
+def get_cg_coins_markets(vs_currency: str = "usd", limit: int = 1000,
+                         api: "CoinGeckoAPI" = None, workers: int = 4) -> List[CoinMarket]:
+    """
+    Download the top `limit` coins by market cap, fetching up to `workers` pages at a time. A custom `api`
+    should be set up with `configure_session` to back off on rate limits.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    if limit < 1:
+        return []
+    api = api or get_cg()
+    workers = max(1, workers)
+    per_page = min(250, limit)
+    pages = -(-limit // per_page)
+    coins: List[CoinMarket] = []
+    seen = set()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for first_page in range(1, pages + 1, workers):
+            wave = range(first_page, min(first_page + workers, pages + 1))
+            last_page = False
+            for res in executor.map(lambda page: _get_coins_markets_page(api, vs_currency, page, per_page), wave):
+                for coin in res:
+                    if coin["id"] not in seen:
+                        seen.add(coin["id"])
+                        coins.append(CoinMarket(**coin))
+                if len(res) < per_page:
+                    last_page = True
+                    break
+            if last_page:
+                break
+
+    return coins[:limit]
+
+
+async def get_cg_coins_markets_async(session: Any, vs_currency: str = "usd", limit: int = 1000,
+                                     workers: int = 4, retries: int = 5, backoff: float = 1,
+                                     max_backoff: float = 60, base_url: str = coingecko_api_url) -> List[CoinMarket]:
+    """
+    Download the top `limit` coins by market cap with an `aiohttp.ClientSession`, like `get_cg_coins_markets`.
+    """
+    import asyncio
+
+    if limit < 1:
+        return []
+    workers = max(1, workers)
+    per_page = min(250, limit)
+    pages = -(-limit // per_page)
+
+    async def get_page(page: int) -> List[Dict]:
+        params = {"vs_currency": vs_currency, "per_page": str(per_page), "page": str(page)}
+        for attempt in range(retries + 1):
+            coingecko_markets_requests.inc()
+            async with session.get(f"{base_url}coins/markets", params=params) as response:
+                if response.status != 429 or attempt == retries:
+                    response.raise_for_status()
+                    return await response.json()
+            await asyncio.sleep(min(max_backoff, backoff * 2 ** attempt))
+        return []
+
+    coins: List[CoinMarket] = []
+    seen = set()
+    for first_page in range(1, pages + 1, workers):
+        wave = range(first_page, min(first_page + workers, pages + 1))
+        last_page = False
+        for res in await asyncio.gather(*(get_page(page) for page in wave)):
+            for coin in res:
+                if coin["id"] not in seen:
+                    seen.add(coin["id"])
+                    coins.append(CoinMarket(**coin))
+            if len(res) < per_page:
+                last_page = True
+                break
+        if last_page:
             break
-        for coin in res:
-            coins.append(CoinMarket(**coin))
-        page += 1
 
-    return coins
+    return coins[:limit]
 
 
-def get_cg_coins_list():
-    return cg.get_coins_list()
+def get_cg_coins_list(api: "CoinGeckoAPI" = None):
+    coingecko_list_requests.inc()
+    return (api or get_cg()).get_coins_list()
 
 
-def get_symbols_names_dict(cg_coins_list: Optional[List[Union[CoinMarket, Dict]]]):
+def get_symbols_names_dict(cg_coins_list: Optional[Union["CoinIndex", List[Union[CoinMarket, Dict]]]]):
+    if isinstance(cg_coins_list, CoinIndex):
+        return cg_coins_list.names
     cg_coins_list = cg_coins_list or get_cg_coins_list()
     cg_dict = {}
     for coin in cg_coins_list:
@@ -61,18 +191,242 @@ def get_symbols_names_dict(cg_coins_list: Optional[List[Union[CoinMarket, Dict]]
     return cg_dict
 
 
+def _pick_popular_coin(coin: Optional[Union[CoinMarket, Dict]],
+                       c: Union[CoinMarket, Dict]) -> Union[CoinMarket, Dict]:
+    if coin is not None:
+        if "Binance-Peg" in coin["name"]:
+            coin = c
+        if "market_cap" in coin and "market_cap" in c:
+            if coin["market_cap"] < c["market_cap"]:
+                coin = c
+    else:
+        coin = c
+    return coin
+
+
 def get_most_popular_coin_with_ticker(
-        ticker: str, cg_coins_list: Optional[List[Union[CoinMarket, Dict]]]) -> Optional[Union[CoinMarket, Dict]]:
+        ticker: str, cg_coins_list: Optional[Union["CoinIndex", List[Union[CoinMarket, Dict]]]]) -> Optional[Union[CoinMarket, Dict]]:
+    if isinstance(cg_coins_list, CoinIndex):
+        return cg_coins_list.get_most_popular_coin(ticker)
     cg_coins_list = cg_coins_list or get_cg_coins_list()
     coin: Union[CoinMarket, Dict] = None
     for c in cg_coins_list:
         if ticker.lower() == c["symbol"].lower():
-            if coin:
-                if "Binance-Peg" in coin["name"]:
-                    coin = c
-                if "market_cap" in coin and "market_cap" in c:
-                    if coin["market_cap"] < c["market_cap"]:
-                        coin = c
-            else:
-                coin = c
+            coin = _pick_popular_coin(coin, c)
     return coin
+
+
+_snapshot_ids = itertools.count(1)
+
+
+class CoinIndex:
+    """
+    Lookup tables over a CoinGecko market or coins list, built once so that ticker and name lookups are O(1).
+    The coins are kept as a compact `CoinCatalog`.
+
+    `names` maps lowercase symbols to lowercase coin names like `get_symbols_names_dict`,
+    and `get_most_popular_coin` applies the same rules as `get_most_popular_coin_with_ticker`.
+    """
+
+    def __init__(self, cg_coins_list: Union[CoinCatalog, List[Union[CoinMarket, Dict]]]):
+        self.coins = get_coin_catalog(cg_coins_list)
+        # Identifies the market data snapshot, `CoinGeckoCache` reuses the index while the data is unchanged.
+        self.snapshot_id = next(_snapshot_ids)
+        self.names: Dict[str, str] = {}
+        self._popular: Dict[str, CoinRecord] = {}
+        self._name_matcher: Optional[NameMatcher] = None
+        self._etag: Optional[str] = None
+        for coin in self.coins:
+            symbol = coin["symbol"].lower()
+            if symbol not in self.names:
+                self.names[symbol] = coin["name"].lower()
+            self._popular[symbol] = _pick_popular_coin(self._popular.get(symbol), coin)
+
+    def __contains__(self, ticker: str) -> bool:
+        return ticker.lower() in self.names
+
+    def __len__(self) -> int:
+        return len(self.coins)
+
+    @property
+    def etag(self) -> str:
+        """
+        Content hash of the symbols and names that tokenizing depends on, which stays the same across processes
+        and market data refreshes that only change prices.
+        """
+        if self._etag is None:
+            import hashlib
+
+            names = "\n".join(f"{symbol}\t{name}" for symbol, name in sorted(self.names.items()))
+            self._etag = hashlib.sha1(names.encode()).hexdigest()
+        return self._etag
+
+    @property
+    def name_matcher(self) -> NameMatcher:
+        if self._name_matcher is None:
+            self._name_matcher = NameMatcher(self.names)
+        return self._name_matcher
+
+    def get_most_popular_coin(self, ticker: str) -> Optional[CoinRecord]:
+        return self._popular.get(ticker.lower())
+
+
+def get_coin_index(cg_coins_list: Optional[Union[CoinIndex, List[Union[CoinMarket, Dict]]]]) -> CoinIndex:
+    if isinstance(cg_coins_list, CoinIndex):
+        return cg_coins_list
+    return CoinIndex(cg_coins_list or get_cg_coins_list())
+
+
+class CacheEntry(TypedDict):
+    fetched_at: float
+    etag: str
+    data: CoinCatalog
+
+
+class CoinGeckoCache:
+    """
+    On-disk cache of the CoinGecko market data and coins list shared by the CLI and the bot.
+
+    Entries are pickled to `path` and served until they are older than `ttl` seconds. Stale entries
+    are still served while a background thread downloads a fresh copy. Each entry carries a content
+    hash (`etag`), so a refresh that returns the same data keeps the existing `CoinIndex`. The data is
+    held and pickled as a `CoinCatalog`.
+
+    A failed background refresh is logged and retried after `retry_after` seconds, doubling up to `ttl`
+    with every further failure, so an unavailable or rate-limiting API isn't asked again on every lookup.
+    """
+
+    version = 2
+
+    def __init__(self, path: str = "coingecko_cache.pickle", ttl: float = 60 * 60,
+                 api: "CoinGeckoAPI" = None, vs_currency: str = "usd", limit: int = 1000,
+                 clock: Callable[[], float] = time.time, retry_after: float = 60):
+        self.path = path
+        self.ttl = ttl
+        self.retry_after = retry_after
+        self.api = api
+        self.vs_currency = vs_currency
+        self.limit = limit
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._entries: Dict[str, CacheEntry] = {}
+        self._indexes: Dict[str, Tuple[str, CoinIndex]] = {}
+        self._refreshing: Dict[str, threading.Thread] = {}
+        # Number of consecutive failed background refreshes and the time of the last one, per key.
+        self._failures: Dict[str, Tuple[int, float]] = {}
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "rb") as f:
+                cached = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return
+        if isinstance(cached, dict) and cached.get("version") == self.version:
+            self._entries = cached["entries"]
+
+    def _save(self):
+        with self._lock:
+            cached = {"version": self.version, "entries": dict(self._entries)}
+        tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(cached, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.path)
+
+    def _fetch(self, key: str) -> List[Union[CoinMarket, Dict]]:
+        if key == "markets":
+            return get_cg_coins_markets(self.vs_currency, self.limit, self.api)
+        return get_cg_coins_list(self.api)
+
+    def refresh(self, key: str = "markets") -> CacheEntry:
+        """
+        Download `key` ("markets" or "coins_list") and store it, regardless of its age.
+        """
+        return self.store(key, self._fetch(key))
+
+    def store(self, key: str, data: List[Union[CoinMarket, Dict]]) -> CacheEntry:
+        """
+        Store data downloaded elsewhere, e.g. by `get_cg_coins_markets_async`, as a fresh entry for `key`.
+        """
+        import hashlib
+
+        etag = hashlib.sha1(pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)).hexdigest()
+        with self._lock:
+            entry = self._entries.get(key)
+        catalog = entry["data"] if entry and entry["etag"] == etag else get_coin_catalog(data)
+        with self._lock:
+            entry = CacheEntry(fetched_at=self.clock(), etag=etag, data=catalog)
+            self._entries[key] = entry
+        self._save()
+        return entry
+
+    def _refresh_in_background(self, key: str):
+        def target():
+            try:
+                self.refresh(key)
+            except Exception:
+                import logging
+
+                with self._lock:
+                    failures, _ = self._failures.get(key, (0, 0))
+                    self._failures[key] = (failures + 1, self.clock())
+                logging.getLogger(__name__).exception(
+                    f"Failed to refresh CoinGecko {key}, retrying in {self._retry_delay(key):.0f} seconds.")
+            else:
+                with self._lock:
+                    self._failures.pop(key, None)
+            finally:
+                with self._lock:
+                    self._refreshing.pop(key, None)
+
+        with self._lock:
+            if key in self._refreshing:
+                return
+            if key in self._failures and self.clock() - self._failures[key][1] < self._retry_delay(key):
+                return
+            thread = threading.Thread(target=target, name=f"CoinGeckoCache-{key}")
+            self._refreshing[key] = thread
+        thread.start()
+
+    def _retry_delay(self, key: str) -> float:
+        failures, _ = self._failures.get(key, (0, 0))
+        return min(self.retry_after * 2 ** max(failures - 1, 0), max(self.ttl, self.retry_after))
+
+    def _get(self, key: str) -> CacheEntry:
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            return self.refresh(key)
+        if self.clock() - entry["fetched_at"] > self.ttl:
+            self._refresh_in_background(key)
+        return entry
+
+    def is_stale(self, key: str = "markets") -> bool:
+        with self._lock:
+            entry = self._entries.get(key)
+        return entry is None or self.clock() - entry["fetched_at"] > self.ttl
+
+    def wait(self):
+        """
+        Block until running background refreshes are done.
+        """
+        with self._lock:
+            threads = list(self._refreshing.values())
+        for thread in threads:
+            thread.join()
+
+    def get_coins_markets(self) -> CoinCatalog:
+        return self._get("markets")["data"]
+
+    def get_coins_list(self) -> CoinCatalog:
+        return self._get("coins_list")["data"]
+
+    def get_coin_index(self, key: str = "markets") -> CoinIndex:
+        entry = self._get(key)
+        with self._lock:
+            etag, index = self._indexes.get(key, (None, None))
+        if etag != entry["etag"]:
+            index = CoinIndex(entry["data"])
+            with self._lock:
+                self._indexes[key] = (entry["etag"], index)
+        return index
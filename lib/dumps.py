@@ -0,0 +1,137 @@
+import gzip
+import io
+import json
+from collections import deque
+from typing import (Collection, Deque, Dict, Iterable, Iterator, List, Optional,
+                    TextIO, Tuple, Union)
+
+from .coingecko import *
+from .reddit_comments_crypto_counter import (batched, count_tickers,
+                                             rank_cryptos, tokenize_batches)
+from .trends import TrendTracker
+
+# Pushshift dumps are compressed with a long window that needs to be allowed explicitly.
+zstd_max_window_size = 2 ** 31
+
+
+def open_dump(path: str) -> TextIO:
+    """
+    Open a newline-delimited JSON dump for streaming, decompressing `.zst` and `.gz` files on the fly.
+    """
+    if path.endswith(".zst"):
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("Reading .zst dumps requires the zstandard package: pip install zstandard")
+        f = open(path, "rb")
+        reader = zstandard.ZstdDecompressor(max_window_size=zstd_max_window_size).stream_reader(f, closefd=True)
+        return io.TextIOWrapper(reader, encoding="utf-8", errors="replace")
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", errors="replace")
+    return open(path, "r", encoding="utf-8", errors="replace")
+
+
+def iter_dump_comments(path: str) -> Iterator[Dict]:
+    """
+    Yield the comments of a dump one at a time, skipping lines that aren't JSON objects with a body.
+    """
+    with open_dump(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                comment = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(comment, dict) and isinstance(comment.get("body"), str):
+                yield comment
+
+
+def _filter_authors(comments: Iterable[Dict], ignore_authors: Collection[str]) -> Iterator[Dict]:
+    ignore_authors = {author.lower() for author in ignore_authors}
+    for comment in comments:
+        if str(comment.get("author", "")).lower() not in ignore_authors:
+            yield comment
+
+
+def analyze_dump(path: str,
+                 cg_coins_list: Union[CoinIndex, List[Union[CoinMarket, Dict]]] = None,
+                 ignore_authors: Collection[str] = (),
+                 ignore_english_words: bool = True,
+                 processes: int = 1) -> Tuple[List[Tuple[str, int]], int]:
+    """
+    Count the crypto mentions of all comments in a dump, like `analyze_comments` does for a submission.
+    """
+    coin_index = get_coin_index(cg_coins_list)
+    bodies = (comment["body"] for comment in _filter_authors(iter_dump_comments(path), ignore_authors))
+    cryptos, comments_analyzed = count_tickers(bodies, coin_index, ignore_english_words, processes=processes)
+    return rank_cryptos(cryptos), comments_analyzed
+
+
+def analyze_dump_by_submission(path: str,
+                               cg_coins_list: Union[CoinIndex, List[Union[CoinMarket, Dict]]] = None,
+                               ignore_authors: Collection[str] = (),
+                               ignore_english_words: bool = True,
+                               batch_size: int = 1000,
+                               processes: int = 1) -> Dict[str, Tuple[List[Tuple[str, int]], int]]:
+    """
+    Count the crypto mentions of a dump per submission (`link_id`) in a single pass.
+    """
+    coin_index = get_coin_index(cg_coins_list)
+    cryptos: Dict[str, Dict[str, int]] = {}
+    comments_analyzed: Dict[str, int] = {}
+    batches: Deque[List[Dict]] = deque()
+
+    def body_batches() -> Iterator[List[str]]:
+        for batch in batched(_filter_authors(iter_dump_comments(path), ignore_authors), batch_size):
+            batches.append(batch)
+            yield [comment["body"] for comment in batch]
+
+    for tickers_per_comment in tokenize_batches(body_batches(), coin_index, ignore_english_words, processes):
+        for comment, tickers in zip(batches.popleft(), tickers_per_comment):
+            link_id: Optional[str] = comment.get("link_id")
+            if not link_id:
+                continue
+            comments_analyzed[link_id] = comments_analyzed.get(link_id, 0) + 1
+            submission_cryptos = cryptos.setdefault(link_id, {})
+            for ticker in tickers:
+                submission_cryptos[ticker] = submission_cryptos.get(ticker, 0) + 1
+    return {link_id: (rank_cryptos(cryptos[link_id]), count) for link_id, count in comments_analyzed.items()}
+
+
+def analyze_dump_trends(path: str,
+                        cg_coins_list: Union[CoinIndex, List[Union[CoinMarket, Dict]]] = None,
+                        ignore_authors: Collection[str] = (),
+                        window: float = 60 * 60,
+                        buckets: int = 12,
+                        ignore_english_words: bool = True,
+                        batch_size: int = 1000,
+                        processes: int = 1,
+                        max_submissions: int = 1000) -> TrendTracker:
+    """
+    Count the crypto mentions of a dump per time bucket by `created_utc`, across all comments and per submission,
+    in windows that end with the newest comment. Comments without a `created_utc` are skipped.
+    """
+    coin_index = get_coin_index(cg_coins_list)
+    tracker = TrendTracker(window, buckets, max_submissions)
+    batches: Deque[List[Dict]] = deque()
+
+    def body_batches() -> Iterator[List[str]]:
+        comments = (comment for comment in _filter_authors(iter_dump_comments(path), ignore_authors)
+                    if comment.get("created_utc") is not None)
+        for batch in batched(comments, batch_size):
+            batches.append(batch)
+            yield [comment["body"] for comment in batch]
+
+    for tickers_per_comment in tokenize_batches(body_batches(), coin_index, ignore_english_words, processes):
+        for comment, tickers in zip(batches.popleft(), tickers_per_comment):
+            created_utc = float(comment["created_utc"])
+            if link_id := comment.get("link_id"):
+                tracker.add(link_id, tickers, created_utc)
+            else:
+                tracker.total.add(tickers, created_utc)
+    if tracker.total.latest is not None:
+        # Align the submission windows with the newest comment of the dump.
+        tracker.advance(tracker.total.latest * tracker.total.bucket_seconds)
+    return tracker
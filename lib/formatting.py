@@ -1,24 +1,227 @@
-from typing import Dict, List, Optional, Tuple, Union
+import threading
+from typing import Dict, List, Optional, Tuple, TypedDict, Union
 
 from .coingecko import *
+from .trends import Trend
+
+table_formats = ("markdown", "text", "json")
+
+markdown_header = [
+    "Nr. | Count | Name | Ticker | Market Cap (USD) | Link",
+    ":--- |----:|:----|:------:|--------------:|:----",
+]
+
+
+class RankedCoin(TypedDict):
+    rank: int
+    ticker: str
+    count: int
+    id: str
+    name: str
+    market_cap: int
+
+
+trend_markdown_header = [
+    "Nr. | Count | Change | Rank | Name | Ticker | Market Cap (USD) | Link",
+    ":--- |----:|----:|:----:|:----|:------:|--------------:|:----",
+]
+
+
+class TrendingCoin(RankedCoin):
+    previous: int
+    change: int
+    velocity: float
+    rank_delta: Optional[int]
+
+
+class TableSnapshot:
+    """
+    Ranked crypto mentions resolved against one market data snapshot, ready to be rendered in any format.
+    """
+
+    def __init__(self, renderer: "TableRenderer", entries: List[Tuple[int, int, RankedCoin]], missing: List[str],
+                 snapshot_id: int):
+        self.renderer = renderer
+        # Rank, count and resolved coin of each row.
+        self.entries = entries
+        self.missing = missing
+        self.snapshot_id = snapshot_id
+
+    @property
+    def coins(self) -> List[RankedCoin]:
+        return [RankedCoin(**{**coin, "rank": rank, "count": count}) for rank, count, coin in self.entries]
+
+    def render(self, format: str = "markdown") -> str:
+        if format == "json":
+            import json
+
+            return json.dumps(self.coins)
+        if format not in table_formats:
+            raise ValueError(f"Unknown table format {format!r}, expected one of {', '.join(table_formats)}.")
+        get_row = self.renderer.get_row
+        rows = [f"{rank}. {get_row(coin, count, format, self.snapshot_id)}" for rank, count, coin in self.entries]
+        if format == "markdown":
+            return "\n".join(markdown_header + rows)
+        return "\n\n".join(rows)
+
+    def markdown(self) -> str:
+        return self.render("markdown")
+
+    def text(self) -> str:
+        return self.render("text")
+
+    def json(self) -> str:
+        return self.render("json")
+
+
+class _RenderCache:
+    """
+    Coins resolved for each ticker and formatted rows of one `CoinIndex` snapshot.
+    """
+
+    __slots__ = ("snapshot_id", "coins", "rows")
+
+    def __init__(self, snapshot_id: Optional[int]):
+        self.snapshot_id = snapshot_id
+        self.coins: Dict[str, Optional[RankedCoin]] = {}
+        self.rows: Dict[Tuple[str, str, int], str] = {}
+
+
+class TableRenderer:
+    """
+    Renders ranked crypto mentions as markdown, plain text or JSON, caching the coin resolved for each ticker
+    and each formatted row by ticker, count and `CoinIndex.snapshot_id`. Rows whose count didn't change are
+    reused as is, only their rank is formatted again. The caches are dropped when a new snapshot is rendered,
+    or once they hold `max_rows` entries.
+
+    The caches of a snapshot are swapped as a whole under a lock, so threads rendering different snapshots
+    only ever fill the caches of their own snapshot.
+    """
+
+    def __init__(self, max_rows: int = 100000):
+        self.max_rows = max_rows
+        self._lock = threading.Lock()
+        self._cache = _RenderCache(None)
+
+    def _use_snapshot(self, snapshot_id: int) -> _RenderCache:
+        with self._lock:
+            cache = self._cache
+            if snapshot_id != cache.snapshot_id or len(cache.rows) > self.max_rows:
+                cache = self._cache = _RenderCache(snapshot_id)
+            return cache
+
+    def snapshot(self, ranked: List[Tuple[str, int]],
+                 cg_coins_list: Optional[Union[CoinIndex, List[Union[CoinMarket, Dict]]]], top: int = 100) -> TableSnapshot:
+        """
+        Resolve the `top` ranked tickers to their coins. Like `get_markdown_table`, tickers without a coin keep
+        their rank but are left out.
+        """
+        coin_index = get_coin_index(cg_coins_list)
+        resolved = self._use_snapshot(coin_index.snapshot_id).coins
+        entries: List[Tuple[int, int, RankedCoin]] = []
+        missing: List[str] = []
+        for rank, (ticker, count) in enumerate(ranked[:top], 1):
+            try:
+                coin = resolved[ticker]
+            except KeyError:
+                market = coin_index.get_most_popular_coin(ticker)
+                coin = resolved[ticker] = RankedCoin(
+                    rank=0, ticker=ticker.upper(), count=0, id=market["id"], name=market["name"],
+                    market_cap=market["market_cap"]) if market is not None else None
+            if coin:
+                entries.append((rank, count, coin))
+            else:
+                missing.append(ticker)
+        return TableSnapshot(self, entries, missing, coin_index.snapshot_id)
+
+    def get_row(self, coin: RankedCoin, count: int, format: str, snapshot_id: int) -> str:
+        """
+        Return the row of `coin` with `count` mentions in `format`, without its rank.
+        """
+        key = (format, coin["ticker"], count)
+        cache = self._cache
+        rows = cache.rows if snapshot_id == cache.snapshot_id else None
+        row = rows.get(key) if rows is not None else None
+        if row is None:
+            if format == "markdown":
+                row = f"| {count} | {coin['name']} | {coin['ticker']} | ${coin['market_cap']:,} | " + \
+                    f"[CoinGecko ↗](https://www.coingecko.com/en/coins/{coin['id']})"
+            else:
+                row = f"{coin['name']} ({coin['ticker']}) - {count} (Market Cap: ${coin['market_cap']:,})"
+            if rows is not None:
+                rows[key] = row
+        return row
+
+    def render(self, ranked: List[Tuple[str, int]],
+               cg_coins_list: Optional[Union[CoinIndex, List[Union[CoinMarket, Dict]]]],
+               top: int = 100, format: str = "markdown") -> str:
+        return self.snapshot(ranked, cg_coins_list, top).render(format)
+
+
+table_renderer = TableRenderer()
 
 
 def get_markdown_table(ranked: List[Tuple[str, int]],
-                       cg_coins_list: Optional[List[Union[CoinMarket, Dict]]], top: int = 100) -> str:
+                       cg_coins_list: Optional[Union[CoinIndex, List[Union[CoinMarket, Dict]]]], top: int = 100) -> str:
     """
     Return a markdown table of the given list of ranked crypto mentions.
     """
-    cg_coins_list = cg_coins_list or get_cg_coins_list()
-    lines = []
-    lines.append("Nr. | Count | Name | Ticker | Market Cap (USD) | Link")
-    lines.append(":--- |----:|:----|:------:|--------------:|:----")
-    for rank, (ticker, count) in enumerate(ranked):
-        if rank > top - 1:
-            break
-        coin: CoinMarket = get_most_popular_coin_with_ticker(ticker, cg_coins_list)
-        if not coin:
-            print("No coin found for ticker:", ticker)
-        else:
-            lines.append(
-                f"{rank + 1}. | {count} | {coin['name']} | {ticker.upper()} | ${coin['market_cap']:,} | [CoinGecko ↗](https://www.coingecko.com/en/coins/{coin['id']})")
-    return "\n".join(lines)
+    snapshot = table_renderer.snapshot(ranked, cg_coins_list, top)
+    for ticker in snapshot.missing:
+        print("No coin found for ticker:", ticker)
+    return snapshot.markdown()
+
+
+def format_rank_delta(rank_delta: Optional[int]) -> str:
+    if rank_delta is None:
+        return "new"
+    return f"↑{rank_delta}" if rank_delta > 0 else f"↓{-rank_delta}" if rank_delta < 0 else "–"
+
+
+def get_trending_coins(trends: List[Trend],
+                       cg_coins_list: Optional[Union[CoinIndex, List[Union[CoinMarket, Dict]]]],
+                       top: int = 100) -> List[TrendingCoin]:
+    """
+    Resolve the `top` trends to their coins, tickers without a coin are left out like in `get_markdown_table`.
+    """
+    coin_index = get_coin_index(cg_coins_list)
+    coins: List[TrendingCoin] = []
+    for trend in trends[:top]:
+        market = coin_index.get_most_popular_coin(trend["ticker"])
+        if market is not None:
+            coins.append(TrendingCoin(**{**trend, "ticker": trend["ticker"].upper()}, id=market["id"],
+                                      name=market["name"], market_cap=market["market_cap"]))
+    return coins
+
+
+def get_trends_table(trends: List[Trend],
+                     cg_coins_list: Optional[Union[CoinIndex, List[Union[CoinMarket, Dict]]]],
+                     top: int = 100, format: str = "markdown") -> str:
+    """
+    Render the trends of a `MentionWindow` with their change since the previous window as markdown, text or JSON.
+    """
+    coins = get_trending_coins(trends, cg_coins_list, top)
+    if format == "json":
+        import json
+
+        return json.dumps(coins)
+    if format not in table_formats:
+        raise ValueError(f"Unknown table format {format!r}, expected one of {', '.join(table_formats)}.")
+    if format == "markdown":
+        return "\n".join(trend_markdown_header + [
+            f"{coin['rank']}. | {coin['count']} | {coin['change']:+d} | {format_rank_delta(coin['rank_delta'])} | " +
+            f"{coin['name']} | {coin['ticker']} | ${coin['market_cap']:,} | " +
+            f"[CoinGecko ↗](https://www.coingecko.com/en/coins/{coin['id']})" for coin in coins])
+    return "\n\n".join(
+        f"{coin['rank']}. {coin['name']} ({coin['ticker']}) - {coin['count']} " +
+        f"({coin['change']:+d}, rank {format_rank_delta(coin['rank_delta'])})" for coin in coins)
+
+
+def get_content_hash(text: str) -> str:
+    """
+    Return a hash of a comment's text that ignores its "Last updated" line, to tell if an edit would change anything.
+    """
+    import hashlib
+
+    lines = (line for line in text.splitlines() if not line.startswith("Last updated:"))
+    return hashlib.sha256("\n".join(lines).encode("utf-8")).hexdigest()
@@ -0,0 +1,84 @@
+from typing import Dict, Iterable, List, Set, Tuple
+
+
+class NameMatcher:
+    """
+    Aho-Corasick automaton that finds every coin name in a text in a single pass.
+
+    The automaton is compiled once from a `{symbol: name}` dictionary as returned by
+    `get_symbols_names_dict`, and `find` returns the symbols whose name occurs in the text.
+    By default names match anywhere in the text, which is the same as `name in text`.
+    With `word_boundaries=True` only matches that are not surrounded by letters or digits count.
+    """
+
+    def __init__(self, cg_dict: Dict[str, str], word_boundaries: bool = False):
+        self.word_boundaries = word_boundaries
+        # Symbols whose name is empty, `"" in text` is always true.
+        self._always: Set[str] = set()
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # Outputs per state as `(name length, symbols)`, including the outputs of the suffix states.
+        self._out: List[List[Tuple[int, Tuple[str, ...]]]] = [[]]
+
+        names: Dict[str, List[str]] = {}
+        for symbol, name in cg_dict.items():
+            if name:
+                names.setdefault(name, []).append(symbol)
+            else:
+                self._always.add(symbol)
+
+        for name, symbols in names.items():
+            self._add(name, tuple(symbols))
+        self._build()
+
+    def _add(self, name: str, symbols: Tuple[str, ...]):
+        state = 0
+        for char in name:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = next_state
+        self._out[state].append((len(name), symbols))
+
+    def _build(self):
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(char, 0)
+                self._fail[next_state] = fail
+                self._out[next_state] = self._out[next_state] + self._out[fail]
+
+    def find(self, text: str) -> Set[str]:
+        """
+        Return the symbols of all coin names found in the (already lowercased) text.
+        """
+        found = set(self._always)
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for end, char in enumerate(text, 1):
+            next_state = goto[state].get(char)
+            while next_state is None and state:
+                state = fail[state]
+                next_state = goto[state].get(char)
+            state = next_state or 0
+            if out[state]:
+                for length, symbols in out[state]:
+                    if self.word_boundaries and not self._is_word(text, end - length, end):
+                        continue
+                    found.update(symbols)
+        return found
+
+    def find_all(self, texts: Iterable[str]) -> List[Set[str]]:
+        return [self.find(text) for text in texts]
+
+    @staticmethod
+    def _is_word(text: str, start: int, end: int) -> bool:
+        return (start == 0 or not text[start - 1].isalnum()) and (end == len(text) or not text[end].isalnum())
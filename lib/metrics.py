@@ -0,0 +1,236 @@
+import bisect
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager, nullcontext
+from typing import (TYPE_CHECKING, Any, ContextManager, Dict, FrozenSet,
+                    Iterator, List, Optional, Tuple)
+
+if TYPE_CHECKING:
+    from http.server import ThreadingHTTPServer
+
+default_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+LabelSet = FrozenSet[Tuple[str, str]]
+
+
+class Metric(ABC):
+    kind = "untyped"
+
+    def __init__(self, registry: "MetricsRegistry", name: str, help: str, labels: LabelSet):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.lock = threading.Lock()
+
+    @abstractmethod
+    def samples(self) -> List[Tuple[str, LabelSet, float]]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, *args: Any):
+        super().__init__(*args)
+        self.value = 0.0
+
+    def inc(self, amount: float = 1):
+        if not self.registry.enabled:
+            return
+        with self.lock:
+            self.value += amount
+
+    def samples(self) -> List[Tuple[str, LabelSet, float]]:
+        return [(self.name, self.labels, self.value)]
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, *args: Any):
+        super().__init__(*args)
+        self.value = 0.0
+
+    def set(self, value: float):
+        if not self.registry.enabled:
+            return
+        self.value = value
+
+    def inc(self, amount: float = 1):
+        if not self.registry.enabled:
+            return
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1):
+        self.inc(-amount)
+
+    def samples(self) -> List[Tuple[str, LabelSet, float]]:
+        return [(self.name, self.labels, self.value)]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, *args: Any, buckets: Tuple[float, ...] = default_buckets):
+        super().__init__(*args)
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        if not self.registry.enabled:
+            return
+        with self.lock:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.sum += value
+            self.count += 1
+
+    def time(self) -> ContextManager:
+        """
+        Observe the number of seconds spent in the `with` block.
+        """
+        if not self.registry.enabled:
+            return nullcontext()
+        return self._time()
+
+    @contextmanager
+    def _time(self) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def samples(self) -> List[Tuple[str, LabelSet, float]]:
+        samples = []
+        cumulative = 0
+        for bound, count in zip((*self.buckets, float("inf")), self.counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else repr(float(bound))
+            samples.append((f"{self.name}_bucket", self.labels | {("le", le)}, cumulative))
+        samples.append((f"{self.name}_sum", self.labels, self.sum))
+        samples.append((f"{self.name}_count", self.labels, self.count))
+        return samples
+
+
+def _format_labels(labels: LabelSet) -> str:
+    if not labels:
+        return ""
+    values = ",".join(f'{key}="{value}"' for key, value in sorted(labels, key=lambda label: label[0] != "le"))
+    return "{" + values + "}"
+
+
+class MetricsRegistry:
+    """
+    Collects counters, gauges and histograms, and exposes them in the Prometheus text format or as JSON.
+
+    Metrics are no-ops while the registry is disabled, so instrumented code only pays for an attribute check.
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self._metrics: Dict[Tuple[str, LabelSet], Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls: type, name: str, help: str, labels: Optional[Dict[str, str]], **kwargs: Any) -> Any:
+        label_set: LabelSet = frozenset((labels or {}).items())
+        with self._lock:
+            metric = self._metrics.get((name, label_set))
+            if metric is None:
+                metric = self._metrics[(name, label_set)] = cls(self, name, help, label_set, **kwargs)
+            return metric
+
+    def counter(self, name: str, help: str = "", labels: Optional[Dict[str, str]] = None) -> Counter:
+        return self._get(Counter, name, help, labels)
+
+    def gauge(self, name: str, help: str = "", labels: Optional[Dict[str, str]] = None) -> Gauge:
+        return self._get(Gauge, name, help, labels)
+
+    def histogram(self, name: str, help: str = "", labels: Optional[Dict[str, str]] = None,
+                  buckets: Tuple[float, ...] = default_buckets) -> Histogram:
+        return self._get(Histogram, name, help, labels, buckets=buckets)
+
+    def render_prometheus(self) -> str:
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        described = set()
+        for metric in metrics:
+            if metric.name not in described:
+                described.add(metric.name)
+                if metric.help:
+                    lines.append(f"# HELP {metric.name} {metric.help}")
+                lines.append(f"# TYPE {metric.name} {metric.kind}")
+            with metric.lock:
+                samples = metric.samples()
+            for name, labels, value in samples:
+                lines.append(f"{name}{_format_labels(labels)} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        snapshot: Dict[str, Any] = {"timestamp": time.time(), "metrics": []}
+        for metric in metrics:
+            with metric.lock:
+                entry: Dict[str, Any] = {"name": metric.name, "type": metric.kind, "labels": dict(metric.labels)}
+                if isinstance(metric, Histogram):
+                    entry.update(count=metric.count, sum=metric.sum,
+                                 buckets=dict(zip(map(str, (*metric.buckets, "+Inf")), metric.counts)))
+                else:
+                    entry["value"] = metric.value
+            snapshot["metrics"].append(entry)
+        return snapshot
+
+    def start_http_server(self, port: int, host: str = "127.0.0.1") -> "ThreadingHTTPServer":
+        """
+        Serve the metrics in the Prometheus text format on `http://host:port/metrics` from a daemon thread.
+        """
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def log_message(self, format: str, *args: Any):
+                pass
+
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = registry.render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, name="MetricsServer", daemon=True).start()
+        return server
+
+    def start_json_snapshots(self, path: str, interval: float = 60) -> threading.Thread:
+        """
+        Write a JSON snapshot of the metrics to `path` every `interval` seconds from a daemon thread.
+        """
+        import json
+
+        def write_snapshots():
+            while True:
+                time.sleep(interval)
+                tmp_path = f"{path}.tmp"
+                with open(tmp_path, "w") as f:
+                    json.dump(self.snapshot(), f)
+                os.replace(tmp_path, path)
+
+        thread = threading.Thread(target=write_snapshots, name="MetricsSnapshots", daemon=True)
+        thread.start()
+        return thread
+
+
+registry = MetricsRegistry()
@@ -0,0 +1,235 @@
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+from typing import Callable, Iterator, Mapping, Optional
+
+ratelimit_delay_re = re.compile(r"(\d+)\s*(millisecond|second|minute)", re.IGNORECASE)
+
+
+class Priority(IntEnum):
+    read = 0
+    write = 1
+
+
+class TokenBucket:
+    """
+    Token bucket that refills at `rate` tokens per second up to `capacity` tokens.
+    """
+
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = capacity
+        self.updated = clock()
+
+    def refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, tokens: float = 1, reserve: float = 0) -> float:
+        """
+        Take `tokens` if that leaves at least `reserve` tokens in the bucket.
+        Returns 0 if the tokens were taken, otherwise the number of seconds until they will be available.
+        """
+        self.refill()
+        missing = tokens + reserve - self.tokens
+        # Allow for rounding errors in the refill, so waits are never vanishingly short.
+        if missing <= 1e-9:
+            self.tokens -= tokens
+            return 0
+        if self.rate <= 0:
+            return float("inf")
+        return missing / self.rate
+
+
+class RateGovernor:
+    """
+    Schedules the requests made to Reddit with a token bucket that is adjusted to the quota left in the current
+    window, as reported by the `X-Ratelimit-Remaining` and `X-Ratelimit-Reset` headers.
+
+    Requests are reads unless made inside `with governor.priority(Priority.write)`. Reads leave `write_reserve`
+    tokens in the bucket and wait while a write is waiting, so the bot's own comments go first. Comments are
+    additionally spaced by a separate bucket that refills one comment every `write_interval` seconds.
+
+    The priority is kept in a context variable, so it applies per thread as well as per asyncio task, and every
+    blocking method has an `_async` counterpart that sleeps with `asyncio.sleep`.
+    """
+
+    def __init__(self,
+                 quota: float = 600,
+                 window: float = 600,
+                 burst: float = 10,
+                 write_reserve: float = 1,
+                 write_interval: float = 5,
+                 write_burst: float = 2,
+                 clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.clock = clock
+        self.sleep = sleep
+        self.quota = quota
+        self.window = window
+        self.burst = burst
+        self.write_reserve = write_reserve
+        self.requests = TokenBucket(quota / window, burst, clock)
+        self.writes = TokenBucket(1 / write_interval, write_burst, clock)
+        self.remaining: Optional[float] = None
+        self.reset_at: Optional[float] = None
+        self.writes_paused_until = 0.0
+        self.writes_waiting = 0
+        self._lock = threading.Lock()
+        self._priority: ContextVar[Priority] = ContextVar(f"priority_{id(self)}", default=Priority.read)
+
+    @property
+    def current_priority(self) -> Priority:
+        return self._priority.get()
+
+    @contextmanager
+    def priority(self, priority: Priority) -> Iterator[None]:
+        """
+        Make the requests of the current thread or task inside the `with` block with the given priority.
+        """
+        token = self._priority.set(priority)
+        try:
+            yield
+        finally:
+            self._priority.reset(token)
+
+    def update(self, remaining: float, reset: float):
+        """
+        Spread the `remaining` requests evenly over the `reset` seconds left in the current window.
+        The quota is replenished when the window ends, whether or not a response has reported it yet.
+        """
+        with self._lock:
+            self.requests.refill()
+            self.remaining = remaining
+            self.reset_at = self.clock() + reset
+            self.requests.capacity = min(self.burst, max(remaining, 0))
+            self.requests.tokens = min(self.requests.tokens, self.requests.capacity)
+            # The tokens already in the bucket count against the remaining quota.
+            self.requests.rate = max(remaining - self.requests.tokens, 0) / max(reset, 1)
+
+    def update_from_headers(self, headers: Mapping[str, str]):
+        """
+        Update the quota from the rate limit headers of a response, if it has them.
+        """
+        remaining = headers.get("x-ratelimit-remaining")
+        reset = headers.get("x-ratelimit-reset")
+        if remaining is None or reset is None:
+            return
+        try:
+            self.update(float(remaining), float(reset))
+        except ValueError:
+            pass
+
+    def try_acquire(self, priority: Priority = None) -> float:
+        """
+        Take a request token without blocking.
+        Returns 0 if the request may be made, otherwise the number of seconds to wait before trying again.
+        """
+        priority = self.current_priority if priority is None else priority
+        with self._lock:
+            self._reset_window()
+            if priority == Priority.write:
+                return self.requests.take()
+            if self.writes_waiting:
+                return 1 / self.requests.rate if self.requests.rate > 0 else 1
+            return self.requests.take(reserve=self.write_reserve)
+
+    def acquire(self, priority: Priority = None) -> float:
+        """
+        Block until a request may be made and return the number of seconds waited.
+        """
+        priority = self.current_priority if priority is None else priority
+        start = self.clock()
+        self._wait_for_write(priority, 1)
+        try:
+            while wait := self.try_acquire(priority):
+                self.sleep(self._cap_wait(wait))
+        finally:
+            self._wait_for_write(priority, -1)
+        return self.clock() - start
+
+    async def acquire_async(self, priority: Priority = None) -> float:
+        import asyncio
+
+        priority = self.current_priority if priority is None else priority
+        start = self.clock()
+        self._wait_for_write(priority, 1)
+        try:
+            while wait := self.try_acquire(priority):
+                await asyncio.sleep(self._cap_wait(wait))
+        finally:
+            self._wait_for_write(priority, -1)
+        return self.clock() - start
+
+    def _wait_for_write(self, priority: Priority, delta: int):
+        if priority == Priority.write:
+            with self._lock:
+                self.writes_waiting += delta
+
+    def _reset_window(self):
+        if self.reset_at is not None and self.clock() >= self.reset_at:
+            self.reset_at = None
+            self.remaining = None
+            self.requests.rate = self.quota / self.window
+            self.requests.capacity = self.burst
+            self.requests.tokens = self.burst
+            self.requests.updated = self.clock()
+
+    def _cap_wait(self, wait: float) -> float:
+        # Never wait past the end of the window, when the quota is replenished.
+        if self.reset_at is not None:
+            wait = min(wait, max(self.reset_at - self.clock(), 0.1))
+        return min(wait, 60)
+
+    def try_acquire_write(self) -> float:
+        """
+        Take a comment token without blocking.
+        Returns 0 if a comment may be written, otherwise the number of seconds to wait before trying again.
+        """
+        with self._lock:
+            paused = self.writes_paused_until - self.clock()
+            if paused > 0:
+                return paused
+            return self.writes.take()
+
+    def acquire_write(self) -> float:
+        """
+        Block until a comment may be written and return the number of seconds waited.
+        """
+        start = self.clock()
+        while wait := self.try_acquire_write():
+            self.sleep(wait)
+        return self.clock() - start
+
+    async def acquire_write_async(self) -> float:
+        import asyncio
+
+        start = self.clock()
+        while wait := self.try_acquire_write():
+            await asyncio.sleep(wait)
+        return self.clock() - start
+
+    def pause_writes(self, seconds: float):
+        """
+        Stop writing comments for `seconds`, e.g. after Reddit answered with a `RATELIMIT` error.
+        """
+        with self._lock:
+            self.writes_paused_until = max(self.writes_paused_until, self.clock() + seconds)
+            self.writes.tokens = 0
+
+
+def parse_ratelimit_delay(message: str) -> Optional[float]:
+    """
+    Parse the delay from a Reddit `RATELIMIT` error message, e.g. "Take a break for 9 minutes before trying again."
+    """
+    match = ratelimit_delay_re.search(message)
+    if not match:
+        return None
+    value, unit = int(match.group(1)), match.group(2).lower()
+    return value * 60 if unit == "minute" else value / 1000 if unit == "millisecond" else value
@@ -1,53 +1,226 @@
 import re
-from typing import List, Tuple, Union
-
-from english_words import english_words_lower_set
-from praw.models.comment_forest import CommentForest
-from praw.models.reddit.more import MoreComments
-from praw.reddit import Comment, Submission, Redditor
+from collections import deque
+from typing import (TYPE_CHECKING, Any, Callable, Deque, Dict, FrozenSet,
+                    Iterable, Iterator, List, Optional, Sequence, Set, Tuple,
+                    TypedDict, Union)
+from weakref import WeakKeyDictionary
 
 from .coingecko import *
+from .trends import MentionWindow
+
+if TYPE_CHECKING:
+    # PRAW takes a while to import and isn't needed to count dumps, it's imported where comments are fetched.
+    from praw.models.reddit.more import MoreComments
+    from praw.reddit import Comment, Redditor, Submission
 
 ticker_re = re.compile(r"\b([a-zA-Z]{2,5})\b")
+# Same matches as `ticker_re`, with the `$` prefix if there is one.
+dollar_ticker_re = re.compile(r"(\$?)\b([a-zA-Z]{2,5})\b")
+# Maximum number of children IDs accepted by /api/morechildren.
+morechildren_limit = 100
 
 
-def analyze_comments(submission: Submission,
-                     cg_coins_list: List[Union[CoinMarket, Dict]] = None,
-                     ignore_authors: List[Redditor] = list()):
-    cg_dict = get_symbols_names_dict(cg_coins_list)
-    comments: List[Union[Comment, MoreComments]] = submission.comments.list()
+deleted_bodies = ("[deleted]", "[removed]")
+
+_ticker_tables: "WeakKeyDictionary[CoinIndex, Dict[bool, Tuple[FrozenSet[str], FrozenSet[str]]]]" = WeakKeyDictionary()
+
+
+class AnalyzedComment(TypedDict):
+    edited: Union[bool, float, str]
+    tickers: List[str]
+
+
+class SubmissionAnalysis(TypedDict):
+    comments: Dict[str, AnalyzedComment]
+    cryptos: Dict[str, int]
+    # Identifies the coins and word filter the comments' tickers were found with, see `get_analysis_etag`.
+    etag: str
+    ignore_english_words: bool
+
+
+def get_analysis_etag(coin_index: CoinIndex, ignore_english_words: bool = True) -> str:
+    return f"{coin_index.etag}-{'words' if ignore_english_words else 'all'}"
+
+
+def is_analysis_current(analysis: Optional[SubmissionAnalysis], coin_index: CoinIndex,
+                        ignore_english_words: bool = True) -> bool:
+    """
+    Return whether the tickers in `analysis` were found with the same coins and word filter. Analyses from
+    before these were recorded are never current.
+    """
+    return bool(analysis) and analysis.get("etag") == get_analysis_etag(coin_index, ignore_english_words)
+
+
+def get_ticker_tables(coin_index: CoinIndex, ignore_english_words: bool = True) -> Tuple[FrozenSet[str], FrozenSet[str]]:
+    """
+    Return the symbols that count whenever they appear as a ticker, and the symbols that
+    are English words and only count when they are written with a `$` prefix or not in lowercase.
+    """
+    from .words import get_english_words
+
+    tables = _ticker_tables.setdefault(coin_index, {})
+    if ignore_english_words not in tables:
+        symbols = frozenset(coin_index.names)
+        cased = symbols & get_english_words() if ignore_english_words else frozenset()
+        tables[ignore_english_words] = (symbols - cased, cased)
+    return tables[ignore_english_words]
+
+
+def tokenize_comments(bodies: Sequence[str], coin_index: CoinIndex,
+                      ignore_english_words: bool = True, match_names: bool = True) -> List[Set[str]]:
+    """
+    Return the unique tickers mentioned in each comment body, either by ticker or, if `match_names`,
+    by coin name.
+    """
+    allowed, cased = get_ticker_tables(coin_index, ignore_english_words)
+    find_names = coin_index.name_matcher.find if match_names else None
+    findall = dollar_ticker_re.findall
+    tickers_per_comment = []
+    for body, body_lower in zip(bodies, [body.lower() for body in bodies] if find_names else bodies):
+        tickers = find_names(body_lower) if find_names else set()
+        for dollar, ticker in set(findall(body)):
+            ticker_lower = ticker.lower()
+            if ticker_lower in allowed or (ticker_lower in cased and (dollar or ticker != ticker_lower)):
+                tickers.add(ticker_lower)
+        tickers_per_comment.append(tickers)
+    return tickers_per_comment
+
+
+def get_comment_tickers(body: str, coin_index: CoinIndex, ignore_english_words: bool = True) -> Set[str]:
+    """
+    Return the unique tickers mentioned in a comment body, either by ticker or by coin name.
+    """
+    return tokenize_comments([body], coin_index, ignore_english_words)[0]
+
 
-    cryptos = {}
+def batched(items: Iterable[Any], batch_size: int) -> Iterator[List[Any]]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _merge_counts(cryptos: Dict[str, int], counts: Dict[str, int]):
+    for ticker, count in counts.items():
+        cryptos[ticker] = cryptos.get(ticker, 0) + count
+
+
+def _count_batch(bodies: Sequence[str], coin_index: CoinIndex, ignore_english_words: bool) -> Dict[str, int]:
+    cryptos: Dict[str, int] = {}
+    for tickers in tokenize_comments(bodies, coin_index, ignore_english_words):
+        for ticker in tickers:
+            cryptos[ticker] = cryptos.get(ticker, 0) + 1
+    return cryptos
+
+
+# Matcher tables of the worker processes, inherited on fork or set once per worker by `_init_worker`.
+_worker_tables: Optional[Tuple[CoinIndex, bool]] = None
+
+
+def _init_worker(coin_index: Optional[CoinIndex], ignore_english_words: bool):
+    global _worker_tables
+    if coin_index is not None:
+        _worker_tables = (coin_index, ignore_english_words)
+
+
+def _count_worker_batch(bodies: List[str]) -> Tuple[Dict[str, int], int]:
+    coin_index, ignore_english_words = _worker_tables
+    return _count_batch(bodies, coin_index, ignore_english_words), len(bodies)
+
+
+def _tokenize_worker_batch(bodies: List[str]) -> List[Set[str]]:
+    coin_index, ignore_english_words = _worker_tables
+    return tokenize_comments(bodies, coin_index, ignore_english_words)
+
+
+def _map_batches(func: Callable[[List[str]], Any], batches: Iterable[List[str]], coin_index: CoinIndex,
+                 ignore_english_words: bool, processes: int) -> Iterator[Any]:
+    """
+    Run `func` over the batches in a process pool and yield the results in order.
+    The matcher tables are built before the pool starts and are shared with the workers by forking where possible,
+    otherwise they are sent once to each worker. At most two batches per worker are in flight at once.
+    """
+    import multiprocessing
+    from concurrent.futures import Future, ProcessPoolExecutor
+
+    global _worker_tables
+    coin_index.name_matcher
+    get_ticker_tables(coin_index, ignore_english_words)
+    if "fork" in multiprocessing.get_all_start_methods():
+        _worker_tables = (coin_index, ignore_english_words)
+        context, initargs = multiprocessing.get_context("fork"), (None, ignore_english_words)
+    else:
+        context, initargs = multiprocessing.get_context(), (coin_index, ignore_english_words)
+
+    with ProcessPoolExecutor(max_workers=processes, mp_context=context,
+                             initializer=_init_worker, initargs=initargs) as executor:
+        pending: Deque[Future] = deque()
+        for batch in batches:
+            pending.append(executor.submit(func, batch))
+            if len(pending) >= processes * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def count_tickers(bodies: Iterable[str], coin_index: CoinIndex, ignore_english_words: bool = True,
+                  batch_size: int = 1000, processes: int = 1) -> Tuple[Dict[str, int], int]:
+    """
+    Count the number of comments mentioning each ticker, returns the counts and the number of comments.
+    With more than one process, batches are counted in a process pool and the counts are merged afterwards.
+    """
+    cryptos: Dict[str, int] = {}
     comments_analyzed = 0
+    if processes > 1:
+        for counts, count in _map_batches(_count_worker_batch, batched(bodies, batch_size), coin_index,
+                                          ignore_english_words, processes):
+            _merge_counts(cryptos, counts)
+            comments_analyzed += count
+    else:
+        for batch in batched(bodies, batch_size):
+            comments_analyzed += len(batch)
+            _merge_counts(cryptos, _count_batch(batch, coin_index, ignore_english_words))
+    return cryptos, comments_analyzed
+
+
+def tokenize_batches(batches: Iterable[List[str]], coin_index: CoinIndex, ignore_english_words: bool = True,
+                     processes: int = 1) -> Iterator[List[Set[str]]]:
+    """
+    Yield the tickers of each comment per batch, tokenizing the batches in a process pool with more than one process.
+    """
+    if processes > 1:
+        yield from _map_batches(_tokenize_worker_batch, batches, coin_index, ignore_english_words, processes)
+    else:
+        for batch in batches:
+            yield tokenize_comments(batch, coin_index, ignore_english_words)
+
+
+def iter_comments(submission: "Submission", workers: int = 1) -> Iterator["Comment"]:
+    """
+    Yield every comment of the submission, expanding `MoreComments` as they are encountered.
+
+    With more than one worker, `MoreComments` are expanded level by level instead, with up to
+    `workers` requests in flight at once.
+    """
+    from praw.models.comment_forest import CommentForest
+    from praw.reddit import Comment
+
+    if workers > 1:
+        yield from _iter_comments_parallel(submission, workers)
+        return
+
+    comments: List[Union[Comment, MoreComments]] = submission.comments.list()
 
     while comments:
         cs = [*comments]
         comments = []
         for comment in cs:
-            tickers = set()
             if isinstance(comment, Comment):
-                if comment.author in ignore_authors:
-                    continue
-                comments_analyzed += 1
-                for match in ticker_re.finditer(comment.body):
-                    ticker = match.group(1)
-                    ticker_lower = ticker.lower()
-                    starts_with_dollar_symbol = match.start() > 0 and comment.body[match.start() - 1] == "$"
-                    if not starts_with_dollar_symbol and ticker in english_words_lower_set and ticker.upper() != ticker:
-                        continue
-                    if ticker_lower in cg_dict and ticker_lower not in tickers:
-                        if ticker_lower in cryptos:
-                            cryptos[ticker_lower] += 1
-                        else:
-                            cryptos[ticker_lower] = 1
-                        tickers.add(ticker_lower)
-                for symbol, name in cg_dict.items():
-                    if name in comment.body.lower() and symbol not in tickers:
-                        if symbol in cryptos:
-                            cryptos[symbol] += 1
-                        else:
-                            cryptos[symbol] = 1
-                        tickers.add(symbol)
+                yield comment
             else:
                 forest: Union[CommentForest, List[Comment]] = comment.comments()
                 if isinstance(forest, CommentForest):
@@ -56,5 +229,174 @@ def analyze_comments(submission: Submission,
                 else:
                     comments.extend(forest)
 
-    ranked: List[Tuple[str, int]] = sorted(cryptos.items(), key=lambda x: x[1], reverse=True)
-    return ranked, comments_analyzed
+
+def _load_more_children(submission: "Submission", children: List[str]) -> List[Union["Comment", "MoreComments"]]:
+    from praw.const import API_PATH
+
+    comments = submission._reddit.post(API_PATH["morechildren"], data={
+        "children": ",".join(children),
+        "link_id": submission.fullname,
+        "sort": submission.comment_sort,
+    })
+    for comment in comments:
+        comment.submission = submission
+    return comments
+
+
+def _load_continuation(more: "MoreComments") -> List[Union["Comment", "MoreComments"]]:
+    from praw.models.comment_forest import CommentForest
+
+    forest: Union[CommentForest, List[Comment]] = more.comments()
+    return forest.list() if isinstance(forest, CommentForest) else forest
+
+
+def _iter_comments_parallel(submission: "Submission", workers: int) -> Iterator["Comment"]:
+    from concurrent.futures import ThreadPoolExecutor
+
+    from praw.reddit import Comment
+
+    seen: Set[str] = set()
+    level: List[Union[Comment, MoreComments]] = submission.comments.list()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while level:
+            children: List[str] = []
+            continuations: List[MoreComments] = []
+            for comment in level:
+                if isinstance(comment, Comment):
+                    if comment.id not in seen:
+                        seen.add(comment.id)
+                        yield comment
+                elif comment.children:
+                    children.extend(comment.children)
+                else:
+                    continuations.append(comment)
+
+            children = [*dict.fromkeys(child for child in children if child not in seen)]
+            futures = [executor.submit(_load_more_children, submission, children[i:i + morechildren_limit])
+                       for i in range(0, len(children), morechildren_limit)]
+            futures += [executor.submit(_load_continuation, more) for more in continuations]
+            level = []
+            for future in futures:
+                level.extend(future.result())
+
+
+def rank_cryptos(cryptos: Dict[str, int]) -> List[Tuple[str, int]]:
+    return sorted(cryptos.items(), key=lambda x: x[1], reverse=True)
+
+
+def analyze_comments(submission: "Submission",
+                     cg_coins_list: Union[CoinIndex, List[Union[CoinMarket, Dict]]] = None,
+                     ignore_authors: List["Redditor"] = list(),
+                     workers: int = 1,
+                     ignore_english_words: bool = True,
+                     processes: int = 1):
+    coin_index = get_coin_index(cg_coins_list)
+    bodies = (comment.body for comment in iter_comments(submission, workers) if comment.author not in ignore_authors)
+    cryptos, comments_analyzed = count_tickers(bodies, coin_index, ignore_english_words, processes=processes)
+    return rank_cryptos(cryptos), comments_analyzed
+
+
+def analyze_comments_window(submission: "Submission",
+                            cg_coins_list: Union[CoinIndex, List[Union[CoinMarket, Dict]]] = None,
+                            ignore_authors: List["Redditor"] = list(),
+                            window: float = 60 * 60,
+                            buckets: int = 12,
+                            workers: int = 1,
+                            ignore_english_words: bool = True,
+                            batch_size: int = 1000,
+                            processes: int = 1) -> MentionWindow:
+    """
+    Count the crypto mentions of the submission's comments per time bucket by their `created_utc`,
+    in a `MentionWindow` that ends with the newest comment.
+    """
+    coin_index = get_coin_index(cg_coins_list)
+    mentions = MentionWindow(window, buckets)
+    created: Deque[List[float]] = deque()
+
+    def body_batches() -> Iterator[List[str]]:
+        comments = (comment for comment in iter_comments(submission, workers) if comment.author not in ignore_authors)
+        for batch in batched(comments, batch_size):
+            created.append([comment.created_utc for comment in batch])
+            yield [comment.body for comment in batch]
+
+    for tickers_per_comment in tokenize_batches(body_batches(), coin_index, ignore_english_words, processes):
+        for created_utc, tickers in zip(created.popleft(), tickers_per_comment):
+            mentions.add(tickers, created_utc)
+    return mentions
+
+
+def _get_edit_marker(comment: "Comment") -> Union[bool, float, str]:
+    return "deleted" if comment.body in deleted_bodies else comment.edited
+
+
+def analyze_comments_incremental(submission: "Submission",
+                                 cg_coins_list: Union[CoinIndex, List[Union[CoinMarket, Dict]]] = None,
+                                 ignore_authors: List["Redditor"] = list(),
+                                 analysis: Optional[SubmissionAnalysis] = None,
+                                 workers: int = 1,
+                                 ignore_english_words: bool = True):
+    """
+    Update a previous `SubmissionAnalysis` with the submission's current comments.
+
+    Only comments that are new, edited or deleted since the previous analysis are tokenized,
+    and the aggregate counts are updated by their difference. All comments are tokenized again if
+    the coins or the word filter changed since the previous analysis. Returns the ranking, the number
+    of comments analyzed, the updated analysis and the number of comments that changed.
+    """
+    return update_analysis(iter_comments(submission, workers), cg_coins_list, ignore_authors, analysis,
+                           ignore_english_words)
+
+
+def update_analysis(comments: Iterable["Comment"],
+                    cg_coins_list: Union[CoinIndex, List[Union[CoinMarket, Dict]]] = None,
+                    ignore_authors: List["Redditor"] = list(),
+                    analysis: Optional[SubmissionAnalysis] = None,
+                    ignore_english_words: bool = True):
+    """
+    Update a previous `SubmissionAnalysis` with already fetched comments, see `analyze_comments_incremental`.
+    """
+    coin_index = get_coin_index(cg_coins_list)
+    # Tickers found with other coins or another word filter are discarded and every comment is tokenized again.
+    if not is_analysis_current(analysis, coin_index, ignore_english_words):
+        analysis = None
+    previous = analysis["comments"] if analysis else {}
+    cryptos = dict(analysis["cryptos"]) if analysis else {}
+    analyzed: Dict[str, AnalyzedComment] = {}
+    changed: List[Comment] = []
+
+    def apply(tickers: Iterable[str], delta: int):
+        for ticker in tickers:
+            count = cryptos.get(ticker, 0) + delta
+            if count > 0:
+                cryptos[ticker] = count
+            else:
+                cryptos.pop(ticker, None)
+
+    for comment in comments:
+        if comment.author in ignore_authors or comment.id in analyzed:
+            continue
+        marker = _get_edit_marker(comment)
+        if (entry := previous.get(comment.id)) and entry["edited"] == marker:
+            analyzed[comment.id] = entry
+            continue
+        if entry:
+            apply(entry["tickers"], -1)
+        analyzed[comment.id] = AnalyzedComment(edited=marker, tickers=[])
+        changed.append(comment)
+
+    for comment, tickers in zip(changed, tokenize_comments([comment.body for comment in changed], coin_index,
+                                                           ignore_english_words)):
+        analyzed[comment.id]["tickers"] = sorted(tickers)
+        apply(tickers, 1)
+
+    deleted = 0
+    for comment_id, entry in previous.items():
+        if comment_id not in analyzed:
+            deleted += 1
+            apply(entry["tickers"], -1)
+
+    analysis = SubmissionAnalysis(comments=analyzed, cryptos=cryptos,
+                                  etag=get_analysis_etag(coin_index, ignore_english_words),
+                                  ignore_english_words=ignore_english_words)
+    return rank_cryptos(cryptos), len(analyzed), analysis, len(changed) + deleted
@@ -0,0 +1,106 @@
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple, TypeVar
+
+from .scheduler import get_time_interval
+
+T = TypeVar("T")
+
+# Maximum number of fullnames Reddit's /api/info endpoint accepts per request.
+info_batch_size = 100
+
+
+def get_fullname(submission_id: str) -> str:
+    return submission_id if submission_id.startswith("t3_") else f"t3_{submission_id}"
+
+
+def chunks(items: List[T], size: int) -> Iterator[List[T]]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class RefreshPlan:
+    """
+    What a batch refresh decided for each submission, see `SubmissionRefresher.plan`.
+    """
+
+    def __init__(self):
+        # Fetched submission and time interval of the submissions that need an analysis pass.
+        self.analyze: Dict[str, Tuple[Any, int]] = {}
+        # Time interval of the submissions whose number of comments didn't change since the last pass.
+        self.unchanged: Dict[str, int] = {}
+        # Locked, banned or too old submissions that should be ignored from now on.
+        self.ignore: List[str] = []
+        # Submissions without comments, which stop being tracked until they're summoned again.
+        self.empty: List[str] = []
+        # Submissions Reddit didn't return, e.g. because they were deleted.
+        self.missing: List[str] = []
+
+    @property
+    def handled(self) -> Dict[str, Optional[int]]:
+        """
+        Delay until the next pass of the submissions that don't need an analysis pass now, `None` to stop tracking.
+        """
+        handled: Dict[str, Optional[int]] = dict(self.unchanged)
+        handled.update((submission_id, None) for submission_id in self.ignore + self.empty)
+        return handled
+
+
+class SubmissionRefresher:
+    """
+    Refreshes the metadata of tracked submissions with Reddit's /api/info endpoint, `batch_size` submissions
+    per request, instead of lazily fetching every submission on its own.
+
+    `info` is called with a list of fullnames like `reddit.info(fullnames=...)`. Whether the bot is banned
+    from a subreddit is checked once per subreddit and batch.
+    """
+
+    def __init__(self, info: Callable[..., Iterable[Any]], batch_size: int = info_batch_size,
+                 clock: Callable[[], datetime] = datetime.utcnow):
+        self.info = info
+        self.batch_size = min(batch_size, info_batch_size)
+        self.clock = clock
+
+    def fetch(self, submission_ids: List[str]) -> Dict[str, Any]:
+        submissions: Dict[str, Any] = {}
+        for chunk in chunks(submission_ids, self.batch_size):
+            for submission in self.info(fullnames=[get_fullname(submission_id) for submission_id in chunk]):
+                submissions[submission.id] = submission
+        return submissions
+
+    def plan(self, submission_ids: List[str], submissions: Mapping[str, Any],
+             num_comments: Mapping[str, Optional[int]]) -> RefreshPlan:
+        """
+        Apply the checks of a submission analysis pass to fetched submissions. Submissions with the same number of
+        comments as in `num_comments`, recorded at their last pass, don't need their comment tree analyzed again.
+        """
+        plan = RefreshPlan()
+        banned: Dict[str, bool] = {}
+        now = self.clock()
+        for submission_id in submission_ids:
+            submission = submissions.get(submission_id)
+            if submission is None:
+                plan.missing.append(submission_id)
+                continue
+            if submission.locked:
+                plan.ignore.append(submission_id)
+                continue
+            subreddit = submission.subreddit.display_name
+            if subreddit not in banned:
+                banned[subreddit] = bool(submission.subreddit.user_is_banned)
+            if banned[subreddit]:
+                plan.ignore.append(submission_id)
+                continue
+            if submission.num_comments < 1:
+                plan.empty.append(submission_id)
+                continue
+            time_interval = get_time_interval(now - datetime.utcfromtimestamp(submission.created_utc))
+            if time_interval is None:
+                plan.ignore.append(submission_id)
+            elif num_comments.get(submission_id) == submission.num_comments:
+                plan.unchanged[submission_id] = time_interval
+            else:
+                plan.analyze[submission_id] = (submission, time_interval)
+        return plan
+
+    def refresh(self, submission_ids: List[str], num_comments: Mapping[str, Optional[int]]) -> RefreshPlan:
+        return self.plan(submission_ids, self.fetch(submission_ids), num_comments)
@@ -0,0 +1,203 @@
+import heapq
+import threading
+import time
+from datetime import timedelta
+from functools import partial
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Set, Tuple
+
+if TYPE_CHECKING:
+    from concurrent.futures import Executor, Future
+
+
+def get_time_interval(age: timedelta) -> Optional[int]:
+    """
+    Return the number of seconds to wait before re-analyzing a submission of the given age,
+    or `None` if the submission is too old to keep tracking.
+    """
+    if age > timedelta(weeks=2):
+        return None
+    if age > timedelta(days=1):
+        return 1 * 60 * 60
+    elif age > timedelta(hours=4):
+        return 30 * 60
+    elif age > timedelta(hours=2):
+        return 20 * 60
+    elif age > timedelta(hours=1):
+        return 10 * 60
+    else:
+        return 5 * 60
+
+
+class SubmissionScheduler:
+    """
+    Runs a job per tracked submission whenever it is due, using one heap and a fixed-size worker pool.
+
+    The job receives the submission ID and returns the number of seconds until it is due again,
+    or `None` to stop tracking the submission. The optional `batch_job` receives all due submission
+    IDs at once before the jobs are run, and returns the delays of those it handled itself, which
+    then don't run the job. `clock` and `executor` can be replaced to drive the scheduler from tests
+    with `run_pending`.
+    """
+
+    def __init__(self, job: Callable[[str], Optional[float]], workers: int = 4,
+                 clock: Callable[[], float] = time.time, executor: Optional["Executor"] = None,
+                 batch_job: Optional[Callable[[List[str]], Dict[str, Optional[float]]]] = None):
+        self.job = job
+        self.batch_job = batch_job
+        self.clock = clock
+        self.workers = workers
+        # The worker pool is started by the first due submission.
+        self._executor = executor
+        self._heap: List[Tuple[float, str]] = []
+        # Current due time per scheduled submission, heap entries that don't match it are stale.
+        self._due: Dict[str, float] = {}
+        self._running: Set[str] = set()
+        # Due times requested for submissions while they were running, applied once they finish.
+        self._rescheduled: Dict[str, float] = {}
+        self._cancelled: Set[str] = set()
+        self._condition = threading.Condition()
+        self._stopped = False
+
+    def __contains__(self, submission_id: str) -> bool:
+        with self._condition:
+            return submission_id in self._due or submission_id in self._running
+
+    def __len__(self) -> int:
+        with self._condition:
+            return len(self._due) + len(self._running)
+
+    def schedule(self, submission_id: str, delay: float = 0):
+        """
+        Schedule the submission to run in `delay` seconds, replacing its current due time.
+        """
+        with self._condition:
+            due = self.clock() + delay
+            if submission_id in self._running:
+                self._cancelled.discard(submission_id)
+                self._rescheduled[submission_id] = due
+                return
+            self._push(submission_id, due)
+
+    def _push(self, submission_id: str, due: float):
+        self._due[submission_id] = due
+        heapq.heappush(self._heap, (due, submission_id))
+        self._condition.notify()
+
+    def cancel(self, submission_id: str):
+        with self._condition:
+            self._due.pop(submission_id, None)
+            self._rescheduled.pop(submission_id, None)
+            if submission_id in self._running:
+                self._cancelled.add(submission_id)
+
+    def next_due(self) -> Optional[float]:
+        with self._condition:
+            self._discard_stale()
+            return self._heap[0][0] if self._heap else None
+
+    def _discard_stale(self):
+        while self._heap and self._due.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+    def pop_due(self, now: Optional[float] = None) -> List[str]:
+        """
+        Remove and return the submissions that are due at `now`, in order of their due time,
+        and mark them as running.
+        """
+        now = self.clock() if now is None else now
+        due: List[str] = []
+        with self._condition:
+            self._discard_stale()
+            while self._heap and self._heap[0][0] <= now:
+                _, submission_id = heapq.heappop(self._heap)
+                del self._due[submission_id]
+                self._running.add(submission_id)
+                due.append(submission_id)
+                self._discard_stale()
+        return due
+
+    def run_pending(self, now: Optional[float] = None) -> List["Future"]:
+        """
+        Submit every due submission that `batch_job` didn't handle to the worker pool and return the futures.
+        """
+        due = self.pop_due(now)
+        handled: Dict[str, Optional[float]] = {}
+        if due and self.batch_job:
+            try:
+                handled = self.batch_job(due)
+            except Exception:
+                # Run the jobs on their own, the batch job is only an optimization.
+                handled = {}
+        handled = {submission_id: handled[submission_id] for submission_id in due if submission_id in handled}
+        for submission_id, delay in handled.items():
+            self._finish(submission_id, delay)
+        executor = self._get_executor()
+        futures = []
+        for submission_id in due:
+            if submission_id not in handled:
+                future = executor.submit(self._run, submission_id)
+                future.add_done_callback(partial(self._cancelled_run, submission_id))
+                futures.append(future)
+        return futures
+
+    def _cancelled_run(self, submission_id: str, future: "Future"):
+        # Jobs still queued in the pool when it's stopped never run `_finish`.
+        if future.cancelled():
+            with self._condition:
+                self._running.discard(submission_id)
+                self._rescheduled.pop(submission_id, None)
+                self._cancelled.discard(submission_id)
+
+    def _get_executor(self) -> "Executor":
+        with self._condition:
+            if self._executor is None:
+                from concurrent.futures import ThreadPoolExecutor
+
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="SubmissionWorker")
+            return self._executor
+
+    def _run(self, submission_id: str):
+        delay = None
+        try:
+            delay = self.job(submission_id)
+        finally:
+            self._finish(submission_id, delay)
+        return delay
+
+    def _finish(self, submission_id: str, delay: Optional[float]):
+        with self._condition:
+            self._running.discard(submission_id)
+            rescheduled = self._rescheduled.pop(submission_id, None)
+            if submission_id in self._cancelled:
+                self._cancelled.discard(submission_id)
+            elif rescheduled is not None:
+                self._push(submission_id, rescheduled)
+            elif delay is not None:
+                self._push(submission_id, self.clock() + delay)
+
+    def run_forever(self, poll_interval: float = 60):
+        """
+        Dispatch due submissions until `stop` is called.
+        """
+        while True:
+            with self._condition:
+                if self._stopped:
+                    break
+                next_due = self.next_due()
+                timeout = poll_interval if next_due is None else min(poll_interval, next_due - self.clock())
+                if timeout > 0:
+                    self._condition.wait(timeout)
+                    continue
+            self.run_pending()
+
+    def stop(self, wait: bool = True):
+        """
+        Stop dispatching and cancel the passes that haven't started yet. With `wait`, block until the running passes
+        finish.
+        """
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+            executor = self._executor
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
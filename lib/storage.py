@@ -0,0 +1,310 @@
+import threading
+from abc import ABC, abstractmethod
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, TypedDict
+
+from .reddit_comments_crypto_counter import SubmissionAnalysis
+
+if TYPE_CHECKING:
+    import sqlite3
+
+
+class SubmissionDocument(TypedDict, total=False):
+    id: str
+    ignore: bool
+    crypto_comments_id: str
+    comment_hash: str
+    num_comments: int
+    # `etag` of the stored analysis, so it can be checked without loading the analysis.
+    analysis_etag: str
+
+
+class SubmissionStore(ABC):
+    """
+    Storage backend for the submissions tracked by the bot.
+
+    The `SubmissionAnalysis` of a submission, which holds the tickers of every comment, is kept apart from its
+    document and only loaded by the analysis pass with `get_analysis`.
+    """
+
+    @abstractmethod
+    def get_submission(self, submission_id: str) -> Optional[SubmissionDocument]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def create_submission(self, submission_id: str) -> SubmissionDocument:
+        raise NotImplementedError
+
+    @abstractmethod
+    def update_submission(self, submission_id: str, fields: Dict[str, Any]):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_analysis(self, submission_id: str) -> Optional[SubmissionAnalysis]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def set_analysis(self, submission_id: str, analysis: SubmissionAnalysis, fields: Dict[str, Any] = None):
+        """
+        Store the submission's analysis and set its `analysis_etag`, together with other `fields` of the document.
+        """
+        raise NotImplementedError
+
+    def ignore_submissions(self, submission_ids: List[str]):
+        """
+        Mark all the given submissions as ignored at once.
+        """
+        for submission_id in submission_ids:
+            self.update_submission(submission_id, {"ignore": True})
+
+    @abstractmethod
+    def get_active_submissions(self) -> List[SubmissionDocument]:
+        """
+        Return the IDs and `crypto_comments_id` of all submissions that aren't ignored.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def clear(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+
+class TinyDBStore(SubmissionStore):
+    """
+    Store backed by a TinyDB JSON file, every write rewrites the whole file.
+    """
+
+    submission_type = "submission"
+
+    def __init__(self, path: str):
+        from tinydb import Query, TinyDB
+
+        self.db = TinyDB(path)
+        self.query = Query()
+        self.lock = threading.Lock()
+
+    def _search(self, submission_id: str):
+        return self.db.search((self.query.type == self.submission_type) & (self.query.id == submission_id))
+
+    @staticmethod
+    def _to_submission(doc: Dict[str, Any]) -> SubmissionDocument:
+        return SubmissionDocument(**{key: value for key, value in doc.items() if key not in ("type", "analysis")})
+
+    def get_submission(self, submission_id: str) -> Optional[SubmissionDocument]:
+        with self.lock:
+            res = self._search(submission_id)
+            return self._to_submission(res[0]) if res else None
+
+    def create_submission(self, submission_id: str) -> SubmissionDocument:
+        from tinyrecord import transaction
+
+        with self.lock:
+            with transaction(self.db) as tr:
+                tr.insert({
+                    "id": submission_id,
+                    "type": self.submission_type,
+                })
+        return self.get_submission(submission_id)
+
+    def update_submission(self, submission_id: str, fields: Dict[str, Any]):
+        from tinyrecord import transaction
+
+        with self.lock:
+            doc_ids = [doc.doc_id for doc in self._search(submission_id)]
+            with transaction(self.db) as tr:
+                tr.update(fields, doc_ids=doc_ids)
+
+    def get_analysis(self, submission_id: str) -> Optional[SubmissionAnalysis]:
+        with self.lock:
+            res = self._search(submission_id)
+            return res[0].get("analysis") if res else None
+
+    def set_analysis(self, submission_id: str, analysis: SubmissionAnalysis, fields: Dict[str, Any] = None):
+        self.update_submission(submission_id, {**(fields or {}), "analysis": analysis,
+                                               "analysis_etag": analysis.get("etag")})
+
+    def ignore_submissions(self, submission_ids: List[str]):
+        from tinyrecord import transaction
+
+        with self.lock:
+            doc_ids = [doc.doc_id for doc in self.db.search(
+                (self.query.type == self.submission_type) & self.query.id.one_of(submission_ids))]
+            with transaction(self.db) as tr:
+                tr.update({"ignore": True}, doc_ids=doc_ids)
+
+    def get_active_submissions(self) -> List[SubmissionDocument]:
+        with self.lock:
+            return [self._to_submission(doc) for doc in self.db.search(
+                (self.query.type == self.submission_type) & (
+                    (self.query.ignore == False) | ~(self.query.ignore.exists())))]
+
+    def get_all_submissions(self) -> List[Dict[str, Any]]:
+        """
+        Return the documents of all submissions, including their analysis.
+        """
+        with self.lock:
+            return [{key: value for key, value in doc.items() if key != "type"}
+                    for doc in self.db.search(self.query.type == self.submission_type)]
+
+    def clear(self):
+        with self.lock:
+            self.db.truncate()
+
+    def __len__(self) -> int:
+        with self.lock:
+            return self.db.count(self.query.type == self.submission_type)
+
+
+class SQLiteStore(SubmissionStore):
+    """
+    Store backed by an SQLite database in WAL mode, with one connection per thread.
+
+    `ignore` and `crypto_comments_id` have their own columns, any other fields are kept as JSON. Analyses are
+    kept as JSON in a separate table, so looking up a submission doesn't decode them.
+    """
+
+    columns = ("ignore", "crypto_comments_id")
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS submissions (
+                    id TEXT PRIMARY KEY,
+                    ignore INTEGER NOT NULL DEFAULT 0,
+                    crypto_comments_id TEXT,
+                    data TEXT NOT NULL DEFAULT '{}'
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS submissions_ignore ON submissions (ignore);
+                CREATE TABLE IF NOT EXISTS analyses (
+                    id TEXT PRIMARY KEY,
+                    data TEXT NOT NULL
+                );
+            """)
+            # Older versions kept the analysis in `data`. It's dropped rather than moved, because analyses without
+            # an etag are made again on the next pass anyway.
+            conn.execute("UPDATE submissions SET data = json_remove(data, '$.analysis') "
+                         "WHERE json_type(data, '$.analysis') IS NOT NULL")
+
+    def _connection(self) -> "sqlite3.Connection":
+        conn: Optional["sqlite3.Connection"] = getattr(self._local, "conn", None)
+        if conn is None:
+            import sqlite3
+
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _to_submission(row: "sqlite3.Row") -> SubmissionDocument:
+        import json
+
+        doc = SubmissionDocument(**json.loads(row["data"]))
+        doc["id"] = row["id"]
+        doc["ignore"] = bool(row["ignore"])
+        if row["crypto_comments_id"] is not None:
+            doc["crypto_comments_id"] = row["crypto_comments_id"]
+        return doc
+
+    def get_submission(self, submission_id: str) -> Optional[SubmissionDocument]:
+        row = self._connection().execute("SELECT * FROM submissions WHERE id = ?", (submission_id, )).fetchone()
+        return self._to_submission(row) if row else None
+
+    def get_analysis(self, submission_id: str) -> Optional[SubmissionAnalysis]:
+        import json
+
+        row = self._connection().execute("SELECT data FROM analyses WHERE id = ?", (submission_id, )).fetchone()
+        return json.loads(row["data"]) if row else None
+
+    def create_submission(self, submission_id: str) -> SubmissionDocument:
+        self._connection().execute("INSERT OR IGNORE INTO submissions (id) VALUES (?)", (submission_id, ))
+        return self.get_submission(submission_id)
+
+    def update_submission(self, submission_id: str, fields: Dict[str, Any]):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._update(conn, submission_id, fields)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _update(self, conn: "sqlite3.Connection", submission_id: str, fields: Dict[str, Any]):
+        columns = {key: value for key, value in fields.items() if key in self.columns}
+        data = {key: value for key, value in fields.items() if key not in self.columns and key != "id"}
+        if data:
+            import json
+
+            row = conn.execute("SELECT data FROM submissions WHERE id = ?", (submission_id, )).fetchone()
+            if row:
+                columns["data"] = json.dumps({**json.loads(row["data"]), **data})
+        if columns:
+            assignments = ", ".join(f"{key} = ?" for key in columns)
+            conn.execute(f"UPDATE submissions SET {assignments} WHERE id = ?", (*columns.values(), submission_id))
+
+    def set_analysis(self, submission_id: str, analysis: SubmissionAnalysis, fields: Dict[str, Any] = None):
+        import json
+
+        data = json.dumps(analysis)
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("INSERT OR REPLACE INTO analyses (id, data) VALUES (?, ?)", (submission_id, data))
+            self._update(conn, submission_id, {**(fields or {}), "analysis_etag": analysis.get("etag")})
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def ignore_submissions(self, submission_ids: List[str]):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("UPDATE submissions SET ignore = 1 WHERE id = ?",
+                             ((submission_id, ) for submission_id in submission_ids))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def get_active_submissions(self) -> List[SubmissionDocument]:
+        documents = []
+        for row in self._connection().execute("SELECT id, crypto_comments_id FROM submissions WHERE ignore = 0"):
+            doc = SubmissionDocument(id=row["id"], ignore=False)
+            if row["crypto_comments_id"] is not None:
+                doc["crypto_comments_id"] = row["crypto_comments_id"]
+            documents.append(doc)
+        return documents
+
+    def clear(self):
+        conn = self._connection()
+        conn.execute("DELETE FROM submissions")
+        conn.execute("DELETE FROM analyses")
+
+    def __len__(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM submissions").fetchone()[0]
+
+
+def migrate_tinydb(tinydb_path: str, store: SubmissionStore) -> int:
+    """
+    Copy all submissions from a TinyDB file into `store`, returns the number of submissions copied.
+    """
+    migrated = 0
+    for doc in TinyDBStore(tinydb_path).get_all_submissions():
+        fields = {key: value for key, value in doc.items() if key != "id"}
+        analysis = fields.pop("analysis", None)
+        store.create_submission(doc["id"])
+        if analysis:
+            store.set_analysis(doc["id"], analysis, fields)
+        elif fields:
+            store.update_submission(doc["id"], fields)
+        migrated += 1
+    return migrated
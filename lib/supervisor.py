@@ -0,0 +1,156 @@
+import logging
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+
+class RestartPolicy:
+    """
+    Capped exponential backoff with jitter for restarting a crashed worker.
+
+    The delay doubles with every consecutive failure up to `max_delay`, and is randomized to within
+    `jitter` of its value so workers that failed together don't reconnect together. A worker that ran
+    for `reset_after` seconds before failing starts over at `initial_delay`. Restarts are tracked over
+    `rate_window` seconds; once there are more than `max_restarts` the worker always waits `max_delay`.
+    """
+
+    def __init__(self,
+                 initial_delay: float = 1,
+                 max_delay: float = 5 * 60,
+                 multiplier: float = 2,
+                 jitter: float = 0.5,
+                 reset_after: float = 10 * 60,
+                 rate_window: float = 60 * 60,
+                 max_restarts: int = 10,
+                 clock: Callable[[], float] = time.monotonic,
+                 random: Callable[[], float] = random.random):
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.jitter = jitter
+        self.reset_after = reset_after
+        self.rate_window = rate_window
+        self.max_restarts = max_restarts
+        self.clock = clock
+        self.random = random
+        self.failures = 0
+        self.started_at = clock()
+        self.restarts: Deque[float] = deque()
+
+    def started(self):
+        self.started_at = self.clock()
+
+    def restart_rate(self) -> int:
+        """
+        Return the number of restarts in the last `rate_window` seconds.
+        """
+        cutoff = self.clock() - self.rate_window
+        while self.restarts and self.restarts[0] < cutoff:
+            self.restarts.popleft()
+        return len(self.restarts)
+
+    @property
+    def exceeded(self) -> bool:
+        return self.restart_rate() > self.max_restarts
+
+    def failed(self) -> float:
+        """
+        Record a failure and return the number of seconds to wait before restarting the worker.
+        """
+        now = self.clock()
+        if now - self.started_at >= self.reset_after:
+            self.failures = 0
+        self.restarts.append(now)
+        delay = self.max_delay if self.exceeded else \
+            min(self.max_delay, self.initial_delay * self.multiplier ** self.failures)
+        self.failures += 1
+        return delay * (1 - self.jitter + self.jitter * self.random())
+
+
+class Supervisor:
+    """
+    Runs long-lived workers such as Reddit streams in daemon threads and restarts them in a loop when they
+    crash or return, waiting as long as their `RestartPolicy` says.
+
+    `stop` stops restarting the workers and joins them. Workers blocked in a request can't be interrupted,
+    so the join is bounded by a timeout and the daemon threads end with the process.
+    """
+
+    def __init__(self,
+                 policy: Callable[[], RestartPolicy] = RestartPolicy,
+                 on_restart: Optional[Callable[[str, float], None]] = None,
+                 logger: logging.Logger = logging.getLogger(__name__)):
+        self.policy = policy
+        self.on_restart = on_restart
+        self.logger = logger
+        self.policies: Dict[str, RestartPolicy] = {}
+        self.stopping = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def supervise(self, name: str, target: Callable[..., Any], *args: Any) -> threading.Thread:
+        policy = self.policies[name] = self.policy()
+        thread = threading.Thread(target=self._run, args=(name, policy, target, args), name=name, daemon=True)
+        self._threads.append(thread)
+        thread.start()
+        return thread
+
+    def _run(self, name: str, policy: RestartPolicy, target: Callable[..., Any], args: tuple):
+        while not self.stopping.is_set():
+            policy.started()
+            try:
+                target(*args)
+                if self.stopping.is_set():
+                    break
+                self.logger.warning(f"Worker {name} returned, restarting it.")
+            except Exception as e:
+                self.logger.exception(e)
+            delay = policy.failed()
+            self._restarting(name, policy, delay)
+            self.stopping.wait(delay)
+
+    def _restarting(self, name: str, policy: RestartPolicy, delay: float):
+        if policy.exceeded:
+            self.logger.error(f"Worker {name} restarted {policy.restart_rate()} times in the last "
+                              f"{policy.rate_window:.0f} seconds, waiting {delay:.0f} seconds.")
+        else:
+            self.logger.info(f"Restarting worker {name} in {delay:.1f} seconds.")
+        if self.on_restart:
+            self.on_restart(name, delay)
+
+    async def supervise_async(self, name: str, target: Callable[[], Awaitable[Any]]):
+        """
+        Run a coroutine function as a supervised worker on the current event loop until `stop` is called.
+        """
+        import asyncio
+
+        policy = self.policies[name] = self.policy()
+        while not self.stopping.is_set():
+            policy.started()
+            try:
+                await target()
+                if self.stopping.is_set():
+                    break
+                self.logger.warning(f"Worker {name} returned, restarting it.")
+            except Exception as e:
+                self.logger.exception(e)
+            delay = policy.failed()
+            self._restarting(name, policy, delay)
+            await asyncio.sleep(delay)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Block until `stop` is called, returns whether it was.
+        """
+        return self.stopping.wait(timeout)
+
+    def stop(self, timeout: float = 10):
+        """
+        Stop restarting workers and wait up to `timeout` seconds in total for the running ones to return.
+        """
+        self.stopping.set()
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            if thread is not threading.current_thread():
+                thread.join(max(0, deadline - time.monotonic()))
@@ -0,0 +1,187 @@
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple, TypedDict
+
+
+class Trend(TypedDict):
+    ticker: str
+    # Mentions in the current window and in the window before it.
+    count: int
+    previous: int
+    change: int
+    # Change in mentions per hour between the two windows.
+    velocity: float
+    rank: int
+    # Places gained since the previous window, `None` if the ticker wasn't mentioned in it.
+    rank_delta: Optional[int]
+
+
+def _get_ranks(counts: Dict[str, int]) -> Dict[str, int]:
+    ranked = sorted(counts.items(), key=lambda x: x[1], reverse=True)
+    return {ticker: rank for rank, (ticker, _) in enumerate(ranked, 1)}
+
+
+class MentionWindow:
+    """
+    Mention counts over the last `window` seconds, kept in a ring buffer of `buckets` time buckets by the comments'
+    `created_utc`, together with the window before it to compare against.
+
+    The totals of both windows are updated as comments are added and buckets roll over, so rankings and trends
+    don't rescan comments. Comments older than both windows are dropped, so memory is bounded by the number of
+    buckets and the tickers mentioned in them however long the stream runs.
+    """
+
+    def __init__(self, window: float = 60 * 60, buckets: int = 12):
+        self.window = window
+        self.buckets = buckets
+        self.bucket_seconds = window / buckets
+        # Buckets of the current and the previous window, indexed by bucket number modulo `2 * buckets`.
+        self._counts: List[Dict[str, int]] = [{} for _ in range(2 * buckets)]
+        self._comments: List[int] = [0] * (2 * buckets)
+        self.current: Dict[str, int] = {}
+        self.previous: Dict[str, int] = {}
+        self.comments = 0
+        # Number of the newest bucket.
+        self.latest: Optional[int] = None
+        self._ranks: Optional[Tuple[Dict[str, int], Dict[str, int]]] = None
+
+    def _bucket(self, timestamp: float) -> int:
+        return int(timestamp // self.bucket_seconds)
+
+    @property
+    def end(self) -> Optional[float]:
+        """
+        End of the current window as a UTC timestamp.
+        """
+        return None if self.latest is None else (self.latest + 1) * self.bucket_seconds
+
+    def advance(self, timestamp: float):
+        """
+        Roll the window forward to `timestamp`, e.g. the current time when no comments arrived for a while.
+        """
+        bucket = self._bucket(timestamp)
+        if self.latest is None:
+            self.latest = bucket
+            return
+        if bucket <= self.latest:
+            return
+        size = 2 * self.buckets
+        if bucket - self.latest >= size:
+            self._counts = [{} for _ in range(size)]
+            self._comments = [0] * size
+            self.current, self.previous, self.comments = {}, {}, 0
+        else:
+            for new in range(self.latest + 1, bucket + 1):
+                # The oldest bucket of the previous window drops out, its slot becomes the new bucket.
+                slot = new % size
+                self._subtract(self.previous, self._counts[slot])
+                self._counts[slot] = {}
+                self._comments[slot] = 0
+                # The oldest bucket of the current window moves to the previous window.
+                moved = (new - self.buckets) % size
+                self._subtract(self.current, self._counts[moved])
+                for ticker, count in self._counts[moved].items():
+                    self.previous[ticker] = self.previous.get(ticker, 0) + count
+                self.comments -= self._comments[moved]
+        self.latest = bucket
+        self._ranks = None
+
+    @staticmethod
+    def _subtract(totals: Dict[str, int], counts: Dict[str, int]):
+        for ticker, count in counts.items():
+            total = totals[ticker] - count
+            if total > 0:
+                totals[ticker] = total
+            else:
+                del totals[ticker]
+
+    def add(self, tickers: Iterable[str], timestamp: float) -> bool:
+        """
+        Count a comment's tickers at its `created_utc`. Returns `False` if the comment is older than both windows.
+        """
+        self.advance(timestamp)
+        bucket = self._bucket(timestamp)
+        if bucket <= self.latest - 2 * self.buckets:
+            return False
+        slot = bucket % (2 * self.buckets)
+        counts = self._counts[slot]
+        totals = self.current if bucket > self.latest - self.buckets else self.previous
+        for ticker in tickers:
+            counts[ticker] = counts.get(ticker, 0) + 1
+            totals[ticker] = totals.get(ticker, 0) + 1
+        self._comments[slot] += 1
+        if totals is self.current:
+            self.comments += 1
+        self._ranks = None
+        return True
+
+    def ranked(self) -> List[Tuple[str, int]]:
+        """
+        Return the tickers of the current window ranked by their number of mentions, like `rank_cryptos`.
+        """
+        return sorted(self.current.items(), key=lambda x: x[1], reverse=True)
+
+    def trends(self) -> List[Trend]:
+        """
+        Return the tickers of the current window ranked by their number of mentions, with their change since the
+        previous window.
+        """
+        if self._ranks is None:
+            self._ranks = (_get_ranks(self.current), _get_ranks(self.previous))
+        ranks, previous_ranks = self._ranks
+        hours = self.window / (60 * 60)
+        trends = []
+        for ticker, rank in sorted(ranks.items(), key=lambda x: x[1]):
+            count, previous = self.current[ticker], self.previous.get(ticker, 0)
+            previous_rank = previous_ranks.get(ticker)
+            trends.append(Trend(ticker=ticker, count=count, previous=previous, change=count - previous,
+                                velocity=(count - previous) / hours, rank=rank,
+                                rank_delta=None if previous_rank is None else previous_rank - rank))
+        return trends
+
+    def rising(self, top: int = 10) -> List[Trend]:
+        """
+        Return the `top` tickers whose mentions grew the fastest since the previous window.
+        """
+        trends = [trend for trend in self.trends() if trend["change"] > 0]
+        return sorted(trends, key=lambda trend: (trend["velocity"], trend["count"]), reverse=True)[:top]
+
+
+class TrendTracker:
+    """
+    A `MentionWindow` across all comments and one per submission. At most `max_submissions` submission windows are
+    kept, dropping the ones that went the longest without new comments. `evicted` counts the dropped windows.
+    """
+
+    def __init__(self, window: float = 60 * 60, buckets: int = 12, max_submissions: int = 1000):
+        self.window = window
+        self.buckets = buckets
+        self.max_submissions = max_submissions
+        self.total = MentionWindow(window, buckets)
+        self.submissions: "OrderedDict[str, MentionWindow]" = OrderedDict()
+        self.evicted = 0
+
+    def add(self, submission_id: str, tickers: Iterable[str], timestamp: float) -> bool:
+        tickers = list(tickers)
+        window = self.submissions.get(submission_id)
+        if window is None:
+            window = self.submissions[submission_id] = MentionWindow(self.window, self.buckets)
+            while len(self.submissions) > self.max_submissions:
+                self.submissions.popitem(last=False)
+                self.evicted += 1
+        else:
+            self.submissions.move_to_end(submission_id)
+        window.add(tickers, timestamp)
+        return self.total.add(tickers, timestamp)
+
+    def advance(self, timestamp: float):
+        """
+        Roll all windows forward to `timestamp` and drop the submissions without mentions in either window.
+        """
+        self.total.advance(timestamp)
+        for submission_id, window in list(self.submissions.items()):
+            window.advance(timestamp)
+            if not window.current and not window.previous:
+                del self.submissions[submission_id]
+
+    def get(self, submission_id: str) -> Optional[MentionWindow]:
+        return self.submissions.get(submission_id)
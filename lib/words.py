@@ -0,0 +1,67 @@
+"""
+Lowercase English word set used to ignore tickers that are common words.
+
+The `english_words` package builds its set from a text file on every import, so the set is precompiled once
+into a pickled `frozenset` next to this module and loaded from there afterwards. The file is rebuilt when the
+installed `english_words` package changes. To precompile it, e.g. while building an image:
+
+    $ python -m lib.words
+"""
+import importlib.util
+import os
+import pickle
+from typing import FrozenSet, Optional, Tuple
+
+words_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "english_words.pickle")
+
+_english_words: Optional[FrozenSet[str]] = None
+
+
+def _get_source() -> Optional[Tuple[str, float]]:
+    """
+    Return the path and modification time of the installed `english_words` package, without importing it.
+    """
+    spec = importlib.util.find_spec("english_words")
+    if spec is None or not spec.origin:
+        return None
+    return spec.origin, os.path.getmtime(spec.origin)
+
+
+def _load(path: str) -> Optional[FrozenSet[str]]:
+    try:
+        with open(path, "rb") as f:
+            cached = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
+    if isinstance(cached, dict) and cached.get("source") == _get_source():
+        return cached["words"]
+    return None
+
+
+def compile_english_words(path: str = words_path) -> FrozenSet[str]:
+    """
+    Build the word set from the `english_words` package and store it at `path`.
+    """
+    from english_words import english_words_lower_set
+
+    words = frozenset(english_words_lower_set)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            pickle.dump({"source": _get_source(), "words": words}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except OSError:
+        # E.g. a read-only installation, the set is built again by the next process.
+        pass
+    return words
+
+
+def get_english_words(path: str = words_path) -> FrozenSet[str]:
+    global _english_words
+    if _english_words is None:
+        _english_words = _load(path) or compile_english_words(path)
+    return _english_words
+
+
+if __name__ == "__main__":
+    print(f"Compiled {len(compile_english_words()):,} English words to {words_path}.")
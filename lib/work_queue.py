@@ -0,0 +1,102 @@
+import threading
+from collections import OrderedDict
+from typing import Generic, Hashable, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+K = TypeVar("K", bound=Hashable)
+
+
+class CoalescingQueue(Generic[K, T]):
+    """
+    FIFO work queue keyed by e.g. submission ID, where a newer item for a key replaces the pending one.
+    A replaced item keeps its place in the queue, so frequently updated keys can't starve the others.
+    """
+
+    def __init__(self):
+        self._items: "OrderedDict[K, T]" = OrderedDict()
+        self._condition = threading.Condition()
+        self._unfinished = 0
+        self.coalesced = 0
+
+    def put(self, key: K, item: T, replace: bool = True) -> bool:
+        """
+        Queue `item` under `key`. Returns `True` if a pending item for the key was replaced, or kept in place of
+        `item` if `replace` is `False`.
+        """
+        with self._condition:
+            if key in self._items:
+                self.coalesced += 1
+                if replace:
+                    self._items[key] = item
+                return True
+            self._items[key] = item
+            self._unfinished += 1
+            self._condition.notify()
+            return False
+
+    def get(self, timeout: Optional[float] = None) -> Tuple[K, T]:
+        """
+        Remove and return the oldest pending key and its newest item, waiting until one is available.
+        Raises `TimeoutError` if `timeout` seconds pass first.
+        """
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._items, timeout):
+                raise TimeoutError
+            return self._items.popitem(last=False)
+
+    def task_done(self):
+        with self._condition:
+            if self._unfinished <= 0:
+                raise ValueError("task_done() called too many times")
+            self._unfinished -= 1
+            self._condition.notify_all()
+
+    def join(self):
+        """
+        Wait until every item that was taken from the queue has been marked done with `task_done`.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: not self._unfinished)
+
+    def qsize(self) -> int:
+        with self._condition:
+            return len(self._items)
+
+    def __contains__(self, key: K) -> bool:
+        with self._condition:
+            return key in self._items
+
+
+class AsyncCoalescingQueue(Generic[K, T]):
+    """
+    `CoalescingQueue` for a single asyncio event loop, `get` waits without blocking the loop.
+    """
+
+    def __init__(self):
+        import asyncio
+
+        self._items: "OrderedDict[K, T]" = OrderedDict()
+        self._available = asyncio.Event()
+        self.coalesced = 0
+
+    def put(self, key: K, item: T, replace: bool = True) -> bool:
+        if key in self._items:
+            self.coalesced += 1
+            if replace:
+                self._items[key] = item
+            return True
+        self._items[key] = item
+        self._available.set()
+        return False
+
+    async def get(self) -> Tuple[K, T]:
+        while not self._items:
+            self._available.clear()
+            await self._available.wait()
+        return self._items.popitem(last=False)
+
+    def qsize(self) -> int:
+        return len(self._items)
+
+    def __contains__(self, key: K) -> bool:
+        return key in self._items
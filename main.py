@@ -1,34 +1,120 @@
 import argparse
-
-import praw
-from praw.reddit import Submission
+import json
+import sys
+from datetime import datetime
+from typing import TYPE_CHECKING
 
 from lib import *
+from lib.dumps import analyze_dump, analyze_dump_by_submission, analyze_dump_trends
 from lib.formatting import *
+from lib.reddit_comments_crypto_counter import analyze_comments_window
+from lib.trends import MentionWindow
 
+if TYPE_CHECKING:
+    import praw
+    from praw.reddit import Submission
 
-def main(reddit: praw.Reddit, url: str, top: int = 100, markdown: bool = False):
-    cg_coins_market = get_cg_coins_markets()
-    submission: Submission = reddit.submission(url=url)
-    ranked, comments_analyzed = analyze_comments(submission, cg_coins_market)
+
+def print_ranking(ranked: List[Tuple[str, int]], coin_index: CoinIndex, top: int = 100, output_format: str = "text"):
     if ranked:
-        if markdown:
-            print(get_markdown_table(ranked, cg_coins_market, top))
-        else:
-            for rank, (ticker, count) in enumerate(ranked):
-                if rank > top - 1:
-                    break
-                coin: CoinMarket = get_most_popular_coin_with_ticker(ticker, cg_coins_market)
-                if not coin:
-                    print("No coin found for ticker:", ticker)
-                else:
-                    print(f"{rank + 1}. {coin['name']} ({ticker.upper()}) - {count} (Market Cap: ${coin['market_cap']:,})")
-                    print()
+        snapshot = table_renderer.snapshot(ranked, coin_index, top)
+        for ticker in snapshot.missing:
+            print("No coin found for ticker:", ticker)
+        print(snapshot.render(output_format))
+        if output_format == "text":
+            print()
     else:
         print("No coins found in thread.")
+
+
+def get_ranking_json(ranked: List[Tuple[str, int]], coin_index: CoinIndex, top: int, comments_analyzed: int) -> Dict:
+    return {"comments_analyzed": comments_analyzed, "coins": table_renderer.snapshot(ranked, coin_index, top).coins}
+
+
+def print_trends(mentions: MentionWindow, coin_index: CoinIndex, top: int = 100, output_format: str = "text"):
+    if output_format == "json":
+        print(json.dumps(get_trends_json(mentions, coin_index, top)))
+        return
+    if mentions.current:
+        print(get_trends_table(mentions.trends(), coin_index, top, output_format))
+        if output_format == "text":
+            print()
+    else:
+        print("No coins found in window.")
+    end = datetime.utcfromtimestamp(mentions.end).strftime("%m/%d/%Y, %H:%M:%S") if mentions.end else "-"
+    print(f"{mentions.comments:,} comments analyzed in the {mentions.window / 60:.0f} minutes until {end} UTC.")
+
+
+def get_trends_json(mentions: MentionWindow, coin_index: CoinIndex, top: int) -> Dict:
+    return {"comments_analyzed": mentions.comments, "window": mentions.window, "end": mentions.end,
+            "coins": get_trending_coins(mentions.trends(), coin_index, top)}
+
+
+def get_coin_index_from_cache(cache: Optional[CoinGeckoCache] = None) -> CoinIndex:
+    return cache.get_coin_index() if cache else CoinIndex(get_cg_coins_markets())
+
+
+def main(reddit: "praw.Reddit", url: str, top: int = 100, output_format: str = "text",
+         cache: Optional[CoinGeckoCache] = None, fetch_workers: int = 1, ignore_english_words: bool = True,
+         processes: int = 1, window: Optional[float] = None):
+    coin_index = get_coin_index_from_cache(cache)
+    submission: Submission = reddit.submission(url=url)
+    if window:
+        mentions = analyze_comments_window(submission, coin_index, window=window, workers=fetch_workers,
+                                           ignore_english_words=ignore_english_words, processes=processes)
+        print_trends(mentions, coin_index, top, output_format)
+        return
+    ranked, comments_analyzed = analyze_comments(submission, coin_index, workers=fetch_workers,
+                                                 ignore_english_words=ignore_english_words, processes=processes)
+    if output_format == "json":
+        print(json.dumps(get_ranking_json(ranked, coin_index, top, comments_analyzed)))
+        return
+    print_ranking(ranked, coin_index, top, output_format)
     print(f"{comments_analyzed:,} comments analyzed.")
 
 
+def main_dump(path: str, top: int = 100, output_format: str = "text", cache: Optional[CoinGeckoCache] = None,
+              group_by_submission: bool = False, ignore_english_words: bool = True, processes: int = 1,
+              window: Optional[float] = None, max_submissions: int = 1000):
+    coin_index = get_coin_index_from_cache(cache)
+    if window:
+        tracker = analyze_dump_trends(path, coin_index, window=window, ignore_english_words=ignore_english_words,
+                                      processes=processes, max_submissions=max_submissions)
+        if group_by_submission and tracker.evicted:
+            print(f"Dropped the windows of {tracker.evicted:,} submissions beyond --max-submissions "
+                  f"{max_submissions:,}, their counts per submission may be incomplete.", file=sys.stderr)
+        if not group_by_submission:
+            print_trends(tracker.total, coin_index, top, output_format)
+        elif output_format == "json":
+            print(json.dumps({link_id: get_trends_json(mentions, coin_index, top)
+                              for link_id, mentions in tracker.submissions.items()}))
+        else:
+            for link_id, mentions in tracker.submissions.items():
+                print(f"Submission {link_id}:")
+                print_trends(mentions, coin_index, top, output_format)
+                print()
+    elif group_by_submission:
+        rankings = analyze_dump_by_submission(path, coin_index, ignore_english_words=ignore_english_words,
+                                              processes=processes)
+        if output_format == "json":
+            print(json.dumps({link_id: get_ranking_json(ranked, coin_index, top, comments_analyzed)
+                              for link_id, (ranked, comments_analyzed) in rankings.items()}))
+            return
+        for link_id, (ranked, comments_analyzed) in rankings.items():
+            print(f"Submission {link_id}:")
+            print_ranking(ranked, coin_index, top, output_format)
+            print(f"{comments_analyzed:,} comments analyzed.")
+            print()
+    else:
+        ranked, comments_analyzed = analyze_dump(path, coin_index, ignore_english_words=ignore_english_words,
+                                                 processes=processes)
+        if output_format == "json":
+            print(json.dumps(get_ranking_json(ranked, coin_index, top, comments_analyzed)))
+            return
+        print_ranking(ranked, coin_index, top, output_format)
+        print(f"{comments_analyzed:,} comments analyzed.")
+
+
 parser = argparse.ArgumentParser(description="Scan Reddit comment trees for crypto coin tickers and names.")
 parser.add_argument("--top", dest="top", type=int, default=100, help="Number of top cryptocurrencies to show.")
 parser.add_argument(
@@ -42,8 +128,39 @@ parser.add_argument("--ignore-english-words", dest="ignore_english_words", actio
 parser.add_argument("--no-ignore-english-words", dest="ignore_english_words", action="store_false")
 parser.add_argument("--markdown", "-md", dest="markdown", action="store_true",
                     default=False, help="Enable markdown output with CoinGecko URL.")
+parser.add_argument("--json", dest="json", action="store_true", default=False,
+                    help="Print the ranking and the number of comments analyzed as JSON.")
+parser.add_argument("--cache", dest="cache", type=str, default="coingecko_cache.pickle",
+                    help="File to cache CoinGecko market data in.")
+parser.add_argument("--no-cache", dest="cache", action="store_const", const=None,
+                    help="Always download CoinGecko market data.")
+parser.add_argument("--cache-ttl", dest="cache_ttl", type=int, default=60,
+                    help="Minutes after which cached CoinGecko data is refreshed in the background.")
+parser.add_argument("--fetch-workers", dest="fetch_workers", type=int, default=1,
+                    help="Number of MoreComments requests to run at once when fetching the comment tree.")
+parser.add_argument("--dump", dest="dump", type=str,
+                    help="Analyze a newline-delimited JSON comment dump (.json, .gz or Pushshift .zst) instead of --url.")
+parser.add_argument("--group-by-submission", dest="group_by_submission", action="store_true", default=False,
+                    help="Rank the comments of a dump per submission (link_id).")
+parser.add_argument("--processes", dest="processes", type=int, default=1,
+                    help="Number of processes to count mentions with.")
+parser.add_argument("--window", dest="window", type=int,
+                    help="Only count the mentions of the last MINUTES minutes before the newest comment, "
+                         "with their change since the MINUTES before.", metavar="MINUTES")
+parser.add_argument("--max-submissions", dest="max_submissions", type=int, default=1000,
+                    help="Number of submissions to keep windows for with --window and --group-by-submission.")
 
 if __name__ == "__main__":
     args = parser.parse_args()
-    reddit = praw.Reddit("CCC", user_agent="Reddit crypto comments ticker counter by Dan6erbond.")
-    main(reddit, args.url, args.top, args.markdown)
+    cache = CoinGeckoCache(args.cache, ttl=args.cache_ttl * 60) if args.cache else None
+    output_format = "json" if args.json else "markdown" if args.markdown else "text"
+    window = args.window * 60 if args.window else None
+    if args.dump:
+        main_dump(args.dump, args.top, output_format, cache, args.group_by_submission, args.ignore_english_words,
+                  args.processes, window, args.max_submissions)
+    else:
+        from praw import Reddit
+
+        reddit = Reddit("CCC", user_agent="Reddit crypto comments ticker counter by Dan6erbond.")
+        main(reddit, args.url, args.top, output_format, cache, args.fetch_workers, args.ignore_english_words,
+             args.processes, window)
@@ -0,0 +1,18 @@
+class FakeClock:
+    """
+    Clock that only moves when `sleep` or `advance` is called, to pass as `clock` and `sleep`.
+    """
+
+    def __init__(self, now: float = 1000):
+        self.now = now
+        self.slept = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+    def sleep(self, seconds: float):
+        self.slept.append(seconds)
+        self.now += seconds
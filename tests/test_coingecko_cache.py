@@ -0,0 +1,125 @@
+import logging
+import threading
+
+from lib.coingecko import CoinGeckoCache
+
+from .clock import FakeClock
+
+
+def make_coins(prefix: str = "coin", count: int = 3):
+    return [{"id": f"{prefix}-{i}", "symbol": f"c{i}", "name": f"Coin {i}", "market_cap": 1000 - i}
+            for i in range(count)]
+
+
+class FakeCoinGeckoAPI:
+    """
+    Answers `get_coins_markets` with pages of `coins`, optionally waiting for `release` or raising `error`.
+    """
+
+    def __init__(self, coins):
+        self.coins = coins
+        self.downloads = 0
+        self.error = None
+        self.release = None
+
+    def get_coins_markets(self, vs_currency, per_page=100, page=1, **kwargs):
+        self.downloads += page == 1
+        if self.release is not None:
+            self.release.wait(5)
+        if self.error is not None:
+            raise self.error
+        return self.coins[(page - 1) * per_page:page * per_page]
+
+
+def make_cache(tmp_path, api, clock, **kwargs):
+    return CoinGeckoCache(str(tmp_path / "cache.pickle"), ttl=60, api=api, clock=clock, **kwargs)
+
+
+def ids(coins):
+    return [coin["id"] for coin in coins]
+
+
+def test_serves_stale_data_while_refreshing(tmp_path):
+    clock = FakeClock()
+    api = FakeCoinGeckoAPI(make_coins("old"))
+    cache = make_cache(tmp_path, api, clock)
+    assert ids(cache.get_coins_markets()) == ids(make_coins("old"))
+
+    clock.advance(61)
+    api.coins = make_coins("new")
+    api.release = threading.Event()
+    # The refresh is blocked, the stale entry is served meanwhile.
+    assert ids(cache.get_coins_markets()) == ids(make_coins("old"))
+    assert cache.is_stale()
+    api.release.set()
+    cache.wait()
+    assert ids(cache.get_coins_markets()) == ids(make_coins("new"))
+    assert not cache.is_stale()
+
+
+def test_keeps_index_when_etag_is_unchanged(tmp_path):
+    clock = FakeClock()
+    api = FakeCoinGeckoAPI(make_coins())
+    cache = make_cache(tmp_path, api, clock)
+    index = cache.get_coin_index()
+
+    cache.refresh()
+    assert cache.get_coin_index() is index
+
+    api.coins = make_coins("new")
+    cache.refresh()
+    new_index = cache.get_coin_index()
+    assert new_index is not index
+    assert new_index.snapshot_id != index.snapshot_id
+
+
+def test_reloads_from_disk(tmp_path):
+    clock = FakeClock()
+    cache = make_cache(tmp_path, FakeCoinGeckoAPI(make_coins()), clock)
+    cache.get_coins_markets()
+
+    api = FakeCoinGeckoAPI([])
+    api.error = RuntimeError("The cache should be read from disk.")
+    reloaded = make_cache(tmp_path, api, clock)
+    assert ids(reloaded.get_coins_markets()) == ids(make_coins())
+    assert reloaded.get_coin_index().get_most_popular_coin("C0")["id"] == "coin-0"
+    assert api.downloads == 0
+
+
+def test_failing_refresh_serves_stale_data_and_backs_off(tmp_path, caplog):
+    clock = FakeClock()
+    api = FakeCoinGeckoAPI(make_coins("old"))
+    cache = make_cache(tmp_path, api, clock, retry_after=30)
+    cache.get_coins_markets()
+    downloads = api.downloads
+
+    clock.advance(61)
+    api.error = RuntimeError("HTTP 429")
+    with caplog.at_level(logging.ERROR, logger="lib.coingecko"):
+        assert ids(cache.get_coins_markets()) == ids(make_coins("old"))
+        cache.wait()
+    assert "Failed to refresh CoinGecko markets" in caplog.text
+    assert api.downloads == downloads + 1
+
+    # No new download until `retry_after` passed.
+    clock.advance(29)
+    assert ids(cache.get_coins_markets()) == ids(make_coins("old"))
+    cache.wait()
+    assert api.downloads == downloads + 1
+
+    clock.advance(1)
+    cache.get_coins_markets()
+    cache.wait()
+    assert api.downloads == downloads + 2
+    # The delay doubles after each failure.
+    clock.advance(59)
+    cache.get_coins_markets()
+    cache.wait()
+    assert api.downloads == downloads + 2
+
+    clock.advance(1)
+    api.error = None
+    api.coins = make_coins("new")
+    cache.get_coins_markets()
+    cache.wait()
+    assert ids(cache.get_coins_markets()) == ids(make_coins("new"))
@@ -0,0 +1,29 @@
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from lib.coingecko import CoinIndex
+from lib.formatting import TableRenderer
+
+
+def make_index(market_cap: int) -> CoinIndex:
+    return CoinIndex([{"id": f"coin-{i}", "symbol": f"c{i}", "name": f"Coin {i}", "market_cap": market_cap + i}
+                      for i in range(50)])
+
+
+def test_snapshots_render_their_own_market_data_across_threads():
+    renderer = TableRenderer(max_rows=20)
+    indexes = [make_index(1000), make_index(2000)]
+    ranked = [(f"c{i}", 50 - i) for i in range(50)]
+    expected = [TableRenderer().render(ranked, coin_index, top=50) for coin_index in indexes]
+
+    def render(n: int) -> bool:
+        return renderer.render(ranked, indexes[n % 2], top=50) == expected[n % 2]
+
+    interval = sys.getswitchinterval()
+    # Switch threads often, so they interleave between resolving a snapshot and caching its rows.
+    sys.setswitchinterval(1e-6)
+    try:
+        with ThreadPoolExecutor(8) as executor:
+            assert all(executor.map(render, range(400)))
+    finally:
+        sys.setswitchinterval(interval)
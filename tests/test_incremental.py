@@ -0,0 +1,103 @@
+import random
+from types import SimpleNamespace
+
+import pytest
+
+from lib import words
+from lib.coingecko import CoinIndex
+from lib.reddit_comments_crypto_counter import count_tickers, get_analysis_etag, update_analysis
+
+coins = [
+    {"id": "bitcoin", "symbol": "btc", "name": "Bitcoin", "market_cap": 900},
+    {"id": "ethereum", "symbol": "eth", "name": "Ethereum", "market_cap": 800},
+    {"id": "dogecoin", "symbol": "doge", "name": "Dogecoin", "market_cap": 700},
+    {"id": "harmony", "symbol": "one", "name": "Harmony", "market_cap": 600},
+    {"id": "gas", "symbol": "gas", "name": "NeoGas", "market_cap": 500},
+]
+vocabulary = ["btc", "BTC", "$eth", "ETH", "doge", "Dogecoin", "one", "ONE", "$one", "gas", "bitcoin", "moon",
+              "the", "to", "hodl"]
+
+
+@pytest.fixture(autouse=True)
+def english_words(monkeypatch):
+    monkeypatch.setattr(words, "_english_words", frozenset({"one", "gas", "the", "to", "moon"}))
+
+
+def make_comment(comment_id: str, body: str, edited=False) -> SimpleNamespace:
+    return SimpleNamespace(id=comment_id, author="author", body=body, edited=edited)
+
+
+def random_body(rng: random.Random) -> str:
+    return " ".join(rng.choice(vocabulary) for _ in range(rng.randint(0, 6)))
+
+
+def rescan(comments, coin_index: CoinIndex, ignore_english_words: bool = True):
+    return count_tickers([comment.body for comment in comments], coin_index, ignore_english_words)[0]
+
+
+def test_incremental_counts_match_rescan():
+    rng = random.Random(5)
+    coin_index = CoinIndex(coins)
+    comments = {}
+    removed = {}
+    analysis = None
+    for step in range(300):
+        action = rng.choice(["new", "new", "edit", "delete", "remove", "readd"])
+        if action == "new" or not comments:
+            comment_id = f"c{step}"
+            comments[comment_id] = make_comment(comment_id, random_body(rng))
+        elif action == "edit":
+            comment = rng.choice(list(comments.values()))
+            comment.body, comment.edited = random_body(rng), float(step)
+        elif action == "delete":
+            rng.choice(list(comments.values())).body = rng.choice(["[deleted]", "[removed]"])
+        elif action == "remove":
+            comment_id = rng.choice(list(comments))
+            removed[comment_id] = comments.pop(comment_id)
+        elif removed:
+            comment_id = rng.choice(list(removed))
+            comments[comment_id] = removed.pop(comment_id)
+
+        current = list(comments.values())
+        rng.shuffle(current)
+        ranked, comments_analyzed, analysis, _ = update_analysis(current, coin_index, analysis=analysis)
+        assert analysis["cryptos"] == rescan(current, coin_index)
+        assert comments_analyzed == len(current)
+        assert sorted(ranked) == sorted(rescan(current, coin_index).items())
+
+
+def test_unchanged_comments_are_not_tokenized_again():
+    coin_index = CoinIndex(coins)
+    comments = [make_comment("a", "btc to the moon"), make_comment("b", "$eth")]
+    _, _, analysis, changed = update_analysis(comments, coin_index)
+    assert changed == 2
+
+    _, _, analysis, changed = update_analysis(comments, coin_index, analysis=analysis)
+    assert changed == 0
+    assert analysis["cryptos"] == {"btc": 1, "eth": 1}
+
+
+def test_other_coins_invalidate_analysis():
+    comments = [make_comment("a", "btc and doge"), make_comment("b", "Dogecoin")]
+    _, _, analysis, _ = update_analysis(comments, CoinIndex(coins))
+    assert analysis["cryptos"] == {"btc": 1, "doge": 2}
+
+    coin_index = CoinIndex([coin for coin in coins if coin["id"] != "dogecoin"])
+    assert analysis["etag"] != get_analysis_etag(coin_index)
+    _, _, analysis, changed = update_analysis(comments, coin_index, analysis=analysis)
+    assert changed == 2
+    assert analysis["cryptos"] == rescan(comments, coin_index) == {"btc": 1}
+    assert analysis["etag"] == get_analysis_etag(coin_index)
+
+
+def test_word_filter_invalidates_analysis():
+    coin_index = CoinIndex(coins)
+    comments = [make_comment("a", "one gas"), make_comment("b", "$one GAS")]
+    _, _, analysis, _ = update_analysis(comments, coin_index, ignore_english_words=False)
+    assert analysis["cryptos"] == {"one": 2, "gas": 2}
+
+    _, _, analysis, changed = update_analysis(comments, coin_index, analysis=analysis, ignore_english_words=True)
+    assert changed == 2
+    assert analysis["cryptos"] == rescan(comments, coin_index) == {"one": 1, "gas": 1}
+    assert analysis["ignore_english_words"]
+    assert analysis["etag"] == get_analysis_etag(coin_index, True)
@@ -0,0 +1,60 @@
+import random
+import re
+import string
+
+import pytest
+
+from lib.matcher import NameMatcher
+
+alphabet = "abc $-é"
+
+
+def random_text(rng: random.Random, length: int) -> str:
+    return "".join(rng.choice(alphabet) for _ in range(length))
+
+
+def random_names(rng: random.Random, count: int) -> dict:
+    """
+    Short names from a small alphabet, so names overlap, are prefixes and suffixes of each other and are shared
+    between symbols.
+    """
+    names = {f"s{i}": random_text(rng, rng.randint(1, 6)) for i in range(count)}
+    names["empty"] = ""
+    return names
+
+
+def find_names(cg_dict: dict, body: str) -> set:
+    # The loop `NameMatcher` replaced in `count_tickers`.
+    return {symbol for symbol, name in cg_dict.items() if name in body.lower()}
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_find_matches_substring_loop(seed):
+    rng = random.Random(seed)
+    cg_dict = random_names(rng, 200)
+    matcher = NameMatcher(cg_dict)
+    for _ in range(200):
+        body = random_text(rng, rng.randint(0, 80))
+        assert matcher.find(body.lower()) == find_names(cg_dict, body)
+
+
+def test_find_matches_substring_loop_on_words():
+    rng = random.Random(0)
+    words = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 8))) for _ in range(300)]
+    cg_dict = {f"s{i}": " ".join(rng.sample(words, rng.randint(1, 2))) for i in range(500)}
+    matcher = NameMatcher(cg_dict)
+    bodies = [" ".join(rng.choice([word, word.upper(), word.title()]) for word in rng.sample(words, 20))
+              for _ in range(300)]
+    assert matcher.find_all([body.lower() for body in bodies]) == [find_names(cg_dict, body) for body in bodies]
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_find_with_word_boundaries(seed):
+    rng = random.Random(seed)
+    cg_dict = {symbol: name for symbol, name in random_names(rng, 100).items() if name.strip()}
+    matcher = NameMatcher(cg_dict, word_boundaries=True)
+    for _ in range(200):
+        body = random_text(rng, rng.randint(0, 80))
+        expected = {symbol for symbol, name in cg_dict.items()
+                    if re.search(rf"(?<![^\W_]){re.escape(name)}(?![^\W_])", body)}
+        assert matcher.find(body) == expected
@@ -0,0 +1,101 @@
+import pytest
+
+from lib.ratelimit import Priority, RateGovernor, TokenBucket, parse_ratelimit_delay
+
+from .clock import FakeClock
+
+
+def make_governor(clock, **kwargs):
+    return RateGovernor(clock=clock, sleep=clock.sleep, **kwargs)
+
+
+def test_token_bucket_refills_at_rate():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2, capacity=4, clock=clock)
+    assert [bucket.take() for _ in range(4)] == [0, 0, 0, 0]
+    assert bucket.take() == pytest.approx(0.5)
+    clock.advance(10)
+    bucket.refill()
+    assert bucket.tokens == 4
+
+
+def test_reads_leave_write_reserve():
+    clock = FakeClock()
+    governor = make_governor(clock, quota=600, window=600, burst=2, write_reserve=1)
+    assert governor.try_acquire() == 0
+    # The last token is reserved for writes.
+    assert governor.try_acquire() == pytest.approx(1)
+    assert governor.try_acquire(Priority.write) == 0
+    assert governor.try_acquire(Priority.write) == pytest.approx(1)
+
+
+def test_priority_context_applies_to_requests():
+    clock = FakeClock()
+    governor = make_governor(clock, burst=1, write_reserve=1)
+    assert governor.try_acquire() > 0
+    with governor.priority(Priority.write):
+        assert governor.current_priority == Priority.write
+        assert governor.try_acquire() == 0
+    assert governor.current_priority == Priority.read
+
+
+def test_reads_wait_while_write_is_waiting():
+    clock = FakeClock()
+    governor = make_governor(clock, burst=10)
+    governor.writes_waiting = 1
+    assert governor.try_acquire() > 0
+    governor.writes_waiting = 0
+    assert governor.try_acquire() == 0
+
+
+def test_update_spreads_remaining_quota_over_window():
+    clock = FakeClock()
+    governor = make_governor(clock, burst=10)
+    governor.update(remaining=100, reset=200)
+    # The 10 tokens in the bucket count against the remaining quota.
+    assert governor.requests.rate == pytest.approx(90 / 200)
+    assert governor.reset_at == clock.now + 200
+
+
+def test_exhausted_quota_waits_until_reset():
+    clock = FakeClock()
+    governor = make_governor(clock, quota=600, window=600, burst=10)
+    governor.update(remaining=0, reset=30)
+    assert governor.acquire() == pytest.approx(30)
+    assert clock.slept == [pytest.approx(30)]
+    # The quota is replenished at the end of the window.
+    assert governor.reset_at is None
+    assert governor.requests.rate == pytest.approx(1)
+    assert governor.requests.tokens == pytest.approx(9)
+
+
+def test_update_from_headers_ignores_missing_and_invalid_headers():
+    clock = FakeClock()
+    governor = make_governor(clock)
+    governor.update_from_headers({"x-ratelimit-remaining": "50"})
+    governor.update_from_headers({"x-ratelimit-remaining": "many", "x-ratelimit-reset": "10"})
+    assert governor.remaining is None
+    governor.update_from_headers({"x-ratelimit-remaining": "50.0", "x-ratelimit-reset": "10"})
+    assert governor.remaining == 50
+
+
+def test_writes_are_spaced_and_paused():
+    clock = FakeClock()
+    governor = make_governor(clock, write_interval=5, write_burst=2)
+    assert governor.acquire_write() == 0
+    assert governor.acquire_write() == 0
+    assert governor.acquire_write() == pytest.approx(5)
+
+    governor.pause_writes(60)
+    assert governor.try_acquire_write() == pytest.approx(60)
+    assert governor.acquire_write() == pytest.approx(60)
+
+
+@pytest.mark.parametrize("message, delay", [
+    ("Take a break for 9 minutes before trying again.", 540),
+    ("Take a break for 30 seconds before trying again.", 30),
+    ("Take a break for 500 milliseconds before trying again.", 0.5),
+    ("Something went wrong.", None),
+])
+def test_parse_ratelimit_delay(message, delay):
+    assert parse_ratelimit_delay(message) == delay
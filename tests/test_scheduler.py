@@ -0,0 +1,173 @@
+from concurrent.futures import Executor, Future
+
+import pytest
+
+from lib.scheduler import SubmissionScheduler
+
+from .clock import FakeClock
+
+
+class ImmediateExecutor(Executor):
+    """
+    Runs submitted jobs right away in the calling thread.
+    """
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+def make_scheduler(job, clock, **kwargs):
+    return SubmissionScheduler(job, clock=clock, executor=ImmediateExecutor(), **kwargs)
+
+
+def test_job_delay_reschedules():
+    clock = FakeClock()
+    runs = []
+    scheduler = make_scheduler(lambda submission_id: runs.append(submission_id) or 300, clock)
+    scheduler.schedule("a")
+    scheduler.schedule("b", 60)
+
+    scheduler.run_pending()
+    assert runs == ["a"]
+    assert scheduler.next_due() == clock.now + 60
+
+    clock.advance(60)
+    scheduler.run_pending()
+    assert runs == ["a", "b"]
+    assert scheduler.next_due() == clock.now + 240
+
+    clock.advance(239)
+    assert scheduler.run_pending() == []
+    clock.advance(1)
+    scheduler.run_pending()
+    assert runs == ["a", "b", "a"]
+    assert len(scheduler) == 2
+
+
+def test_job_returning_none_drops_submission():
+    clock = FakeClock()
+    scheduler = make_scheduler(lambda submission_id: None, clock)
+    scheduler.schedule("a")
+    scheduler.run_pending()
+    assert "a" not in scheduler
+    assert scheduler.next_due() is None
+
+
+def test_failing_job_drops_submission():
+    def job(submission_id):
+        raise RuntimeError(submission_id)
+
+    scheduler = make_scheduler(job, FakeClock())
+    scheduler.schedule("a")
+    futures = scheduler.run_pending()
+    with pytest.raises(RuntimeError):
+        futures[0].result()
+    assert "a" not in scheduler
+
+
+def test_schedule_replaces_due_time():
+    clock = FakeClock()
+    scheduler = make_scheduler(lambda submission_id: None, clock)
+    scheduler.schedule("a", 600)
+    scheduler.schedule("a", 30)
+    assert scheduler.next_due() == clock.now + 30
+    clock.advance(30)
+    assert scheduler.pop_due() == ["a"]
+    assert scheduler.pop_due(clock.now + 600) == []
+
+
+def test_reschedule_while_running_wins_over_job_delay():
+    clock = FakeClock()
+    scheduler = None
+
+    def job(submission_id):
+        # E.g. the submission was summoned again during its pass.
+        scheduler.schedule(submission_id, 5)
+        return 300
+
+    scheduler = make_scheduler(job, clock)
+    scheduler.schedule("a")
+    scheduler.run_pending()
+    assert scheduler.next_due() == clock.now + 5
+
+
+def test_cancel_while_running_drops_submission():
+    scheduler = None
+
+    def job(submission_id):
+        scheduler.cancel(submission_id)
+        return 300
+
+    scheduler = make_scheduler(job, FakeClock())
+    scheduler.schedule("a")
+    scheduler.run_pending()
+    assert "a" not in scheduler
+    assert scheduler.next_due() is None
+
+
+def test_batch_job_handles_submissions():
+    clock = FakeClock()
+    runs = []
+    batches = []
+
+    def batch_job(submission_ids):
+        batches.append(submission_ids)
+        return {"a": 600, "b": None}
+
+    scheduler = make_scheduler(lambda submission_id: runs.append(submission_id) or 300, clock, batch_job=batch_job)
+    for submission_id in "abc":
+        scheduler.schedule(submission_id)
+    scheduler.run_pending()
+    assert batches == [["a", "b", "c"]]
+    assert runs == ["c"]
+    assert "b" not in scheduler
+    clock.advance(300)
+    assert scheduler.pop_due() == ["c"]
+    clock.advance(300)
+    assert scheduler.pop_due() == ["a"]
+
+
+def test_failing_batch_job_runs_jobs():
+    def batch_job(submission_ids):
+        raise RuntimeError
+
+    runs = []
+    scheduler = make_scheduler(lambda submission_id: runs.append(submission_id) or 300, FakeClock(),
+                               batch_job=batch_job)
+    scheduler.schedule("a")
+    scheduler.schedule("b")
+    scheduler.run_pending()
+    assert runs == ["a", "b"]
+    assert len(scheduler) == 2
+
+
+def test_stop_cancels_queued_jobs():
+    from concurrent.futures import ThreadPoolExecutor
+    from threading import Event
+
+    started, release = Event(), Event()
+    runs = []
+
+    def job(submission_id):
+        runs.append(submission_id)
+        started.set()
+        release.wait(5)
+        return 300
+
+    clock = FakeClock()
+    scheduler = SubmissionScheduler(job, clock=clock, executor=ThreadPoolExecutor(max_workers=1))
+    for submission_id in "abc":
+        scheduler.schedule(submission_id)
+    futures = scheduler.run_pending()
+    assert started.wait(5)
+    scheduler.stop(wait=False)
+    release.set()
+    futures[0].result(5)
+    assert runs == ["a"]
+    assert [future.cancelled() for future in futures] == [False, True, True]
+    assert "b" not in scheduler and "c" not in scheduler
@@ -0,0 +1,11 @@
+from lib.trends import TrendTracker
+
+
+def test_tracker_counts_evicted_submissions():
+    tracker = TrendTracker(window=60, buckets=6, max_submissions=2)
+    for timestamp, submission_id in enumerate(["a", "b", "a", "c", "d"]):
+        tracker.add(submission_id, ["BTC"], timestamp)
+
+    assert list(tracker.submissions) == ["c", "d"]
+    assert tracker.evicted == 2
+    assert tracker.total.ranked() == [("BTC", 5)]